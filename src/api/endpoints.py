@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -7,10 +7,17 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import logging
 from .models import APIResponse, ChatRequest
-from typing import Optional
+from typing import Optional, AsyncIterator
+from contextlib import asynccontextmanager
 import os
+import json
 import yaml
+import asyncio
 from src.core.config import load_config
+from src.core.cancellation import CancellationToken, OperationCancelled
+from src.core.session import SessionBusy
+from src.core.admission import Overloaded, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from src.core.tracing import tracer
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -40,6 +47,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _overloaded(e: Overloaded) -> HTTPException:
+    """过载时返回503,并通过Retry-After告知客户端重试时间"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+def _priority(chat_request: ChatRequest) -> int:
+    return PRIORITY_BACKGROUND if chat_request.background else PRIORITY_INTERACTIVE
+
+async def _watch_disconnect(request: Request, token: CancellationToken) -> None:
+    """客户端断开时取消本次请求的轮次"""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("客户端已断开")
+            return
+        await asyncio.sleep(config.api.disconnect_poll_interval)
+
+@asynccontextmanager
+async def _request_token(request: Request) -> AsyncIterator[CancellationToken]:
+    """本次请求的取消令牌: 客户端断开或超过 api.request_timeout 时取消"""
+    token = CancellationToken(timeout=config.api.request_timeout or None)
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    try:
+        yield token
+    finally:
+        watcher.cancel()
+        token.close()
+
 # API密钥认证
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME)
@@ -53,7 +86,7 @@ async def verify_api_key(api_key: str = Depends(api_key_header)) -> bool:
     return True
 
 @app.post("/api/v1/agent", response_model=APIResponse)
-@limiter.limit("10/minute")
+@limiter.limit(config.api.rate_limit)
 async def agent_chat(
     request: Request,
     chat_request: ChatRequest,
@@ -69,15 +102,8 @@ async def agent_chat(
         APIResponse: 标准化的API响应
     """
     try:
-        # test 
-        return APIResponse(
-            status="success",
-            message="处理成功",
-            data= '',
-            user_id=chat_request.user_id
-        )
         # 从应用状态获取agent实例
-        agent = request.app.state.agent
+        agent = getattr(request.app.state, "agent", None)
         if not agent:
             return APIResponse(
                 status="error",
@@ -85,21 +111,180 @@ async def agent_chat(
                 user_id=chat_request.user_id
             )
             
-        # 调用Agent处理消息
-        context = await agent.memory.get_context(chat_request.message)
-        knowledge = await agent.rag.get_knowledge(chat_request.message)
-        response = await agent._process_response(chat_request.message, context, knowledge)
+        # 调用Agent处理消息,客户端断开或超时时中止
+        parts = []
+        async with _request_token(request) as token:
+            async for chunk in agent.respond(chat_request.message, chat_request.user_id,
+                                             priority=_priority(chat_request), cancel_token=token):
+                parts.append(chunk)
         
         return APIResponse(
             status="success",
             message="处理成功",
-            data=response,
+            data="".join(parts),
             user_id=chat_request.user_id
         )
+    except SessionBusy as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Overloaded as e:
+        raise _overloaded(e)
+    except OperationCancelled as e:
+        logging.info(f"请求已取消: {e}")
+        raise HTTPException(status_code=504, detail=f"请求已取消: {e}")
     except Exception as e:
         logging.error(f"处理请求时出错: {str(e)}")
         return APIResponse(
             status="error",
             message=str(e),
             user_id=chat_request.user_id
-        )
\ No newline at end of file
+        )
+
+@app.post("/api/v1/agent/prefetch", response_model=APIResponse)
+async def agent_prefetch(
+    request: Request,
+    chat_request: ChatRequest,
+    authenticated: bool = Depends(verify_api_key)
+):
+    """
+    提交用户正在输入的草稿,后台预取上下文和知识
+    
+    客户端可在用户输入时(建议防抖后)调用,最终请求与草稿接近时复用预取结果。
+    不计入速率限制,系统满载时忽略。
+    """
+    agent = getattr(request.app.state, "agent", None)
+    if not agent:
+        raise HTTPException(status_code=503, detail="Agent未初始化")
+    if not chat_request.user_id:
+        raise HTTPException(status_code=400, detail="预取需要user_id")
+    started = agent.prefetch(chat_request.message, chat_request.user_id)
+    return APIResponse(
+        status="success",
+        message="已开始预取" if started else "未预取",
+        data={"prefetching": started},
+        user_id=chat_request.user_id
+    )
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """格式化一条Server-Sent Events消息"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/v1/agent/stream")
+@limiter.limit(config.api.rate_limit)
+async def agent_chat_stream(
+    request: Request,
+    chat_request: ChatRequest,
+    authenticated: bool = Depends(verify_api_key)
+):
+    """
+    以Server-Sent Events流式返回响应
+    
+    每个响应分片为一条 data 事件 {"seq": 序号, "content": 分片},
+    结束时发送 done 事件,出错时发送 error 事件。客户端断开时中止本轮次
+    """
+    agent = getattr(request.app.state, "agent", None)
+    if not agent:
+        raise HTTPException(status_code=503, detail="Agent未初始化")
+        
+    # 先取第一个分片,准入被拒绝或轮次被取消时仍能返回对应的状态码;
+    # 开始输出之前由本函数检查断开,之后由StreamingResponse在断开时关闭event_stream
+    token = CancellationToken(timeout=config.api.request_timeout or None)
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    chunks = agent.respond(chat_request.message, chat_request.user_id, priority=_priority(chat_request),
+                           cancel_token=token)
+    first = []
+    error: Optional[Exception] = None
+    try:
+        first.append(await chunks.__anext__())
+    except StopAsyncIteration:
+        pass
+    except SessionBusy as e:
+        token.close()
+        raise HTTPException(status_code=429, detail=str(e))
+    except Overloaded as e:
+        token.close()
+        raise _overloaded(e)
+    except OperationCancelled as e:
+        # 输出开始前已断开或超过截止时间: 与非流式接口一致返回504,而不是200中的error事件
+        token.close()
+        logging.info(f"请求已取消: {e}")
+        raise HTTPException(status_code=504, detail=f"请求已取消: {e}")
+    except Exception as e:
+        error = e
+    finally:
+        watcher.cancel()
+        
+    async def event_stream() -> AsyncIterator[str]:
+        seq = 0
+        finished = False
+        try:
+            if error is not None:
+                raise error
+            for chunk in first:
+                yield _sse_event({"seq": seq, "content": chunk})
+                seq += 1
+            async for chunk in chunks:
+                yield _sse_event({"seq": seq, "content": chunk})
+                seq += 1
+            yield _sse_event({"seq": seq, "user_id": chat_request.user_id}, event="done")
+            finished = True
+        except Exception as e:
+            logging.error(f"流式处理请求时出错: {str(e)}")
+            finished = True
+            yield _sse_event({"message": str(e), "user_id": chat_request.user_id}, event="error")
+        finally:
+            # 客户端中途断开: 取消令牌并关闭生成器,停止仍在进行的检索、工具和模型调用
+            if not finished:
+                token.cancel("客户端已断开")
+                await chunks.aclose()
+            token.close()
+            
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/traces")
+async def get_traces(
+    format: str = "json",
+    limit: int = 50,
+    trace_id: Optional[str] = None,
+    authenticated: bool = Depends(verify_api_key)
+):
+    """
+    导出最近采样的trace
+    
+    Args:
+        format: json 或 otlp(OpenTelemetry OTLP/JSON)
+        limit: 最多返回的trace数
+        trace_id: 只返回指定trace
+    """
+    if trace_id:
+        trace = tracer.get_trace(trace_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail="trace不存在")
+        return trace
+    if format == "otlp":
+        return tracer.export_otlp(limit)
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
+    return tracer.export_json(limit)
+
+@app.get("/api/v1/triggers/stats")
+async def get_trigger_stats(
+    request: Request,
+    authenticated: bool = Depends(verify_api_key)
+):
+    """
+    触发器统计: 各触发器的检查次数、命中率、耗时、超时/错误次数和熔断状态,
+    定时触发器的执行情况,以及触发器定义文件的加载状态
+    """
+    agent = getattr(request.app.state, "agent", None)
+    if not agent:
+        raise HTTPException(status_code=503, detail="Agent未初始化")
+    stats = agent.triggers.stats()
+    stats["schedules"] = agent.triggers.scheduler.stats()
+    if agent.triggers.loader is not None:
+        stats["definitions"] = agent.triggers.loader.stats()
+    return stats
\ No newline at end of file
@@ -13,3 +13,4 @@ class ChatRequest(BaseModel):
     message: str
     user_id: Optional[str] = None
     session_id: Optional[str] = None
+    background: bool = False  # 后台请求,过载时优先被拒绝
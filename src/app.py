@@ -2,7 +2,7 @@ import asyncio
 import sys
 import signal
 import os
-from typing import Set
+from typing import Set, Optional
 import platform
 import uvicorn
 from fastapi import FastAPI
@@ -16,7 +16,7 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, ROOT_DIR)
 
 from src.core.agent_core import AgentCore
-from src.core.config import load_config
+from src.core.config import Config, load_config
 from src.memory.memory_manager import MemoryManager
 from src.io.message_bus import MessageBus
 from src.io.web_input import WebInputHandler
@@ -37,9 +37,9 @@ logging.getLogger("uvicorn.access").disabled = True
 class Application:
     """应用程序主类"""
     
-    def __init__(self):
-        # 初始化配置
-        self.config = None
+    def __init__(self, config: Optional[Config] = None):
+        # 初始化配置,未传入时在initialize中从配置文件加载
+        self.config = config
         self.message_bus = None
         self.memory_manager = None
         self.rag_manager = None
@@ -51,7 +51,8 @@ class Application:
         """初始化应用程序"""
         try:
             # 加载配置
-            self.config = load_config()
+            if self.config is None:
+                self.config = load_config()
             if not self.config:
                 raise RuntimeError("无法加载配置")
             # 初始化日志
@@ -91,6 +92,18 @@ class Application:
             self.agent
         ]
         
+    async def start_components(self):
+        """在当前事件循环中启动各组件(进程内运行或压测时使用)"""
+        await self.message_bus.start()
+        await self.web_input.setup()
+        await self.agent.start()
+        
+    async def stop_components(self):
+        """停止各组件"""
+        await self.agent.stop()
+        await self.web_input.cleanup()
+        await self.message_bus.stop()
+        
     async def start(self):
         """启动应用程序"""
         await self.initialize()
@@ -0,0 +1,229 @@
+"""
+准入控制
+
+自适应并发限制器: 并发上限按观测到的流水线延迟以AIMD方式调整
+(延迟正常时加性增加,超过目标延迟或出现过载信号时乘性减少)。
+延迟样本由调用方提供(如首个分片延迟),在取得样本时立即调整上限,
+不包含生成全部响应和客户端读取的时间;
+只有超时和上游的 429/503 视为过载信号,其他错误只归还名额。
+超过上限的请求按优先级短暂排队,排队超时或队列已满时以 Overloaded 拒绝,
+交互流量优先于后台流量。
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("admission", "agent.log")
+
+# 优先级,数值越大越优先
+PRIORITY_BACKGROUND = 0
+PRIORITY_INTERACTIVE = 1
+
+
+# 上游返回这些状态码表示过载
+OVERLOAD_STATUS = {429, 503}
+
+
+class Overloaded(RuntimeError):
+    """系统过载,请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_overload_signal(error: BaseException) -> bool:
+    """错误是否表示下游过载: 超时,或上游返回 429/503(包括以它们为直接原因的错误)"""
+    for e in (error, error.__cause__):
+        if isinstance(e, TimeoutError) or getattr(e, "status", None) in OVERLOAD_STATUS:
+            return True
+    return False
+
+
+class Admission:
+    """一次准入的名额,调用方记录延迟样本,并在退出前记录过载信号"""
+
+    def __init__(self, limiter: Optional["AdaptiveLimiter"] = None) -> None:
+        self.limiter = limiter
+        self.latency: Optional[float] = None  # 延迟样本(秒),None表示本次不参与调整
+        self.overloaded = False
+
+    def observe(self, latency: float) -> None:
+        """记录延迟样本并立即调整上限,只取第一次"""
+        if self.latency is None:
+            self.latency = latency
+            if self.limiter is not None:
+                self.limiter.observe(latency)
+
+
+class AdaptiveLimiter:
+    """AIMD自适应并发限制器
+
+    每个延迟窗口(目标延迟时长)内最多减少一次上限,避免同一批慢请求把上限连续压到最低。
+    非线程安全,应在同一个事件循环中使用。
+    """
+
+    def __init__(self, initial_limit: int = 32, min_limit: int = 1, max_limit: int = 256,
+                 target_latency: float = 5.0, backoff: float = 0.9,
+                 queue_timeout: float = 2.0, max_queue: int = 64):
+        """
+        Args:
+            initial_limit: 初始并发上限
+            min_limit: 并发上限下限
+            max_limit: 并发上限上限
+            target_latency: 目标延迟(秒),超过时减少上限
+            backoff: 乘性减少系数
+            queue_timeout: 最长排队时间(秒)
+            max_queue: 最大排队数
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+        self._avg_latency = target_latency / 2
+        self.admitted = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[Admission]:
+        """获取一个并发名额,退出时归还名额
+
+        延迟样本在 Admission.observe 时即参与调整;退出时出现过载信号
+        (记录的信号,或抛出的异常为 is_overload_signal)则减少上限,其他异常只归还名额
+
+        Raises:
+            Overloaded: 排队超时或队列已满
+        """
+        await self.acquire(priority)
+        admission = Admission(self)
+        try:
+            yield admission
+        except Exception as e:
+            if is_overload_signal(e):
+                admission.overloaded = True
+            raise
+        finally:
+            self.release(None, admission.overloaded)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """获取一个并发名额,须与 release 成对调用"""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            if not self._waiters:
+                # 不允许排队
+                self._reject()
+            # 队列已满: 新请求优先级更高时挤掉队列中优先级最低、最晚到达的请求
+            lowest = min(self._waiters, key=lambda w: (-w[0], -w[1]))
+            if -lowest[0] >= priority:
+                self._reject()
+            self._waiters.remove(lowest)
+            heapq.heapify(self._waiters)
+            if not lowest[2].done():
+                lowest[2].set_exception(self._overloaded())
+                self.shed += 1
+        future = asyncio.get_running_loop().create_future()
+        entry = (-priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(entry)
+            # 超时的同时可能已被分配名额或被挤出队列
+            if future.done() and not future.cancelled():
+                if future.exception() is not None:
+                    raise future.exception()
+                self.admitted += 1
+                return
+            self._reject()
+        except asyncio.CancelledError:
+            self._discard(entry)
+            # 已分配名额但调用方被取消时归还名额
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.inflight -= 1
+                self._wake()
+            raise
+        self.admitted += 1
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """归还名额,有延迟样本或过载信号时先调整上限
+
+        Args:
+            latency: 延迟样本(秒),None表示不提供样本(已通过 observe 提供或本次不参与调整)
+            overloaded: 是否出现过载信号
+        """
+        if latency is not None or overloaded:
+            self.observe(latency, overloaded)
+        self.inflight -= 1
+        self._wake()
+
+    def observe(self, latency: Optional[float], overloaded: bool = False) -> None:
+        """按一个仍持有名额的请求的延迟样本和过载信号调整上限
+
+        Args:
+            latency: 延迟样本(秒),None表示只有过载信号
+            overloaded: 是否出现过载信号
+        """
+        if latency is not None:
+            self._avg_latency = 0.9 * self._avg_latency + 0.1 * latency
+        now = time.monotonic()
+        if overloaded or (latency is not None and latency > self.target_latency):
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                reason = "出现过载信号" if overloaded else f"延迟{latency:.2f}s超过目标"
+                logger.info(f"{reason},并发上限降为{int(self.limit)}")
+        elif latency is not None and self.inflight >= int(self.limit) / 2:
+            # 只有上限真正被用到时才增加,空闲时不会无限增长
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        # 上限可能已增加
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_latency": self._avg_latency,
+        }
+
+    def _wake(self) -> None:
+        """按优先级把名额分配给排队的请求"""
+        while self._waiters and self.inflight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.inflight += 1
+            future.set_result(None)
+
+    def _discard(self, entry: Tuple[int, int, asyncio.Future]) -> None:
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def _overloaded(self) -> Overloaded:
+        # 估算排在前面的请求全部完成所需时间
+        backlog = (len(self._waiters) + 1) / max(int(self.limit), 1)
+        retry_after = max(1.0, round(backlog * self._avg_latency))
+        return Overloaded(f"系统繁忙,请{retry_after:.0f}秒后重试", retry_after)
+
+    def _reject(self) -> None:
+        self.shed += 1
+        raise self._overloaded()
@@ -1,5 +1,8 @@
 import asyncio
-from typing import Dict, Any, Optional
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Set, Tuple, Coroutine, Iterator, AsyncIterator
 from src.io.message_bus import MessageBus
 from src.core.config import Config
 from src.core.logger import LogConfig
@@ -7,20 +10,73 @@ from src.memory.memory_manager import MemoryManager
 from src.data.rag_manager import RAGManager
 from src.tools.base_tool import ToolManager
 from src.triggers.trigger_manager import TriggerManager
+from src.models.llm_client import LLMError, create_llm_client
+from src.core.response_cache import create_response_cache, response_cache_key
+from src.core.session import SessionActor, SessionManager
+from src.core.admission import AdaptiveLimiter, PRIORITY_INTERACTIVE, is_overload_signal
+from src.core.tracing import tracer
+from src.core.cancellation import (
+    CancellationToken, OperationCancelled, cancellable, cancellation_scope, check_cancelled
+)
 
 logger = LogConfig.get_instance().get_logger("agent", "agent.log")
 
+@contextmanager
+def _stage_timer(timings: Dict[str, float], stage: str) -> Iterator[None]:
+    """记录流水线阶段耗时(毫秒),同时作为trace中的一个span"""
+    start = time.perf_counter()
+    try:
+        with tracer.span(f"agent.{stage}"):
+            yield
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
+
+def _to_dict(value: Any) -> Dict:
+    """将检索结果统一为字典"""
+    if isinstance(value, list):
+        return {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        return value
+    return {}
+
 class AgentCore:
     """智能体核心类,负责协调各个子系统"""
     
     def __init__(self, message_bus: MessageBus, config: Config):
         self.message_bus = message_bus
         self.config = config
+        tracer.configure(
+            sample_rate=config.tracing_sample_rate,
+            buffer_size=config.tracing_buffer_size,
+            slow_ms=config.tracing_slow_ms,
+            enabled=config.tracing_enabled
+        )
         self.memory = MemoryManager(config)
         self.rag = RAGManager(config)
-        self.tools = ToolManager()
-        self.triggers = TriggerManager()
+        self.tools = ToolManager(config)
+        self.triggers = TriggerManager(message_bus, config)
+        self.llm = create_llm_client(config)
+        self.response_cache = create_response_cache(config)
+        self.sessions = SessionManager(
+            max_sessions=config.session_max_sessions,
+            idle_timeout=config.session_idle_timeout,
+            max_pending=config.session_max_pending,
+            history_size=config.session_history_size,
+            context_ttl=config.session_context_ttl,
+            reuse_threshold=config.session_reuse_threshold,
+            prefetch_ttl=config.prefetch_ttl,
+            prefetch_threshold=config.prefetch_threshold
+        )
+        self.admission = AdaptiveLimiter(
+            initial_limit=config.admission_initial_limit,
+            min_limit=config.admission_min_limit,
+            max_limit=config.admission_max_limit,
+            target_latency=config.admission_target_latency,
+            queue_timeout=config.admission_queue_timeout,
+            max_queue=config.admission_max_queue
+        )
         self._running = False
+        self._background_tasks: Set[asyncio.Task] = set()
         
     async def start(self):
         """启动智能体"""
@@ -28,6 +84,7 @@ class AgentCore:
         
         # 注册消息处理器
         await self.message_bus.subscribe("user_input", self._handle_input)
+        await self.message_bus.subscribe("user_typing", self._handle_typing)
         await self.message_bus.subscribe("system", self._handle_system)
         
         # 初始化各个子系统
@@ -35,75 +92,383 @@ class AgentCore:
         await self.rag.init()
         await self.tools.init()
         await self.triggers.init()
+        if self.response_cache is not None:
+            await self.response_cache.init()
         
         logger.info("智能体已启动")
         
     async def stop(self):
         """停止智能体"""
         self._running = False
+        await self.sessions.close()
         
+        # 等待后台写入完成;后台任务结束前可能再启动新的后台任务(如轮次结束后写入记忆)
+        while self._background_tasks:
+            pending = list(self._background_tasks)
+            await asyncio.gather(*pending, return_exceptions=True)
+            self._background_tasks.difference_update(pending)
+            
         # 清理各个子系统
         await self.memory.cleanup()
-        await self.rag.cleanup() 
+        await self.rag.cleanup()
         await self.tools.cleanup()
         await self.triggers.cleanup()
+        if self.llm is not None:
+            await self.llm.close()
+        if self.response_cache is not None:
+            logger.info(f"响应缓存统计: {self.response_cache.stats()}")
+            await self.response_cache.close()
         
         logger.info("智能体已停止")
         
     async def _handle_input(self, message: Dict[str, Any]):
-        """处理用户输入，支持多用户user_id"""
+        """处理用户输入，支持多用户user_id
+        
+        轮次在独立的任务中执行,消息总线的分发任务不等待整轮结束:
+        分片消息在生成过程中即可投递,不同用户的轮次并发执行(同一用户的轮次由会话按顺序执行)
+        """
+        if not self._running:
+            return
+        if not message.get("content", "").strip():
+            return
+        # 轮次比分发它的总线span结束得晚,脱离总线span作为本地入口span执行,
+        # 慢轮次检查只对本地最外层的span生效;通过trace上下文仍关联到同一trace
+        link = tracer.inject({})
+        with tracer.detach():
+            self._spawn_background(self._run_turn(message, link))
+        
+    async def _run_turn(self, message: Dict[str, Any], link: Optional[Dict[str, Any]] = None) -> None:
+        """执行一条用户输入的轮次
+        
+        响应分片以 chunk 消息按顺序发布到 agent_output,最后发布一条包含完整响应的 text 消息
+        
+        Args:
+            message: 用户输入消息
+            link: 分发该消息的总线span的trace上下文,轮次作为关联到它的本地入口span执行
+        """
+        with tracer.start_trace("agent.input", link, user_id=message.get("user_id") or ""):
+            timings: Dict[str, float] = {}
+            try:
+                content = message.get("content", "").strip()
+                user_id = message.get("user_id")  # 获取user_id
+                stream_id = str(uuid.uuid4())
+                parts = []
+                async for chunk in self.respond(content, user_id, timings):
+                    # 发送响应分片，带user_id
+                    await self.message_bus.publish("agent_output", {
+                        "type": "chunk",
+                        "content": chunk,
+                        "user_id": user_id,
+                        "stream_id": stream_id,
+                        "seq": len(parts)
+                    })
+                    parts.append(chunk)
+                if not parts:
+                    return
+                # 发送完整响应
+                with _stage_timer(timings, "publish"):
+                    await self.message_bus.publish("agent_output", {
+                        "type": "text",
+                        "content": "".join(parts),
+                        "user_id": user_id,
+                        "stream_id": stream_id,
+                        "done": True
+                    })
+            except Exception as e:
+                logger.error(f"处理输入时出错: {str(e)}", exc_info=True)
+                logger.error(f"输入内容: {message.get('content', '')}")
+                logger.error(f"消息内容: {message}")
+                await self.message_bus.publish("agent_output", {
+                    "type": "error",
+                    "content": f"处理输入时出错: {str(e)}",
+                    "user_id": message.get("user_id")
+                })
+            finally:
+                if timings:
+                    logger.debug("阶段耗时(ms): " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
+                
+    async def _handle_typing(self, message: Dict[str, Any]):
+        """处理用户正在输入的草稿,预取上下文和知识"""
         if not self._running:
             return
-        try:
-            content = message.get("content", "").strip()
-            user_id = message.get("user_id")  # 获取user_id
-            if not content:
+        content = message.get("content", "").strip()
+        user_id = message.get("user_id")
+        if content and user_id:
+            self.prefetch(content, user_id)
+            
+    def prefetch(self, draft: str, user_id: str) -> bool:
+        """针对用户的输入草稿预取上下文记忆和相关知识
+        
+        结果保存在用户会话中,最终输入与草稿足够接近时直接复用。
+        同一用户的新草稿会取消尚未完成的预取;系统满载时不预取。
+        
+        Args:
+            draft: 输入草稿
+            user_id: 用户ID
+            
+        Returns:
+            bool: 是否启动了预取
+        """
+        if not self.config.prefetch_enabled:
+            return False
+        session = self.sessions.get(user_id)
+        if self.admission.inflight >= int(self.admission.limit):
+            session.cancel_prefetch()
+            return False
+        task = session.start_prefetch(draft, self._prefetch(draft, session))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return True
+        
+    async def _prefetch(self, draft: str, session: SessionActor) -> None:
+        # 防抖: 连续输入时上一次预取在这里就被取消,不会访问数据库
+        await asyncio.sleep(self.config.prefetch_debounce)
+        generation = self.rag.query_cache.generation
+        context, knowledge = await asyncio.wait_for(
+            asyncio.gather(self.memory.get_context(draft), self.rag.get_knowledge(draft)),
+            timeout=self.config.retrieval_timeout
+        )
+        session.set_prefetch(draft, context, knowledge, generation)
+        
+    async def respond(self, content: str, user_id: Optional[str] = None,
+                      timings: Optional[Dict[str, float]] = None,
+                      priority: int = PRIORITY_INTERACTIVE,
+                      cancel_token: Optional[CancellationToken] = None) -> AsyncIterator[str]:
+        """执行一轮对话并逐片产出响应
+        
+        流水线阶段: 触发器检查 -> 记忆与知识并发检索 -> 流式生成响应,
+        对话记忆在响应生成完毕后于后台写入。触发器命中时不产出任何内容。
+        带user_id的轮次在该用户的会话中按顺序执行,并复用会话的热状态。
+        整轮对话受准入控制,过载时按优先级排队或直接拒绝;带会话的轮次在会话中轮到时才获取名额,
+        在邮箱中等待的轮次不占用名额。准入在首个分片产出时以其延迟调整并发上限,并按上游过载信号减少上限。
+        取消令牌被取消(如客户端断开)时,检索、工具和模型调用随之中止,不写入记忆和缓存。
+        
+        Args:
+            content: 用户输入
+            user_id: 用户ID
+            timings: 可选,用于收集各阶段耗时(毫秒)
+            priority: 准入优先级,交互流量优先于后台流量
+            cancel_token: 可选,本轮的取消令牌
+            
+        Yields:
+            str: 响应分片
+            
+        Raises:
+            SessionBusy: 该用户待处理的轮次过多
+            Overloaded: 系统过载
+            OperationCancelled: 本轮已被取消
+        """
+        timings = {} if timings is None else timings
+        with tracer.start_trace("agent.turn", user_id=user_id or ""), cancellation_scope(cancel_token):
+            if user_id is None:
+                async for chunk in self._admitted(content, None, timings, priority):
+                    yield chunk
                 return
-            # 检查触发器
+            session = self.sessions.get(user_id)
+            async for chunk in session.stream(lambda: self._admitted(content, session, timings, priority)):
+                yield chunk
+                
+    async def _admitted(self, content: str, session: Optional[SessionActor],
+                        timings: Dict[str, float], priority: int) -> AsyncIterator[str]:
+        """在准入名额内执行一轮对话,带会话时在会话的轮次中调用"""
+        queued_at = time.perf_counter()
+        async with self.admission.admit(priority) as admission:
+            timings["admission"] = (time.perf_counter() - queued_at) * 1000
+            outcome: Dict[str, Any] = {}
+            try:
+                async for chunk in self._respond(content, session, timings, outcome):
+                    # 首个分片产出时即调整上限,样本不含会话排队、完整生成和客户端读取的时间
+                    if "first_chunk" in timings:
+                        admission.observe(timings["first_chunk"] / 1000)
+                    yield chunk
+            finally:
+                if outcome.get("overloaded"):
+                    admission.overloaded = True
+            
+    async def _respond(self, content: str, session: Optional[SessionActor],
+                       timings: Dict[str, float],
+                       outcome: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """执行一轮对话,见 respond
+        
+        outcome 中记录模型调用失败回退(fallback)以及失败是否为上游过载(overloaded)
+        """
+        started = time.perf_counter()
+        # 在排队期间被取消的轮次不再执行
+        check_cancelled()
+        # 检查触发器
+        with _stage_timer(timings, "triggers"):
             if await self.triggers.check(content):
                 return
-            # 获取上下文记忆
-            context = await self.memory.get_context(content)
-            if isinstance(context, list):
-                context_dict = {str(i): v for i, v in enumerate(context)}
-            elif isinstance(context, dict):
-                context_dict = context
-            else:
-                context_dict = {}
-            # 获取相关知识
-            knowledge = await self.rag.get_knowledge(content)
-            if isinstance(knowledge, list):
-                knowledge_dict = {str(i): v for i, v in enumerate(knowledge)}
-            elif isinstance(knowledge, dict):
-                knowledge_dict = knowledge
+        # 并发获取上下文记忆和相关知识
+        with _stage_timer(timings, "retrieval"):
+            context_dict, knowledge_dict = await self._retrieve(content, timings, session)
+        # 检索失败会回退为空结果,取消时不能继续调用模型
+        check_cancelled()
+        history = list(session.history) if session is not None else []
+        # 相同问题且检索结果相同时直接返回缓存的响应
+        cache_key = None
+        if self.response_cache is not None and self._response_cacheable():
+            cache_key = response_cache_key(content, context_dict, knowledge_dict, self._model_settings(), history)
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                timings["first_chunk"] = (time.perf_counter() - started) * 1000
+                yield cached
+                self._finish_turn(content, cached, session)
+                return
+        # 流式生成响应
+        parts = []
+        outcome = {} if outcome is None else outcome
+        with _stage_timer(timings, "response"):
+            async for chunk in self._process_response(content, context_dict, knowledge_dict, outcome, history):
+                if not parts:
+                    timings["first_chunk"] = (time.perf_counter() - started) * 1000
+                parts.append(chunk)
+                yield chunk
+        # 模型失败回退的响应不缓存
+        if cache_key is not None and parts and not outcome.get("fallback"):
+            await self.response_cache.set(cache_key, "".join(parts))
+        self._finish_turn(content, "".join(parts), session)
+        
+    def _finish_turn(self, content: str, response: str, session: Optional[SessionActor]) -> None:
+        """记录到会话,并在后台存储对话记忆,不阻塞当前轮次"""
+        if session is not None:
+            session.record(content, response)
+        self._spawn_background(self.memory.add_interaction(content, response))
+        
+    async def _retrieve(self, query: str, timings: Dict[str, float],
+                        session: Optional[SessionActor] = None) -> Tuple[Dict, Dict]:
+        """在共同截止时间内并发检索记忆和知识
+        
+        与草稿接近的预取结果、会话中未过期的上下文窗口和相似查询的上次检索结果直接复用;
+        超时或失败的一路返回空结果,不影响另一路
+        
+        Returns:
+            Tuple[Dict, Dict]: (上下文记忆, 相关知识)
+        """
+        async def timed(stage: str, coro: Coroutine) -> Any:
+            with _stage_timer(timings, stage):
+                return await coro
+                
+        results: Dict[str, Any] = {}
+        prefetched = None
+        # 知识库有更新时会话中缓存的检索结果不再复用
+        generation = self.rag.query_cache.generation
+        if session is not None:
+            prefetched = await session.wait_prefetch(query, self.config.retrieval_timeout, generation)
+        if prefetched is not None:
+            # 预取结果同时作为会话热状态,供后续轮次复用
+            results["memory"], results["knowledge"] = prefetched
+            session.set_context(results["memory"])
+            session.set_retrieval(query, results["knowledge"], generation)
+            timings["prefetch_hit"] = 1
+        elif session is not None:
+            results["memory"] = session.get_context()
+            results["knowledge"] = session.get_retrieval(query, generation)
+        tasks = {}
+        if results.get("memory") is None:
+            tasks["memory"] = asyncio.create_task(timed("memory", self.memory.get_context(query)))
+        if results.get("knowledge") is None:
+            tasks["knowledge"] = asyncio.create_task(timed("knowledge", self.rag.get_knowledge(query)))
+        if tasks:
+            try:
+                done, pending = await cancellable(
+                    asyncio.wait(tasks.values(), timeout=self.config.retrieval_timeout)
+                )
+            except OperationCancelled:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+            for task in pending:
+                task.cancel()
+                
+        for stage, task in tasks.items():
+            if task in pending:
+                logger.warning(f"{stage} 检索超时({self.config.retrieval_timeout}s),使用空结果")
+                results[stage] = {}
+            elif task.cancelled() or isinstance(task.exception(), OperationCancelled):
+                # 检索任务本身被取消时 task.exception() 会抛出 CancelledError
+                results[stage] = {}
+            elif task.exception() is not None:
+                logger.error(f"{stage} 检索失败: {task.exception()}")
+                results[stage] = {}
             else:
-                knowledge_dict = {}
-            # 处理响应
-            response = await self._process_response(content, context_dict, knowledge_dict)
-            # 发送响应，带user_id
-            await self.message_bus.publish("agent_output", {
-                "type": "text",
-                "content": response,
-                "user_id": user_id
-            })
-            # 存储对话记忆
-            await self.memory.add_interaction(content, response)
-        except Exception as e:
-            logger.error(f"处理输入时出错: {str(e)}", exc_info=True)
-            logger.error(f"输入内容: {message.get('content', '')}")
-            logger.error(f"消息内容: {message}")
-            await self.message_bus.publish("agent_output", {
-                "type": "error",
-                "content": f"处理输入时出错: {str(e)}",
-                "user_id": message.get("user_id")
-            })
+                results[stage] = task.result()
+                # 只缓存成功的检索结果
+                if session is not None and stage == "memory":
+                    session.set_context(results[stage])
+                elif session is not None:
+                    session.set_retrieval(query, results[stage], generation)
+        return _to_dict(results["memory"]), _to_dict(results["knowledge"])
+        
+    def _spawn_background(self, coro: Coroutine) -> asyncio.Task:
+        """启动后台任务并跟踪,停止时等待其完成"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return task
+        
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"后台任务失败: {task.exception()}")
             
     async def _handle_system(self, message: Dict[str, Any]):
         """处理系统消息"""
         if message.get("type") == "shutdown":
             self._running = False
             
-    async def _process_response(self, query: str, context: Dict, knowledge: Dict) -> str:
-        """生成响应"""
-        # TODO: 实现响应生成逻辑
-        return f"收到输入: {query}"
\ No newline at end of file
+    async def _process_response(self, query: str, context: Dict, knowledge: Dict,
+                                outcome: Optional[Dict[str, Any]] = None,
+                                history: Optional[List[Tuple[str, str]]] = None) -> AsyncIterator[str]:
+        """流式生成响应
+        
+        未配置模型或模型在输出前失败时回退为回显,后者在outcome中记录fallback
+        """
+        if self.llm is not None:
+            produced = False
+            try:
+                async for chunk in self.llm.stream(self._build_messages(query, context, knowledge, history)):
+                    produced = True
+                    yield chunk
+                return
+            except LLMError as e:
+                if produced:
+                    raise
+                logger.error(f"模型调用失败,回退为回显: {e}")
+                if outcome is not None:
+                    outcome["fallback"] = True
+                    outcome["overloaded"] = is_overload_signal(e)
+        yield f"收到输入: {query}"
+        
+    def _response_cacheable(self) -> bool:
+        """只缓存确定性生成的响应,采样生成需要显式开启"""
+        return self.llm is None or self.llm.temperature == 0 or self.config.response_cache_sampled
+        
+    def _model_settings(self) -> Dict[str, Any]:
+        """影响响应内容的模型参数,作为响应缓存键的一部分"""
+        if self.llm is None:
+            return {"provider": None}
+        return {
+            "provider": self.llm.provider,
+            "model": self.llm.model,
+            "temperature": self.llm.temperature,
+            "max_tokens": self.llm.max_tokens,
+        }
+        
+    def _build_messages(self, query: str, context: Dict, knowledge: Dict,
+                        history: Optional[List[Tuple[str, str]]] = None) -> List[Dict[str, str]]:
+        """把上下文记忆、相关知识和会话最近对话组装为对话消息"""
+        sections = []
+        if knowledge:
+            docs = [item.get("content", "") if isinstance(item, dict) else str(item) for item in knowledge.values()]
+            sections.append("相关知识:\n" + "\n---\n".join(docs))
+        if context:
+            sections.append("上下文:\n" + "\n".join(f"{k}: {v}" for k, v in context.items()))
+        messages = []
+        if sections:
+            messages.append({"role": "system", "content": "\n\n".join(sections)})
+        for user_input, response in history or []:
+            messages.append({"role": "user", "content": user_input})
+            messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "user", "content": query})
+        return messages
\ No newline at end of file
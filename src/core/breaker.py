@@ -0,0 +1,69 @@
+"""
+熔断器
+
+连续失败达到阈值后熔断一段时间,期间直接拒绝调用;恢复时间过后进入半开状态,
+只放行一次试探调用,成功则恢复,失败则重新熔断。用于隔离反复出错或超时的插件。
+"""
+
+import time
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """连续失败计数的熔断器,非线程安全,应在同一个事件循环中使用"""
+
+    def __init__(self, failure_threshold: int = 3, recovery_time: float = 30.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断,0表示不熔断
+            recovery_time: 熔断后多久允许试探调用(秒)
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.trips = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_time:
+            return HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """是否允许本次调用;半开状态下同一时刻只放行一次试探"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self._state = HALF_OPEN
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._state = CLOSED
+
+    def release_probe(self) -> None:
+        """调用既未成功也未失败就结束(如被取消)时调用,释放半开状态的试探名额"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self._state == HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+            if self._state != OPEN:
+                self.trips += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
@@ -0,0 +1,147 @@
+"""
+取消令牌
+
+一轮对话携带一个 CancellationToken。客户端断开或超过截止时间时令牌被取消,
+各组件在阶段边界调用 check() 尽早退出,正在等待的检索、工具和模型调用由 cancellable()
+立即中止(模型客户端还会关闭底层HTTP连接)。取消以 OperationCancelled 异常的形式
+在执行该轮次的任务中抛出,沿正常的错误路径传播,不会误伤共享的后台任务。
+
+令牌通过contextvars在协程和子任务之间隐式传递,组件不需要增加参数。
+"""
+
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_current: contextvars.ContextVar[Optional["CancellationToken"]] = \
+    contextvars.ContextVar("cancellation_token", default=None)
+
+
+class OperationCancelled(Exception):
+    """操作已被取消令牌取消"""
+
+
+class CancellationToken:
+    """可被取消一次的令牌,应在同一个事件循环中使用"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout: 截止时间(秒),到期自动取消,None表示不限制
+        """
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        if timeout:
+            self._timer = asyncio.get_running_loop().call_later(timeout, self.cancel, f"超过截止时间({timeout}s)")
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = "已取消") -> None:
+        """取消令牌并执行所有回调,重复调用无效"""
+        if self.reason is not None:
+            return
+        self.reason = reason
+        if self._timer is not None:
+            self._timer.cancel()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """轮次结束时调用: 停止截止计时器并释放回调"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._callbacks.clear()
+
+    def add_callback(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """注册取消时的回调,已取消时立即执行
+
+        Returns:
+            Callable[[], None]: 注销该回调的函数
+        """
+        if self.reason is not None:
+            callback()
+            return lambda: None
+        self._callbacks.append(callback)
+
+        def remove() -> None:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+        return remove
+
+    def check(self) -> None:
+        """
+        Raises:
+            OperationCancelled: 令牌已取消
+        """
+        if self.reason is not None:
+            raise OperationCancelled(self.reason)
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """执行awaitable,令牌取消时中止它并抛出 OperationCancelled"""
+        self.check()
+        task = asyncio.ensure_future(awaitable)
+        remove = self.add_callback(task.cancel)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # 只有令牌引起的取消转为异常,外部对当前任务的取消照常传播
+            current = asyncio.current_task()
+            if self.reason is not None and task.cancelled() and not (current and current.cancelling()):
+                raise OperationCancelled(self.reason) from None
+            task.cancel()
+            raise
+        finally:
+            remove()
+
+
+def current_token() -> Optional[CancellationToken]:
+    """当前上下文的取消令牌"""
+    return _current.get()
+
+
+@contextmanager
+def cancellation_scope(token: Optional[CancellationToken]) -> Iterator[Optional[CancellationToken]]:
+    """在该作用域(及其中创建的任务)内使用给定的取消令牌"""
+    if token is None:
+        yield None
+        return
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        try:
+            _current.reset(reset)
+        except ValueError:
+            # 异步生成器在其他上下文中被关闭时无法还原,此时上下文随之丢弃
+            pass
+
+
+def check_cancelled() -> None:
+    """
+    Raises:
+        OperationCancelled: 当前上下文的令牌已取消
+    """
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+async def cancellable(awaitable: Awaitable[T]) -> T:
+    """在当前令牌下执行awaitable,没有令牌时直接等待"""
+    token = _current.get()
+    if token is None:
+        return await awaitable
+    return await token.run(awaitable)
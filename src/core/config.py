@@ -25,6 +25,16 @@ class AIAPIConfig:
     # 代理配置
     http_proxy: str = ""
     https_proxy: str = ""
+    
+    # 本地桩服务(测试用)
+    stub_api_base: str = "http://127.0.0.1:8765"
+    
+    # 连接池与限流配置(每个服务商独立)
+    max_connections: int = 100  # 连接池最大连接数
+    max_concurrency: int = 16  # 最大并发请求数
+    requests_per_second: float = 0  # 每秒请求数上限,0表示不限制
+    max_retries: int = 3  # 失败重试次数
+    request_timeout: float = 60  # 单次请求超时(秒);流式请求为建立连接和两次读取之间的超时
 
 @dataclass
 class APIConfig:
@@ -33,6 +43,8 @@ class APIConfig:
     rate_limit: str = "10/minute"
     allowed_origins: list = field(default_factory=lambda: ["http://localhost:8080"])
     api_key: str = "your-secret-key"
+    request_timeout: float = 30.0  # 单个请求的处理截止时间(秒),超过后取消该轮次,0表示不限制
+    disconnect_poll_interval: float = 0.5  # 检查客户端是否断开的间隔(秒)
 
 @dataclass
 class SystemConfig:
@@ -67,12 +79,26 @@ class Config:
     # RAG系统配置
     vector_store: str = "faiss"  # faiss, milvus, elasticsearch
     vector_dim: int = 768
-    chunk_size: int = 500
-    chunk_overlap: int = 50
+    embedding_backend: str = "random"  # random, hash(确定性的特征哈希,用于测试和压测)
+    chunk_size: int = 500  # 文本块最大token数
+    chunk_overlap: int = 50  # 相邻文本块重叠token数
+    rag_hybrid: bool = True  # 是否启用BM25+向量混合检索
+    rag_candidate_depth: int = 20  # 每路检索的候选数量
+    rag_rrf_k: int = 60  # 倒数排名融合平滑常数
+    rag_cache_size: int = 1024  # 查询缓存条目数,0表示关闭
+    rag_cache_ttl: int = 300  # 查询缓存过期时间(秒)
+    rag_semantic_cache: bool = False  # 是否启用语义缓存
+    rag_semantic_threshold: float = 0.95  # 语义缓存余弦相似度阈值
+    rag_metadata_fields: list = field(default_factory=lambda: ["tenant", "source", "tag"])  # 可过滤的元数据字段
+    rag_index_path: str = "data/rag_index"  # 向量索引和文档的持久化目录
+    ingest_workers: int = 0  # 分块进程数,0表示使用CPU核数
+    embed_batch_size: int = 256  # 批量嵌入大小
+    ingest_checkpoint_interval: int = 300  # 导入检查点间隔(秒)
     
     # AI模型配置
-    model_type: str = "openai"
+    model_type: str = "openai"  # openai, azure, anthropic, stub
     model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0.7
     api_base: str = "https://api.openai.com/v1"
     api_key: str = ""
     
@@ -80,6 +106,62 @@ class Config:
     enable_tools: bool = True
     tool_timeout: int = 30
     max_tool_calls: int = 5
+    tool_max_concurrency: int = 8  # 同时执行的工具调用数
+    tool_cache_size: int = 256  # 幂等工具结果缓存条目数,0表示不缓存
+    tool_cache_ttl: int = 300  # 幂等工具结果缓存时间(秒)
+    tool_http_max_connections: int = 100  # MCP工具共享连接池的总连接数
+    tool_http_limit_per_host: int = 10  # 每个MCP服务的连接数上限,0表示不限制
+    tool_http_dns_cache_ttl: int = 300  # DNS缓存时间(秒),0表示不缓存
+    tool_http_keepalive_timeout: float = 30.0  # 空闲连接保持时间(秒)
+    tool_http_connect_timeout: float = 5.0  # 建立连接超时(秒)
+    tool_definitions: dict = field(default_factory=dict)  # 工具定义: 名称 -> {type: "模块路径:类名", 其余为工具配置}
+    tool_entry_points: bool = True  # 是否发现 synapse.tools 入口点中的工具
+    tool_schema_cache: str = "data/tool_schemas.json"  # 工具描述缓存,空表示不缓存
+    tool_process_workers: int = 2  # 进程模式工具的工作进程数
+    tool_process_memory_mb: int = 1024  # 每个工作进程的内存上限(MB),0表示不限制
+    tool_shm_threshold: int = 65536  # 结果中不小于该字节数的bytes/数组经共享内存传回
+    tool_stream_max_chars: int = 20000  # 流式工具输出保留的最大字符数,0表示不截断
+    tool_stream_tail_chars: int = 4000  # 其中保留的输出结尾字符数
+    tool_stream_max_read: int = 2000000  # 流式工具输出最多读取的字符数,超过后停止读取,0表示不限制
+    
+    # 触发器配置
+    trigger_timeout: float = 1.0  # 单个触发器检查/执行的超时(秒),0表示不限制
+    trigger_max_concurrency: int = 8  # 同时检查的触发器数
+    trigger_failure_threshold: int = 3  # 连续失败或超时多少次后熔断,0表示不熔断
+    trigger_recovery_time: float = 30.0  # 熔断后多久重新试探(秒)
+    trigger_path: str = "config/triggers"  # 触发器定义文件或目录,空表示不从配置加载
+    trigger_reload_interval: float = 2.0  # 检查定义文件变化的间隔(秒),0表示不热重载
+    
+    # 智能体流水线配置
+    retrieval_timeout: float = 3.0  # 记忆和知识检索的共同截止时间(秒)
+    response_cache_size: int = 0  # 响应缓存条目数,0表示关闭
+    response_cache_ttl: int = 600  # 响应缓存过期时间(秒)
+    response_cache_backend: str = ""  # 二级缓存: 空, sqlite, redis
+    response_cache_path: str = "data/response_cache.db"
+    response_cache_redis_url: str = "redis://localhost:6379/0"
+    response_cache_sampled: bool = False  # 温度大于0时也缓存响应,相同问题将总是得到相同的回答
+    session_max_sessions: int = 1024  # 最多保留的用户会话数
+    session_idle_timeout: int = 1800  # 会话空闲超时(秒)
+    session_max_pending: int = 8  # 每个会话最多等待的轮次数
+    session_history_size: int = 10  # 会话保留的最近对话轮数
+    session_context_ttl: int = 60  # 会话上下文窗口缓存时间(秒)
+    session_reuse_threshold: float = 0.8  # 复用上次检索结果所需的查询词重合度
+    prefetch_enabled: bool = True  # 是否根据输入草稿预取上下文和知识
+    prefetch_debounce: float = 0.15  # 预取防抖时间(秒),期间输入变化则取消上一次预取
+    prefetch_ttl: int = 30  # 预取结果有效期(秒)
+    prefetch_threshold: float = 0.6  # 复用预取结果所需的查询词重合度
+    admission_initial_limit: int = 32  # 初始并发轮次上限
+    admission_min_limit: int = 1  # 并发上限下限
+    admission_max_limit: int = 256  # 并发上限上限
+    admission_target_latency: float = 5.0  # 目标首个分片延迟(秒),超过时降低并发上限
+    admission_queue_timeout: float = 2.0  # 超过上限时最长排队时间(秒)
+    admission_max_queue: int = 64  # 最大排队数
+    
+    # 追踪配置
+    tracing_enabled: bool = True
+    tracing_sample_rate: float = 0.1  # 采样率
+    tracing_buffer_size: int = 200  # 内存中保留的trace数
+    tracing_slow_ms: float = 2000  # 慢轮次阈值(毫秒),0表示不记录慢日志
     
     # 输入输出配置
     input_timeout: int = 300
@@ -168,9 +250,22 @@ def load_config(config_dir: Optional[str] = None) -> Config:
             anthropic_api_base=ai_api.get('anthropic_api_base', config.ai_api.anthropic_api_base),
             anthropic_api_key=ai_api.get('anthropic_api_key', config.ai_api.anthropic_api_key),
             http_proxy=ai_api.get('http_proxy', config.ai_api.http_proxy),
-            https_proxy=ai_api.get('https_proxy', config.ai_api.https_proxy)
+            https_proxy=ai_api.get('https_proxy', config.ai_api.https_proxy),
+            stub_api_base=ai_api.get('stub_api_base', config.ai_api.stub_api_base),
+            max_connections=ai_api.get('max_connections', config.ai_api.max_connections),
+            max_concurrency=ai_api.get('max_concurrency', config.ai_api.max_concurrency),
+            requests_per_second=ai_api.get('requests_per_second', config.ai_api.requests_per_second),
+            max_retries=ai_api.get('max_retries', config.ai_api.max_retries),
+            request_timeout=ai_api.get('request_timeout', config.ai_api.request_timeout)
         )
     
+    # AI模型配置
+    if 'model' in config_dict:
+        model = config_dict['model']
+        config.model_type = model.get('type', config.model_type)
+        config.model_name = model.get('name', config.model_name)
+        config.temperature = model.get('temperature', config.temperature)
+        
     # API配置
     if 'api' in config_dict:
         api = config_dict['api']
@@ -178,7 +273,9 @@ def load_config(config_dir: Optional[str] = None) -> Config:
             version=api.get('version', config.api.version),
             rate_limit=api.get('rate_limit', config.api.rate_limit),
             allowed_origins=api.get('allowed_origins', config.api.allowed_origins),
-            api_key=api.get('api_key', config.api.api_key)
+            api_key=api.get('api_key', config.api.api_key),
+            request_timeout=api.get('request_timeout', config.api.request_timeout),
+            disconnect_poll_interval=api.get('disconnect_poll_interval', config.api.disconnect_poll_interval)
         )
         
     # 记忆系统配置
@@ -194,8 +291,21 @@ def load_config(config_dir: Optional[str] = None) -> Config:
         rag = config_dict['rag']
         config.vector_store = rag.get('vector_store', config.vector_store)
         config.vector_dim = rag.get('vector_dim', config.vector_dim)
+        config.embedding_backend = rag.get('embedding_backend', config.embedding_backend)
         config.chunk_size = rag.get('chunk_size', config.chunk_size)
         config.chunk_overlap = rag.get('chunk_overlap', config.chunk_overlap)
+        config.rag_hybrid = rag.get('hybrid', config.rag_hybrid)
+        config.rag_candidate_depth = rag.get('candidate_depth', config.rag_candidate_depth)
+        config.rag_rrf_k = rag.get('rrf_k', config.rag_rrf_k)
+        config.rag_cache_size = rag.get('cache_size', config.rag_cache_size)
+        config.rag_cache_ttl = rag.get('cache_ttl', config.rag_cache_ttl)
+        config.rag_semantic_cache = rag.get('semantic_cache', config.rag_semantic_cache)
+        config.rag_semantic_threshold = rag.get('semantic_threshold', config.rag_semantic_threshold)
+        config.rag_metadata_fields = rag.get('metadata_fields', config.rag_metadata_fields)
+        config.rag_index_path = rag.get('index_path', config.rag_index_path)
+        config.ingest_workers = rag.get('ingest_workers', config.ingest_workers)
+        config.embed_batch_size = rag.get('embed_batch_size', config.embed_batch_size)
+        config.ingest_checkpoint_interval = rag.get('checkpoint_interval', config.ingest_checkpoint_interval)
         
     # 工具系统配置
     if 'tools' in config_dict:
@@ -204,6 +314,75 @@ def load_config(config_dir: Optional[str] = None) -> Config:
             config.enable_tools = tools.get('enable', config.enable_tools)
             config.tool_timeout = tools.get('timeout', config.tool_timeout)
             config.max_tool_calls = tools.get('max_calls', config.max_tool_calls)
+            config.tool_max_concurrency = tools.get('max_concurrency', config.tool_max_concurrency)
+            config.tool_cache_size = tools.get('cache_size', config.tool_cache_size)
+            config.tool_cache_ttl = tools.get('cache_ttl', config.tool_cache_ttl)
+            http = tools.get('http', {}) or {}
+            config.tool_http_max_connections = http.get('max_connections', config.tool_http_max_connections)
+            config.tool_http_limit_per_host = http.get('limit_per_host', config.tool_http_limit_per_host)
+            config.tool_http_dns_cache_ttl = http.get('dns_cache_ttl', config.tool_http_dns_cache_ttl)
+            config.tool_http_keepalive_timeout = http.get('keepalive_timeout', config.tool_http_keepalive_timeout)
+            config.tool_http_connect_timeout = http.get('connect_timeout', config.tool_http_connect_timeout)
+            config.tool_definitions = tools.get('definitions', config.tool_definitions) or {}
+            config.tool_entry_points = tools.get('entry_points', config.tool_entry_points)
+            config.tool_schema_cache = tools.get('schema_cache', config.tool_schema_cache)
+            process = tools.get('process', {}) or {}
+            config.tool_process_workers = process.get('workers', config.tool_process_workers)
+            config.tool_process_memory_mb = process.get('memory_mb', config.tool_process_memory_mb)
+            config.tool_shm_threshold = process.get('shm_threshold', config.tool_shm_threshold)
+            stream = tools.get('stream', {}) or {}
+            config.tool_stream_max_chars = stream.get('max_chars', config.tool_stream_max_chars)
+            config.tool_stream_tail_chars = stream.get('tail_chars', config.tool_stream_tail_chars)
+            config.tool_stream_max_read = stream.get('max_read', config.tool_stream_max_read)
+        
+    # 触发器配置
+    if 'triggers' in config_dict:
+        triggers = config_dict['triggers']
+        config.trigger_timeout = triggers.get('timeout', config.trigger_timeout)
+        config.trigger_max_concurrency = triggers.get('max_concurrency', config.trigger_max_concurrency)
+        config.trigger_failure_threshold = triggers.get('failure_threshold', config.trigger_failure_threshold)
+        config.trigger_recovery_time = triggers.get('recovery_time', config.trigger_recovery_time)
+        config.trigger_path = triggers.get('path', config.trigger_path)
+        config.trigger_reload_interval = triggers.get('reload_interval', config.trigger_reload_interval)
+        
+    # 智能体流水线配置
+    if 'agent' in config_dict:
+        agent = config_dict['agent']
+        config.retrieval_timeout = agent.get('retrieval_timeout', config.retrieval_timeout)
+        response_cache = agent.get('response_cache', {})
+        config.response_cache_size = response_cache.get('size', config.response_cache_size)
+        config.response_cache_ttl = response_cache.get('ttl', config.response_cache_ttl)
+        config.response_cache_backend = response_cache.get('backend', config.response_cache_backend)
+        config.response_cache_path = response_cache.get('path', config.response_cache_path)
+        config.response_cache_redis_url = response_cache.get('redis_url', config.response_cache_redis_url)
+        config.response_cache_sampled = response_cache.get('sampled', config.response_cache_sampled)
+        session = agent.get('session', {})
+        config.session_max_sessions = session.get('max_sessions', config.session_max_sessions)
+        config.session_idle_timeout = session.get('idle_timeout', config.session_idle_timeout)
+        config.session_max_pending = session.get('max_pending', config.session_max_pending)
+        config.session_history_size = session.get('history_size', config.session_history_size)
+        config.session_context_ttl = session.get('context_ttl', config.session_context_ttl)
+        config.session_reuse_threshold = session.get('reuse_threshold', config.session_reuse_threshold)
+        prefetch = agent.get('prefetch', {})
+        config.prefetch_enabled = prefetch.get('enabled', config.prefetch_enabled)
+        config.prefetch_debounce = prefetch.get('debounce', config.prefetch_debounce)
+        config.prefetch_ttl = prefetch.get('ttl', config.prefetch_ttl)
+        config.prefetch_threshold = prefetch.get('threshold', config.prefetch_threshold)
+        admission = agent.get('admission', {})
+        config.admission_initial_limit = admission.get('initial_limit', config.admission_initial_limit)
+        config.admission_min_limit = admission.get('min_limit', config.admission_min_limit)
+        config.admission_max_limit = admission.get('max_limit', config.admission_max_limit)
+        config.admission_target_latency = admission.get('target_latency', config.admission_target_latency)
+        config.admission_queue_timeout = admission.get('queue_timeout', config.admission_queue_timeout)
+        config.admission_max_queue = admission.get('max_queue', config.admission_max_queue)
+        
+    # 追踪配置
+    if 'tracing' in config_dict:
+        tracing = config_dict['tracing']
+        config.tracing_enabled = tracing.get('enabled', config.tracing_enabled)
+        config.tracing_sample_rate = tracing.get('sample_rate', config.tracing_sample_rate)
+        config.tracing_buffer_size = tracing.get('buffer_size', config.tracing_buffer_size)
+        config.tracing_slow_ms = tracing.get('slow_ms', config.tracing_slow_ms)
         
     # 输入输出配置
     if 'io' in config_dict:
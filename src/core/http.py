@@ -0,0 +1,45 @@
+"""HTTP连接池工具"""
+
+from typing import Optional
+
+import aiohttp
+
+
+def create_session(
+    limit: int = 100,
+    limit_per_host: int = 0,
+    ttl_dns_cache: Optional[int] = 300,
+    keepalive_timeout: float = 30.0,
+    timeout: Optional[float] = None,
+    connect_timeout: Optional[float] = None,
+    headers: Optional[dict] = None,
+) -> aiohttp.ClientSession:
+    """创建带连接池的 aiohttp 会话
+
+    会话应在整个组件生命周期内复用,并在组件清理时关闭,
+    这样请求可以复用已建立的TCP/TLS连接。必须在事件循环中调用。
+
+    Args:
+        limit: 连接池总连接数上限
+        limit_per_host: 每个主机的连接数上限,0表示不限制
+        ttl_dns_cache: DNS缓存时间(秒),None表示不缓存
+        keepalive_timeout: 空闲连接保持时间(秒)
+        timeout: 单个请求总超时(秒),None表示不限制
+        connect_timeout: 建立连接超时(秒)
+        headers: 默认请求头
+
+    Returns:
+        aiohttp.ClientSession: 会话对象
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=ttl_dns_cache is not None,
+        ttl_dns_cache=ttl_dns_cache,
+        keepalive_timeout=keepalive_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout, connect=connect_timeout),
+        headers=headers,
+    )
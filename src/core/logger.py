@@ -13,7 +13,8 @@ class LogConfig:
             raise RuntimeError("LogConfig是单例类,请使用get_instance()获取实例")
             
         # 默认配置
-        self.log_path = "logs"
+        # 可用环境变量 SYNAPSE_LOG_DIR 指定日志目录(压测和测试写入临时目录)
+        self.log_path = os.environ.get("SYNAPSE_LOG_DIR") or "logs"
         self.default_level = logging.INFO
         self.format = "%(asctime)s | %(levelname)s | %(name)s - %(message)s"
         self.date_format = "%Y-%m-%d %H:%M:%S"
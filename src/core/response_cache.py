@@ -0,0 +1,239 @@
+"""
+智能体响应缓存
+
+以 规范化查询 + 上下文记忆ID + 知识ID + 模型参数 + 会话历史 的哈希为键缓存完整响应,
+相同问题在检索结果相同时直接返回缓存,不再调用模型。
+进程内为带TTL的LRU缓存,可选用 SQLite 或 Redis 作为二级缓存在进程间共享。
+
+只有确定性的生成(temperature为0)才缓存,采样生成的回答本应每次不同;
+确实需要时可以用 agent.response_cache.sampled 开启。
+键包含会话中保留的全部最近对话(session_history_size轮),多轮对话中历史几乎不会重复,
+命中主要来自会话的第一轮或历史相同的重复提问。
+"""
+
+import json
+import time
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import aiosqlite
+
+from src.core.cache import LRUCache
+from src.core.logger import LogConfig
+from src.data.query_cache import normalize_query
+
+logger = LogConfig.get_instance().get_logger("response_cache", "agent.log")
+
+
+def _item_id(item: Any) -> str:
+    """检索条目的标识: 优先使用id字段,否则使用内容哈希"""
+    if isinstance(item, dict):
+        if item.get("id") is not None:
+            return str(item["id"])
+        item = item.get("content", item)
+    text = item if isinstance(item, str) else json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def response_cache_key(query: str, context: Dict, knowledge: Dict, model: Dict[str, Any],
+                       history: Sequence[Tuple[str, str]] = ()) -> str:
+    """计算响应缓存键
+
+    Args:
+        query: 用户输入
+        context: 上下文记忆
+        knowledge: 相关知识
+        model: 影响输出的模型参数(服务商、模型名、温度等)
+        history: 会话最近对话,作为多轮对话的上下文;整段历史都参与哈希,
+            历史不同则不会命中
+
+    Returns:
+        str: 十六进制哈希
+    """
+    payload = [
+        normalize_query(query),
+        [_item_id(item) for item in context.values()],
+        [_item_id(item) for item in knowledge.values()],
+        sorted(model.items()),
+        [list(turn) for turn in history],
+    ]
+    raw = json.dumps(payload, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseStore(ABC):
+    """响应缓存的二级存储"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """读取未过期的响应"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        """写入响应"""
+
+    async def init(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteResponseStore(ResponseStore):
+    """基于SQLite的二级存储"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[aiosqlite.Connection] = None
+
+    async def init(self) -> None:
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+        # 清除已过期条目
+        await self._conn.execute(
+            "DELETE FROM response_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        await self._conn.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        if self._conn is None:
+            return None
+        async with self._conn.execute(
+            "SELECT response, expires_at FROM response_cache WHERE key = ?", (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            await self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            await self._conn.commit()
+            return None
+        return row[0]
+
+    async def set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        if self._conn is None:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        await self._conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at)
+        )
+        await self._conn.commit()
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class RedisResponseStore(ResponseStore):
+    """基于Redis的二级存储,过期由Redis负责"""
+
+    PREFIX = "synapse:response:"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    async def init(self) -> None:
+        import redis.asyncio as redis_asyncio
+        self._client = redis_asyncio.from_url(self.url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        if self._client is None:
+            return None
+        return await self._client.get(self.PREFIX + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        if self._client is None:
+            return
+        await self._client.set(self.PREFIX + key, value, ex=int(ttl) if ttl else None)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class ResponseCache:
+    """响应缓存
+
+    先查进程内LRU,未命中再查二级存储;二级存储出错只记录日志,不影响响应。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 600,
+                 store: Optional[ResponseStore] = None):
+        """
+        Args:
+            maxsize: 进程内缓存最大条目数
+            ttl: 过期时间(秒)
+            store: 可选的二级存储
+        """
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.store = store
+        self.store_hits = 0
+        self.store_errors = 0
+
+    async def init(self) -> None:
+        if self.store is not None:
+            await self.store.init()
+
+    async def close(self) -> None:
+        if self.store is not None:
+            await self.store.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self.memory.get(key)
+        if response is not None or self.store is None:
+            return response
+        try:
+            response = await self.store.get(key)
+        except Exception as e:
+            self.store_errors += 1
+            logger.error(f"读取响应缓存失败: {e}")
+            return None
+        if response is not None:
+            self.store_hits += 1
+            self.memory.set(key, response)
+        return response
+
+    async def set(self, key: str, response: str) -> None:
+        self.memory.set(key, response)
+        if self.store is None:
+            return
+        try:
+            await self.store.set(key, response, self.ttl)
+        except Exception as e:
+            self.store_errors += 1
+            logger.error(f"写入响应缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        # 二级存储命中时进程内缓存记为未命中,这里换算为整体命中
+        stats["store_hits"] = self.store_hits
+        stats["store_errors"] = self.store_errors
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + self.store_hits) / total if total else 0.0
+        return stats
+
+
+def create_response_cache(config) -> Optional[ResponseCache]:
+    """按配置创建响应缓存,response_cache_size为0时返回None"""
+    if config.response_cache_size <= 0:
+        return None
+    store: Optional[ResponseStore] = None
+    if config.response_cache_backend == "sqlite":
+        store = SQLiteResponseStore(config.response_cache_path)
+    elif config.response_cache_backend == "redis":
+        store = RedisResponseStore(config.response_cache_redis_url)
+    elif config.response_cache_backend:
+        raise ValueError(f"不支持的响应缓存后端: {config.response_cache_backend}")
+    return ResponseCache(config.response_cache_size, config.response_cache_ttl or None, store)
@@ -0,0 +1,320 @@
+"""
+用户会话
+
+每个用户一个会话actor: 通过邮箱按顺序执行该用户的轮次,避免同一用户的并发消息
+互相竞争上下文读取和对话写入;同时保存热状态(最近对话、上下文窗口、上次检索结果、
+针对输入草稿预取的结果),后续轮次可以直接复用,不必再次查询SQLite和RAG。
+"""
+
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.core.logger import LogConfig
+from src.data.bm25 import tokenize
+from src.data.query_cache import normalize_query
+
+logger = LogConfig.get_instance().get_logger("session", "agent.log")
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class SessionBusy(RuntimeError):
+    """会话中待处理的轮次已达上限"""
+
+
+class _StreamEnd:
+    """流式任务结束标记"""
+
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+class SessionActor:
+    """单个用户的会话actor
+
+    邮箱中的任务严格按提交顺序执行,同一时刻只执行一个。
+    工作协程在邮箱为空时退出,下次提交时再启动,空闲会话不占用任务。
+    """
+
+    def __init__(self, user_id: str, max_pending: int = 8, history_size: int = 10,
+                 context_ttl: float = 60.0, reuse_threshold: float = 0.8,
+                 prefetch_ttl: float = 30.0, prefetch_threshold: float = 0.6, stream_buffer: int = 32):
+        """
+        Args:
+            user_id: 用户ID
+            max_pending: 邮箱中最多等待的轮次数
+            history_size: 保留的最近对话轮数
+            context_ttl: 上下文窗口和上次检索结果的缓存时间(秒)
+            reuse_threshold: 复用上次检索结果所需的查询词重合度(Jaccard)
+            prefetch_ttl: 预取结果的有效期(秒)
+            prefetch_threshold: 复用预取结果所需的查询词重合度(Jaccard)
+            stream_buffer: 流式轮次中等待调用方读取的最大分片数,读取慢时暂停生成
+        """
+        self.user_id = user_id
+        self.context_ttl = context_ttl
+        self.reuse_threshold = reuse_threshold
+        self.prefetch_ttl = prefetch_ttl
+        self.prefetch_threshold = prefetch_threshold
+        self.stream_buffer = stream_buffer
+        self.history: Deque[Tuple[str, str]] = deque(maxlen=history_size)
+        self.last_active = time.monotonic()
+        self._context: Optional[List[Dict]] = None
+        self._context_at = 0.0
+        self._retrieval: Optional[Tuple[frozenset, float, Optional[int], Any]] = None
+        self._prefetched: Optional[Tuple[frozenset, float, Optional[int], Any, Any]] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._prefetch_terms: frozenset = frozenset()
+        self._mailbox: "asyncio.Queue[Tuple[Job, asyncio.Future, contextvars.Context]]" = \
+            asyncio.Queue(maxsize=max_pending)
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self) -> bool:
+        """是否正在处理轮次或预取"""
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            return True
+        return self._worker is not None and not self._worker.done()
+
+    async def submit(self, job: Job) -> Any:
+        """提交一个轮次并等待其结果
+
+        Raises:
+            SessionBusy: 邮箱已满
+        """
+        return await self._enqueue(job)
+
+    async def stream(self, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """在会话中按顺序执行一个流式轮次,边执行边产出结果
+
+        调用方提前停止迭代时,正在执行的轮次会被取消;调用方读取慢时,
+        缓冲的分片达到 stream_buffer 后轮次暂停,直到调用方读取
+        """
+        output: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.stream_buffer))
+
+        async def pump() -> None:
+            try:
+                async for item in factory():
+                    await output.put(item)
+            except Exception as e:
+                await output.put(_StreamEnd(e))
+                return
+            await output.put(_StreamEnd())
+
+        future = self._enqueue(pump)
+        try:
+            while True:
+                item = await output.get()
+                if isinstance(item, _StreamEnd):
+                    if item.error is not None:
+                        raise item.error
+                    return
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def get_context(self) -> Optional[List[Dict]]:
+        """未过期的上下文窗口"""
+        if self._context is not None and time.monotonic() - self._context_at < self.context_ttl:
+            return self._context
+        return None
+
+    def set_context(self, context: List[Dict]) -> None:
+        self._context = context
+        self._context_at = time.monotonic()
+
+    def get_retrieval(self, query: str, generation: Optional[int] = None) -> Any:
+        """查询与上次检索足够相似时返回上次的检索结果
+
+        结果超过 context_ttl 或知识库在检索之后有更新(代数不同)时不再复用
+
+        Args:
+            query: 查询文本
+            generation: 知识库当前的代数(rag.query_cache.generation),None表示不检查
+        """
+        if self._retrieval is None:
+            return None
+        terms, fetched_at, fetched_generation, results = self._retrieval
+        if time.monotonic() - fetched_at >= self.context_ttl or not _same_generation(fetched_generation, generation):
+            self._retrieval = None
+            return None
+        if self._similarity(terms, query) < self.reuse_threshold:
+            return None
+        return results
+
+    def set_retrieval(self, query: str, results: Any, generation: Optional[int] = None) -> None:
+        """保存检索结果,generation为检索开始时知识库的代数"""
+        self._retrieval = (self._terms(query), time.monotonic(), generation, results)
+
+    def start_prefetch(self, draft: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """启动预取任务,同时取消尚未完成的上一次预取(输入变化时只保留最新的草稿)"""
+        self.cancel_prefetch()
+        self._prefetch_terms = self._terms(draft)
+        self._prefetch_task = asyncio.ensure_future(coro)
+        self.last_active = time.monotonic()
+        return self._prefetch_task
+
+    def cancel_prefetch(self) -> None:
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            self._prefetch_task.cancel()
+        self._prefetch_task = None
+
+    def set_prefetch(self, draft: str, context: Any, knowledge: Any, generation: Optional[int] = None) -> None:
+        """保存针对草稿预取的上下文和知识,generation为预取开始时知识库的代数"""
+        self._prefetched = (self._terms(draft), time.monotonic(), generation, context, knowledge)
+
+    async def wait_prefetch(self, query: str, timeout: float,
+                            generation: Optional[int] = None) -> Optional[Tuple[Any, Any]]:
+        """与最终输入接近的预取仍在进行时等待其完成,然后取出预取结果"""
+        task = self._prefetch_task
+        if task is not None and not task.done() \
+                and self._similarity(self._prefetch_terms, query) >= self.prefetch_threshold:
+            await asyncio.wait([task], timeout=timeout)
+        return self.take_prefetch(query, generation)
+
+    def take_prefetch(self, query: str, generation: Optional[int] = None) -> Optional[Tuple[Any, Any]]:
+        """最终输入与草稿足够接近、未过期且知识库没有更新时取出预取结果,取出后即失效
+
+        Args:
+            query: 最终输入
+            generation: 知识库当前的代数,None表示不检查
+
+        Returns:
+            Optional[Tuple[Any, Any]]: (上下文记忆, 相关知识)
+        """
+        if self._prefetched is None:
+            return None
+        terms, fetched_at, fetched_generation, context, knowledge = self._prefetched
+        self._prefetched = None
+        if time.monotonic() - fetched_at > self.prefetch_ttl or not _same_generation(fetched_generation, generation):
+            return None
+        if self._similarity(terms, query) < self.prefetch_threshold:
+            return None
+        return context, knowledge
+
+    def record(self, query: str, response: str) -> None:
+        """记录一轮对话"""
+        self.history.append((query, response))
+
+    async def close(self) -> None:
+        self.cancel_prefetch()
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        while not self._mailbox.empty():
+            _, future, _ = self._mailbox.get_nowait()
+            future.cancel()
+
+    @staticmethod
+    def _terms(query: str) -> frozenset:
+        return frozenset(tokenize(normalize_query(query)))
+
+    def _similarity(self, terms: frozenset, query: str) -> float:
+        """查询词集合的Jaccard相似度"""
+        current = self._terms(query)
+        union = terms | current
+        return len(terms & current) / len(union) if union else 0.0
+
+    def _enqueue(self, job: Job) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            # 记录提交方的上下文(如trace),轮次在该上下文中执行
+            self._mailbox.put_nowait((job, future, contextvars.copy_context()))
+        except asyncio.QueueFull:
+            raise SessionBusy(f"用户 {self.user_id} 的待处理请求过多") from None
+        self.last_active = time.monotonic()
+        if self._worker is None or self._worker.done():
+            self._worker = contextvars.Context().run(asyncio.create_task, self._run())
+        return future
+
+    async def _run(self) -> None:
+        while not self._mailbox.empty():
+            job, future, context = self._mailbox.get_nowait()
+            if future.cancelled():
+                continue
+            task = context.run(asyncio.create_task, job())
+            # 等待方取消时同时取消正在执行的轮次
+            future.add_done_callback(lambda f, t=task: t.cancel() if f.cancelled() else None)
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                future.cancel()
+                raise
+            self.last_active = time.monotonic()
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+
+def _same_generation(fetched: Optional[int], current: Optional[int]) -> bool:
+    """缓存结果的代数与当前代数一致,任一方未知时视为一致"""
+    return fetched is None or current is None or fetched == current
+
+
+class SessionManager:
+    """会话管理器
+
+    按LRU保存会话,超过空闲时间或数量上限时淘汰空闲会话;正在处理轮次的会话不会被淘汰。
+    """
+
+    def __init__(self, max_sessions: int = 1024, idle_timeout: float = 1800.0, **actor_options):
+        """
+        Args:
+            max_sessions: 最多保留的会话数
+            idle_timeout: 会话空闲超时(秒)
+            actor_options: 传给 SessionActor 的参数
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.actor_options = actor_options
+        self._sessions: "OrderedDict[str, SessionActor]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, user_id: str) -> SessionActor:
+        """获取或创建会话"""
+        session = self._sessions.get(user_id)
+        if session is None:
+            self._evict()
+            session = SessionActor(user_id, **self.actor_options)
+            self._sessions[user_id] = session
+        else:
+            self._sessions.move_to_end(user_id)
+        return session
+
+    async def close(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "busy": sum(1 for s in self._sessions.values() if s.busy),
+            "evictions": self.evictions,
+        }
+
+    def _evict(self) -> None:
+        """从最久未使用的会话开始,淘汰空闲超时的会话,并把数量降到上限以下"""
+        now = time.monotonic()
+        for user_id, session in list(self._sessions.items()):
+            expired = now - session.last_active > self.idle_timeout
+            if not expired and len(self._sessions) < self.max_sessions:
+                break
+            if session.busy:
+                continue
+            del self._sessions[user_id]
+            self.evictions += 1
+            logger.debug(f"淘汰会话: {user_id}")
@@ -0,0 +1,259 @@
+"""
+流水线追踪
+
+轻量级的内置追踪: 以上下文管理器记录各阶段的span,通过 Message.metadata 在消息总线上
+传递trace id。采样在根span处决定并随trace传播,未采样的trace只有一次上下文变量读取的开销。
+采样的trace保存在环形缓冲区中,可导出为JSON或OpenTelemetry(OTLP/JSON)格式;
+超过阈值的慢轮次写入慢日志。
+"""
+
+import os
+import time
+import random
+import functools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("trace", "trace.log")
+
+TRACE_KEY = "trace"
+
+
+class Span:
+    """一个追踪阶段"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("synapse_span", default=None)
+
+
+class Tracer:
+    """追踪器
+
+    trace按到达顺序保存在容量固定的缓冲区中,写满后丢弃最早的trace。
+    """
+
+    def __init__(self, sample_rate: float = 0.1, buffer_size: int = 200, slow_ms: float = 2000.0,
+                 enabled: bool = True):
+        self.configure(sample_rate, buffer_size, slow_ms, enabled)
+
+    def configure(self, sample_rate: float = 0.1, buffer_size: int = 200, slow_ms: float = 2000.0,
+                  enabled: bool = True) -> None:
+        """
+        Args:
+            sample_rate: 采样率(0~1)
+            buffer_size: 保存的trace数量
+            slow_ms: 慢轮次阈值(毫秒),入口span超过该耗时时记录慢日志,0表示关闭
+            enabled: 是否启用追踪
+        """
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+
+    @property
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    @contextmanager
+    def start_trace(self, name: str, metadata: Optional[Dict[str, Any]] = None,
+                    **attributes: Any) -> Iterator[Optional[Span]]:
+        """开始一个入口span
+
+        已在trace中时作为当前span的子span;否则延续metadata中上游传来的trace,
+        都没有时开始新trace并决定是否采样。最外层的入口span结束时检查是否为慢轮次。
+        """
+        if not self.enabled:
+            yield None
+            return
+        current = _current.get()
+        parent = (metadata or {}).get(TRACE_KEY)
+        if current is not None:
+            span = Span(name, current.trace_id, current.span_id, current.sampled, attributes)
+        elif parent:
+            span = Span(name, parent["trace_id"], parent.get("span_id"), parent.get("sampled", False), attributes)
+        else:
+            span = Span(name, os.urandom(16).hex(), None, random.random() < self.sample_rate, attributes)
+        with self._activate(span):
+            yield span
+        # 只在本地最外层的span记录慢日志,避免同一轮次重复记录
+        if current is None and self.slow_ms and span.duration_ms >= self.slow_ms:
+            self._log_slow(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """在当前trace中记录一个子span,当前没有采样的trace时不做任何事"""
+        parent = _current.get()
+        if parent is None or not parent.sampled:
+            yield None
+            return
+        span = Span(name, parent.trace_id, parent.span_id, True, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def detach(self) -> Iterator[None]:
+        """暂时脱离当前span
+
+        在其中创建的任务不继承当前span,其中开始的入口span是本地最外层的span,结束时做慢轮次检查。
+        需要关联到原trace时先用 inject 取得trace上下文,再作为 start_trace 的metadata传入。
+        """
+        token = _current.set(None)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def inject(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """把当前trace上下文写入消息元数据"""
+        span = _current.get()
+        if span is not None and TRACE_KEY not in metadata:
+            metadata[TRACE_KEY] = {"trace_id": span.trace_id, "span_id": span.span_id, "sampled": span.sampled}
+        return metadata
+
+    def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        spans = self._traces.get(trace_id)
+        return self._trace_dict(trace_id, spans) if spans is not None else None
+
+    def export_json(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """导出最近的trace,最新的在前"""
+        items = list(self._traces.items())[::-1][:limit]
+        return [self._trace_dict(trace_id, spans) for trace_id, spans in items]
+
+    def export_otlp(self, limit: Optional[int] = None, service_name: str = "synapse") -> Dict[str, Any]:
+        """导出为OTLP/JSON格式,可直接发送到OpenTelemetry Collector的 /v1/traces"""
+        items = list(self._traces.items())[::-1][:limit]
+        spans = []
+        for _, trace_spans in items:
+            for span in trace_spans:
+                spans.append({
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": "synapse.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def clear(self) -> None:
+        self._traces.clear()
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[None]:
+        token = _current.set(span)
+        try:
+            yield
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            try:
+                _current.reset(token)
+            except ValueError:
+                # 异步生成器在其他上下文中被关闭时无法还原,此时上下文随之丢弃
+                pass
+            if span.sampled:
+                self._record(span)
+
+    def _record(self, span: Span) -> None:
+        spans = self._traces.get(span.trace_id)
+        if spans is None:
+            spans = self._traces[span.trace_id] = []
+            while len(self._traces) > self.buffer_size:
+                self._traces.popitem(last=False)
+        spans.append(span)
+
+    def _log_slow(self, span: Span) -> None:
+        spans = [s for s in self._traces.get(span.trace_id, []) if s.start_ns >= span.start_ns]
+        if spans:
+            breakdown = ", ".join(f"{s.name}={s.duration_ms:.1f}" for s in sorted(spans, key=lambda s: s.start_ns))
+        else:
+            breakdown = "未采样"
+        logger.warning(f"慢轮次 {span.name} trace={span.trace_id} 耗时{span.duration_ms:.1f}ms: {breakdown}")
+
+    @staticmethod
+    def _trace_dict(trace_id: str, spans: List[Span]) -> Dict[str, Any]:
+        ordered = sorted(spans, key=lambda s: s.start_ns)
+        start = ordered[0].start_ns
+        end = max(s.end_ns or s.start_ns for s in ordered)
+        return {
+            "trace_id": trace_id,
+            "name": ordered[0].name,
+            "start": start / 1e9,
+            "duration_ms": round((end - start) / 1e6, 3),
+            "spans": [s.to_dict() for s in ordered],
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+tracer = Tracer()
+
+
+def traced(name: str) -> Callable:
+    """把异步函数的执行记录为当前trace中的一个span"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+"""
+BM25 倒排索引
+
+与向量索引使用相同的文档序号,用于检索标识符、错误码、名称等精确词项,
+并提供倒数排名融合(RRF)用于合并多路检索结果。
+"""
+
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    import jieba
+except ImportError:  # pragma: no cover - jieba 为可选依赖
+    jieba = None
+
+# 英文/数字词项,保留 ERR-42、foo.bar、v1.2.3 这类复合标识符
+_LATIN_TERM = r'[a-z0-9_]+(?:[-.:/#][a-z0-9_]+)*'
+_CJK_RUN = r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+'
+_TERM = re.compile(f'({_LATIN_TERM})|({_CJK_RUN})')
+_SUBWORD = re.compile(r'[a-z0-9_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """分词
+
+    英文复合标识符同时输出整体和各组成部分;中文使用jieba搜索引擎模式分词,
+    未安装jieba时退化为单字加二元组。
+    """
+    tokens: List[str] = []
+    for match in _TERM.finditer(text.lower()):
+        latin, cjk = match.group(1), match.group(2)
+        if latin:
+            tokens.append(latin)
+            parts = _SUBWORD.findall(latin)
+            if len(parts) > 1:
+                tokens.extend(parts)
+        elif jieba is not None:
+            tokens.extend(t for t in jieba.cut_for_search(cjk) if t.strip())
+        else:
+            tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+class BM25Index:
+    """BM25倒排索引
+
+    文档序号必须从0开始连续递增,与向量索引中的行号一致。
+    add 与 search 可以在不同线程中并发调用。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}  # 词项 -> {文档序号: 词频}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, text: str) -> int:
+        """添加文档,返回文档序号"""
+        return self.add_many([text])[0]
+
+    def add_many(self, texts: Iterable[str]) -> List[int]:
+        """批量添加文档,返回文档序号"""
+        tokenized = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            ids = []
+            for counts in tokenized:
+                doc_id = len(self.doc_lengths)
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self.doc_lengths.append(length)
+                self.total_length += length
+                ids.append(doc_id)
+            return ids
+
+    def clear(self) -> None:
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+
+    def search(self, query: str, top_k: int,
+               allowed: Optional[Union[AbstractSet[int], np.ndarray]] = None) -> List[Tuple[int, float]]:
+        """检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回的文档数量
+            allowed: 可选的候选文档序号,只在其中检索;可以是集合或升序排列的数组(元数据过滤的结果),
+                数组不转换为集合,按倒排表和候选中较短的一方求交集
+
+        Returns:
+            List[Tuple[int, float]]: 按得分降序排列的(文档序号, 得分)
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n = len(self.doc_lengths)
+            if n == 0:
+                return []
+            avgdl = self.total_length / n or 1.0
+            scores: Dict[int, float] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in _restrict(posting, allowed):
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def _restrict(posting: Dict[int, int],
+              allowed: Optional[Union[AbstractSet[int], np.ndarray]]) -> Iterable[Tuple[int, int]]:
+    """倒排表中属于候选文档的 (文档序号, 词频)"""
+    if allowed is None:
+        return posting.items()
+    if not isinstance(allowed, np.ndarray):
+        return ((doc_id, tf) for doc_id, tf in posting.items() if doc_id in allowed)
+    if allowed.size <= len(posting):
+        return ((doc_id, posting[doc_id]) for doc_id in allowed.tolist() if doc_id in posting)
+    # 倒排表较短时在有序数组中二分查找
+    ids = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+    positions = np.minimum(np.searchsorted(allowed, ids), allowed.size - 1)
+    return ((doc_id, posting[doc_id]) for doc_id in ids[allowed[positions] == ids].tolist())
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """倒数排名融合
+
+    Args:
+        rankings: 多路检索结果,每路为按相关度降序排列的文档序号
+        k: 平滑常数,越大则各路排名差异的影响越小
+
+    Returns:
+        List[Tuple[int, float]]: 按融合得分降序排列的(文档序号, 得分)
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
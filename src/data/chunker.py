@@ -0,0 +1,137 @@
+"""
+文本分块模块
+
+单次扫描完成中英文分句,按token数打包文本块,保证每个文本块都包含新内容,
+以生成器方式逐个产出文本块。
+"""
+
+import re
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Optional, Sequence, Tuple
+
+# 句子边界: 中文句末标点(可带后引号/括号),英文句末标点后需跟空白或文本结尾,以及换行
+_SENTENCE_BOUNDARY = re.compile(
+    r'[。！？；…]+[”’」』）)"\']*'
+    r'|[.!?;]+[”’"\')\]]*(?=\s|$)'
+    r'|\n\s*'
+)
+
+# token估算: 每个CJK字符、每个其他符号各计为一个token,英文单词/数字每8个字符计为一个token
+_TOKEN = re.compile(
+    r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]'
+    r'|[A-Za-z0-9_]{1,8}'
+    r'|[^\sA-Za-z0-9_]'
+)
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的token数"""
+    return len(_TOKEN.findall(text))
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """单次扫描切分句子,句末标点和其后的换行保留在句子中"""
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        end = match.end()
+        if end > start:
+            yield text[start:end]
+            start = end
+    if start < len(text):
+        yield text[start:]
+
+
+class TextChunker:
+    """基于句子和token数的文本分块器
+
+    chunk_size 和 chunk_overlap 的单位都是token。相邻文本块之间以完整句子重叠,
+    重叠部分不超过 chunk_overlap;超过 chunk_size 的长句会按token边界硬切分。
+    每个句子只进出窗口各一次,整体为线性时间。
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int = 0,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        """
+        Args:
+            chunk_size: 每个文本块的最大token数
+            chunk_overlap: 相邻文本块的最大重叠token数,会被限制在chunk_size以内
+            token_counter: 自定义token计数函数(如模型分词器),默认使用内置估算
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size必须大于0: {chunk_size}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = max(0, min(chunk_overlap, chunk_size - 1))
+        self.token_counter = token_counter or count_tokens
+
+    def split(self, text: str) -> List[str]:
+        """返回全部文本块"""
+        return list(self.iter_chunks(text))
+
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """逐个产出文本块"""
+        window: Deque[Tuple[str, int]] = deque()
+        window_tokens = 0
+        fresh = 0  # 窗口中尚未输出过的片段数
+
+        for unit, tokens in self._iter_units(text):
+            if window_tokens + tokens > self.chunk_size:
+                if fresh:
+                    chunk = "".join(u for u, _ in window).strip()
+                    if chunk:
+                        yield chunk
+                    fresh = 0
+                # 只保留不超过重叠长度、且能容纳新片段的尾部句子
+                while window and (window_tokens > self.chunk_overlap
+                                  or window_tokens + tokens > self.chunk_size):
+                    window_tokens -= window.popleft()[1]
+            window.append((unit, tokens))
+            window_tokens += tokens
+            fresh += 1
+
+        if fresh:
+            chunk = "".join(u for u, _ in window).strip()
+            if chunk:
+                yield chunk
+
+    def _iter_units(self, text: str) -> Iterator[Tuple[str, int]]:
+        """产出(片段, token数),每个片段不超过chunk_size"""
+        for sentence in iter_sentences(text):
+            tokens = self.token_counter(sentence)
+            if tokens == 0 and not sentence.strip():
+                # 纯空白只用于拼接,不占token
+                yield sentence, 0
+            elif tokens <= self.chunk_size:
+                yield sentence, tokens
+            else:
+                yield from self._hard_split(sentence)
+
+    def _hard_split(self, sentence: str) -> Iterator[Tuple[str, int]]:
+        """切分超长句子,每段按 token_counter 计数不超过 chunk_size
+
+        切分点优先取内置估算的token边界;自定义计数下两个边界之间仍超长时按字符切分,
+        每段至少一个字符以保证推进。假设前缀的token数随长度单调不减,用二分查找确定每段结尾
+        """
+        boundaries = [match.start() for match in _TOKEN.finditer(sentence)] + [len(sentence)]
+        start = 0
+        i = 0
+        while start < len(sentence):
+            while boundaries[i] <= start:
+                i += 1
+            end = self._longest_fit(sentence, start, boundaries[i:])
+            if end is None:
+                # 到下一个边界已超长: 在字符之间查找
+                end = self._longest_fit(sentence, start, range(start + 1, boundaries[i])) or start + 1
+            piece = sentence[start:end]
+            yield piece, self.token_counter(piece)
+            start = end
+
+    def _longest_fit(self, sentence: str, start: int, ends: Sequence[int]) -> Optional[int]:
+        """ends(递增)中使 sentence[start:end] 不超过 chunk_size 的最大 end,没有时返回None"""
+        lo, hi = 0, len(ends)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.token_counter(sentence[start:ends[mid]]) <= self.chunk_size:
+                lo = mid + 1
+            else:
+                hi = mid
+        return ends[lo - 1] if lo else None
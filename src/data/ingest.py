@@ -0,0 +1,283 @@
+"""
+批量文档导入流水线
+
+流式读取目录或JSONL语料,在进程池中并行分块,按大批量获取嵌入向量,
+以单次向量化 add 写入索引,并定期保存检查点以支持断点续传。
+
+检查点记录断点位置及其对应的索引大小(文本块数),并保留上一个断点。
+检查点先于索引写入: 保存中途退出时,续传按已加载索引的大小选择与之一致的断点,
+不会跳过未写入的文档,也不会重复写入已在索引中的文档。
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from functools import partial
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from src.core.logger import LogConfig
+from src.data.loader import DataLoader
+from src.data.rag_manager import RAGManager, split_text
+
+logger = LogConfig.get_instance().get_logger("ingest", "ingest.log")
+
+
+@dataclass
+class IngestStats:
+    """导入统计信息"""
+    documents: int = 0
+    chunks: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter, repr=False)
+
+    def update_elapsed(self) -> None:
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        self.update_elapsed()
+        elapsed = max(self.elapsed, 1e-9)
+        data = asdict(self)
+        data.pop("started_at")
+        data.update({
+            "docs_per_sec": self.documents / elapsed,
+            "chunks_per_sec": self.chunks / elapsed,
+            "mb_per_sec": self.bytes / elapsed / (1024 * 1024),
+        })
+        return data
+
+
+def _chunk_batch(texts: List[str], chunk_size: int, chunk_overlap: int) -> List[List[str]]:
+    """在工作进程中对一批文档分块"""
+    return [split_text(text, chunk_size, chunk_overlap) for text in texts]
+
+
+class IngestPipeline:
+    """批量文档导入流水线
+
+    文档按批次提交到进程池分块,分块结果按提交顺序消费,
+    文本块累积到 embed_batch_size 后批量嵌入并一次性写入索引。
+    检查点记录已完整写入索引的文档数,重新运行时跳过这些文档。
+    """
+
+    def __init__(
+        self,
+        rag: RAGManager,
+        workers: Optional[int] = None,
+        doc_batch_size: int = 64,
+        embed_batch_size: Optional[int] = None,
+        checkpoint_interval: Optional[float] = None,
+        report_interval: float = 10.0,
+    ):
+        """
+        Args:
+            rag: RAG管理器
+            workers: 分块进程数,0或None时使用配置值,配置为0时使用CPU核数
+            doc_batch_size: 每次提交到进程池的文档数
+            embed_batch_size: 每次嵌入的文本块数,默认使用配置值
+            checkpoint_interval: 检查点间隔(秒),默认使用配置值
+            report_interval: 吞吐量日志间隔(秒)
+        """
+        config = rag.config
+        self.rag = rag
+        self.workers = workers or config.ingest_workers or os.cpu_count() or 1
+        self.doc_batch_size = doc_batch_size
+        self.embed_batch_size = embed_batch_size or config.embed_batch_size
+        self.checkpoint_interval = checkpoint_interval if checkpoint_interval is not None \
+            else config.ingest_checkpoint_interval
+        self.report_interval = report_interval
+        self.index_path = config.rag_index_path
+        self.checkpoint_path = os.path.join(self.index_path, "ingest_checkpoint.json")
+
+        self.stats = IngestStats()
+        # 待嵌入的文本块: (文本, 元数据, 所属文档序号)
+        self._buffer: Deque[Tuple[str, Dict[str, Any], int]] = deque()
+        self._chunked_upto = 0  # 已完成分块的文档序号上界
+        self._committed = 0  # 已完整写入索引的文档数
+        self._saved: Tuple[int, int] = (0, 0)  # 上一个已保存的断点: (文档数, 索引大小)
+        self._last_checkpoint = time.perf_counter()
+        self._last_report = time.perf_counter()
+
+    async def run(self, source: str, content_field: str = "content", resume: bool = True) -> IngestStats:
+        """导入语料
+
+        Args:
+            source: 语料目录或JSONL文件
+            content_field: JSONL记录中正文所在的字段
+            resume: 是否从检查点继续
+
+        Returns:
+            IngestStats: 本次导入的统计信息
+        """
+        self._committed = self._load_checkpoint(source) if resume else 0
+        self._chunked_upto = self._committed
+        self._saved = (self._committed, len(self.rag.documents))
+        if self._committed:
+            logger.info(f"从检查点继续导入 {source}, 跳过 {self._committed} 篇文档")
+
+        documents = DataLoader(source).iter_documents(content_field=content_field, skip=self._committed)
+        loop = asyncio.get_running_loop()
+        executor: Executor = ProcessPoolExecutor(max_workers=self.workers)
+        chunk_size, chunk_overlap = self.rag.chunk_size, self.rag.chunk_overlap
+        pending: Deque[Tuple[asyncio.Future, List[Dict[str, Any]]]] = deque()
+        try:
+            exhausted = False
+            while not exhausted or pending:
+                # 保持进程池满载,同时限制在途批次以控制内存
+                while not exhausted and len(pending) < self.workers * 2:
+                    batch = await asyncio.to_thread(self._next_batch, documents)
+                    if not batch:
+                        exhausted = True
+                        break
+                    texts = [text for text, _ in batch]
+                    self.stats.bytes += sum(len(text.encode('utf-8')) for text in texts)
+                    future = loop.run_in_executor(
+                        executor, partial(_chunk_batch, texts, chunk_size, chunk_overlap)
+                    )
+                    pending.append((future, [metadata for _, metadata in batch]))
+                if not pending:
+                    break
+
+                # 按提交顺序消费分块结果,保证断点位置单调
+                future, metadatas = pending.popleft()
+                for chunks, metadata in zip(await future, metadatas):
+                    for chunk in chunks:
+                        self._buffer.append((chunk, metadata, self._chunked_upto))
+                    self._chunked_upto += 1
+                    self.stats.documents += 1
+
+                while len(self._buffer) >= self.embed_batch_size:
+                    await self._flush(self.embed_batch_size)
+                await self._maybe_checkpoint(source)
+                self._maybe_report()
+
+            await self._flush()
+            self._save_checkpoint(source, completed=True)
+        finally:
+            for future, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        self._report()
+        return self.stats
+
+    def _next_batch(self, documents: Iterator[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """从文档迭代器读取下一批文档"""
+        batch = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= self.doc_batch_size:
+                break
+        return batch
+
+    async def _flush(self, limit: Optional[int] = None) -> None:
+        """嵌入并写入缓冲区中的前limit个文本块"""
+        count = len(self._buffer) if limit is None else min(limit, len(self._buffer))
+        if count:
+            items = [self._buffer.popleft() for _ in range(count)]
+            texts = [text for text, _, _ in items]
+            embeddings = await self.rag.embed(texts)
+            self.rag.add_chunks(texts, embeddings, [metadata for _, metadata, _ in items])
+            self.stats.chunks += count
+        # 缓冲区中最早的文本块所属文档之前的文档都已完整写入
+        self._committed = self._buffer[0][2] if self._buffer else self._chunked_upto
+
+    async def _maybe_checkpoint(self, source: str) -> None:
+        if time.perf_counter() - self._last_checkpoint < self.checkpoint_interval:
+            return
+        await self._flush()
+        self._save_checkpoint(source)
+
+    def _save_checkpoint(self, source: str, completed: bool = False) -> None:
+        """记录断点位置并保存索引
+
+        检查点同时保留上一个断点,并先于索引写入: 在两者之间退出时,
+        磁盘上的索引仍对应上一个断点,续传时由 _load_checkpoint 按索引大小选用
+        """
+        position, index_size = self._committed, len(self.rag.documents)
+        state = {
+            "source": os.path.abspath(source),
+            "position": position,
+            "index_size": index_size,
+            "previous": {"position": self._saved[0], "index_size": self._saved[1]},
+            "completed": completed,
+            "stats": self.stats.as_dict(),
+        }
+        tmp_path = self.checkpoint_path + ".tmp"
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self.rag.save(self.index_path)
+        self._saved = (position, index_size)
+        self._last_checkpoint = time.perf_counter()
+        logger.info(f"检查点已保存: {position} 篇文档")
+
+    def _load_checkpoint(self, source: str) -> int:
+        """读取检查点,返回与已加载索引一致的断点位置(已处理的文档数)
+
+        Raises:
+            RuntimeError: 检查点与索引都不一致(索引被其他方式修改过)
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("source") != os.path.abspath(source):
+            return 0
+        if "index_size" not in state:
+            # 旧版本的检查点没有记录索引大小
+            return int(state.get("position", 0))
+        index_size = len(self.rag.documents)
+        for entry in (state, state.get("previous") or {}):
+            if entry.get("index_size") == index_size:
+                return int(entry.get("position", 0))
+        raise RuntimeError(
+            f"导入检查点与索引不一致(索引 {index_size} 个文本块, 检查点 {state['index_size']} 个),"
+            f"请使用 --no-resume 重新导入"
+        )
+
+    def _maybe_report(self) -> None:
+        if time.perf_counter() - self._last_report >= self.report_interval:
+            self._report()
+
+    def _report(self) -> None:
+        stats = self.stats.as_dict()
+        logger.info(
+            f"已导入 {stats['documents']} 篇文档 / {stats['chunks']} 个文本块, "
+            f"{stats['docs_per_sec']:.1f} docs/s, {stats['chunks_per_sec']:.1f} chunks/s, "
+            f"{stats['mb_per_sec']:.2f} MB/s"
+        )
+        self._last_report = time.perf_counter()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    from src.core.config import load_config
+    config = load_config(args.config_dir)
+    rag = RAGManager(config)
+    await rag.init()
+    pipeline = IngestPipeline(
+        rag,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+    )
+    stats = await pipeline.run(args.source, content_field=args.content_field, resume=not args.no_resume)
+    print(json.dumps(stats.as_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量导入文档到RAG知识库")
+    parser.add_argument("source", help="语料目录或JSONL文件")
+    parser.add_argument("--config-dir", default=None, help="配置目录")
+    parser.add_argument("--workers", type=int, default=None, help="分块进程数")
+    parser.add_argument("--embed-batch-size", type=int, default=None, help="批量嵌入大小")
+    parser.add_argument("--content-field", default="content", help="JSONL正文字段")
+    parser.add_argument("--no-resume", action="store_true", help="忽略检查点重新导入")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,21 +1,78 @@
 import os
-import pandas as pd
+import json
+from typing import Any, Dict, Iterator, Tuple
+
+# 文本类文件扩展名,目录流式读取时使用
+TEXT_EXTENSIONS = ('.txt', '.md', '.markdown', '.rst', '.html', '.htm')
 
 class DataLoader:
     def __init__(self, file_path):
         self.file_path = file_path
 
     def load_csv(self):
+        import pandas as pd
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"The file {self.file_path} does not exist.")
         return pd.read_csv(self.file_path)
 
     def load_json(self):
+        import pandas as pd
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"The file {self.file_path} does not exist.")
         return pd.read_json(self.file_path)
 
     def load_excel(self):
+        import pandas as pd
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"The file {self.file_path} does not exist.")
+        return pd.read_excel(self.file_path)
+
+    def iter_documents(self, content_field: str = "content", skip: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """流式读取文档,不会一次性把语料加载到内存
+
+        file_path 可以是目录(递归读取文本文件和.jsonl文件)或单个.jsonl/文本文件。
+        遍历顺序是确定的,因此可以用已处理的文档数作为断点位置。
+
+        Args:
+            content_field: JSONL记录中正文所在的字段
+            skip: 跳过前skip篇文档(用于断点续传),被跳过的文档不会被解析
+
+        Yields:
+            Tuple[str, Dict[str, Any]]: (文档内容, 元数据)
+        """
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"The file {self.file_path} does not exist.")
-        return pd.read_excel(self.file_path)
\ No newline at end of file
+        position = 0
+        for path in self._iter_files():
+            if path.endswith('.jsonl'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line_no, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        position += 1
+                        if position <= skip:
+                            continue
+                        record = json.loads(line)
+                        content = record.pop(content_field, "")
+                        metadata = record.pop("metadata", None) or {}
+                        metadata.update(record)
+                        metadata.setdefault("source", path)
+                        metadata.setdefault("line", line_no)
+                        yield str(content), metadata
+            else:
+                position += 1
+                if position <= skip:
+                    continue
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    yield f.read(), {"source": path}
+
+    def _iter_files(self) -> Iterator[str]:
+        """按确定顺序遍历需要读取的文件"""
+        if os.path.isfile(self.file_path):
+            yield self.file_path
+            return
+        for root, dirs, files in os.walk(self.file_path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.jsonl') or name.lower().endswith(TEXT_EXTENSIONS):
+                    yield os.path.join(root, name)
@@ -0,0 +1,92 @@
+"""
+元数据索引
+
+为指定的元数据字段(如 tenant、source、tag)维护 值 -> 文档序号 的倒排表,
+检索时把过滤条件转换为允许的文档序号集合,交给向量索引和BM25在检索过程中过滤。
+"""
+
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FilterKey = Tuple[Tuple[str, Tuple[Hashable, ...]], ...]
+
+
+def _as_values(value: Any) -> List[Hashable]:
+    """元数据值统一为可哈希值列表,列表类型的值(如标签)逐个索引"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [v if isinstance(v, Hashable) else str(v) for v in value]
+    return [value if isinstance(value, Hashable) else str(value)]
+
+
+def freeze_filters(filters: Optional[Dict[str, Any]]) -> FilterKey:
+    """把过滤条件转换为可作为缓存键的形式"""
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (name, tuple(sorted(_as_values(value), key=repr)))
+        for name, value in filters.items()
+    ))
+
+
+class MetadataIndex:
+    """元数据倒排索引
+
+    文档序号只会追加,因此每个倒排表天然有序。
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        """
+        Args:
+            fields: 需要建立索引的元数据字段
+        """
+        self.fields = set(fields)
+        self._postings: Dict[str, Dict[Hashable, List[int]]] = {name: {} for name in self.fields}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add_many(self, metadatas: Iterable[Dict[str, Any]]) -> None:
+        """按文档序号顺序添加元数据"""
+        for metadata in metadatas:
+            doc_id = self._size
+            for name in self.fields.intersection(metadata):
+                postings = self._postings[name]
+                for value in _as_values(metadata[name]):
+                    postings.setdefault(value, []).append(doc_id)
+            self._size += 1
+
+    def clear(self) -> None:
+        for postings in self._postings.values():
+            postings.clear()
+        self._size = 0
+
+    def allowed_ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        """计算满足过滤条件的文档序号
+
+        同一字段的多个取值之间为"或",不同字段之间为"且"。
+
+        Args:
+            filters: 字段 -> 取值或取值列表
+
+        Returns:
+            np.ndarray: 升序排列的int64文档序号
+
+        Raises:
+            ValueError: 过滤字段没有建立索引
+        """
+        allowed: Optional[np.ndarray] = None
+        for name, value in filters.items():
+            if name not in self.fields:
+                raise ValueError(f"元数据字段未建立索引: {name}, 请在rag.metadata_fields中配置")
+            postings = self._postings[name]
+            lists = [postings[v] for v in _as_values(value) if v in postings]
+            if not lists:
+                return np.empty(0, dtype=np.int64)
+            ids = np.asarray(lists[0], dtype=np.int64) if len(lists) == 1 \
+                else np.unique(np.concatenate([np.asarray(ids, dtype=np.int64) for ids in lists]))
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+            if allowed.size == 0:
+                break
+        return allowed if allowed is not None else np.arange(self._size, dtype=np.int64)
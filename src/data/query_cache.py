@@ -0,0 +1,141 @@
+"""
+RAG查询缓存
+
+精确缓存以规范化后的查询文本为键;语义缓存在查询向量与已缓存查询的余弦相似度
+超过阈值时复用结果。索引每次变更都会使全部缓存失效。
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.cache import LRUCache
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCT = re.compile(r'[\s。！？!?.,，、；;：:~～]+$')
+
+CacheKey = Tuple[str, Tuple[Hashable, ...]]
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本: 全半角统一、小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCT.sub("", text)
+
+
+class QueryCache:
+    """RAG查询结果缓存
+
+    缓存键由规范化查询和作用域(top_k等影响结果的参数)组成,
+    语义缓存只在作用域相同的条目之间复用结果。
+    通过代数(generation)实现失效: 写入时携带查询开始时的代数,
+    若期间索引发生变更则丢弃该结果。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 semantic: bool = False, threshold: float = 0.95, semantic_size: int = 256):
+        """
+        Args:
+            maxsize: 精确缓存最大条目数
+            ttl: 缓存过期时间(秒)
+            semantic: 是否启用语义缓存
+            threshold: 语义缓存的余弦相似度阈值
+            semantic_size: 语义缓存最大条目数
+        """
+        self.exact = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.semantic = semantic
+        self.threshold = threshold
+        self.semantic_size = semantic_size
+        self.ttl = ttl
+        self.generation = 0
+        self.semantic_hits = 0
+        self._reset_semantic()
+
+    def make_key(self, query: str, *scope: Hashable) -> CacheKey:
+        return normalize_query(query), tuple(scope)
+
+    def get(self, key: CacheKey) -> Optional[List[Dict[str, Any]]]:
+        """精确匹配"""
+        results = self.exact.get(key)
+        return list(results) if results is not None else None
+
+    def get_similar(self, key: CacheKey, embedding: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        """语义匹配,命中时同时写入精确缓存"""
+        if not self.semantic or self._count == 0:
+            return None
+        scope_id = self._scope_ids.get(key[1])
+        if scope_id is None:
+            return None
+        n = self._count
+        sims = self._vectors[:n] @ self._unit(embedding)
+        sims[self._scopes[:n] != scope_id] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        cached_key = self._keys[best]
+        results = self.exact.get(cached_key) if cached_key is not None else None
+        if results is None:
+            return None
+        self.semantic_hits += 1
+        self.exact.set(key, results)
+        return list(results)
+
+    def put(self, key: CacheKey, results: List[Dict[str, Any]], generation: int,
+            embedding: Optional[np.ndarray] = None) -> None:
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            results: 检索结果
+            generation: 查询开始时的代数,与当前代数不一致时丢弃
+            embedding: 查询向量,启用语义缓存时记录
+        """
+        if generation != self.generation:
+            return
+        self.exact.set(key, list(results))
+        if self.semantic and embedding is not None:
+            self._add_vector(key, embedding)
+
+    def invalidate(self) -> None:
+        """索引变更时调用,使全部缓存失效"""
+        self.generation += 1
+        self.exact.clear()
+        self._reset_semantic()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.exact.stats()
+        stats.update({
+            "semantic_hits": self.semantic_hits,
+            "semantic_size": self._count,
+            "generation": self.generation,
+        })
+        return stats
+
+    def _reset_semantic(self) -> None:
+        self._vectors: Optional[np.ndarray] = None
+        self._scopes = np.zeros(self.semantic_size, dtype=np.int64)
+        self._keys: List[Optional[CacheKey]] = [None] * self.semantic_size
+        self._scope_ids: Dict[Tuple[Hashable, ...], int] = {}
+        self._count = 0
+        self._next = 0
+
+    def _add_vector(self, key: CacheKey, embedding: np.ndarray) -> None:
+        """以环形缓冲区保存查询向量,写满后覆盖最早的条目"""
+        unit = self._unit(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.semantic_size, unit.shape[0]), dtype=np.float32)
+        slot = self._next
+        self._vectors[slot] = unit
+        self._scopes[slot] = self._scope_ids.setdefault(key[1], len(self._scope_ids))
+        self._keys[slot] = key
+        self._next = (slot + 1) % self.semantic_size
+        self._count = min(self._count + 1, self.semantic_size)
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
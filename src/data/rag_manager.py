@@ -1,9 +1,19 @@
 import os
-from typing import Dict, List, Optional, Any, TYPE_CHECKING
+import json
+import zlib
+import asyncio
+import threading
+from typing import Dict, List, Optional, Any, Sequence, Tuple, TYPE_CHECKING
 import numpy as np
 from dataclasses import dataclass
+from src.core.cancellation import cancellable, check_cancelled
 from src.core.config import Config
 from src.core.logger import LogConfig
+from src.core.tracing import traced
+from src.data.chunker import TextChunker
+from src.data.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from src.data.query_cache import QueryCache
+from src.data.metadata_index import MetadataIndex, freeze_filters
 
 if TYPE_CHECKING:
     import faiss
@@ -15,17 +25,69 @@ class Document:
     """文档类"""
     content: str
     metadata: Dict[str, Any]
-    embedding: Optional[np.ndarray] = None
+    embedding: Optional[np.ndarray] = None  # 知识库中的文档不保存向量,向量只存放在向量索引中
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """文本分块
+
+    模块级函数,便于在进程池中调用
+    """
+    return TextChunker(chunk_size, chunk_overlap).split(text)
+
+def faiss_search_params(allowed: np.ndarray, total: int) -> Any:
+    """根据允许的文档序号构造faiss检索参数
+    
+    候选较少时使用哈希集合选择器,较多时使用位图选择器(每次检索O(1)判断)
+    """
+    import faiss
+    if allowed.size * 64 < total:
+        selector = faiss.IDSelectorBatch(allowed)
+    else:
+        bitmap = np.zeros(total, dtype=bool)
+        bitmap[allowed] = True
+        selector = faiss.IDSelectorBitmap(np.packbits(bitmap, bitorder='little'))
+    return faiss.SearchParameters(sel=selector)
+
+def hash_embeddings(texts: Sequence[str], dim: int) -> np.ndarray:
+    """确定性的特征哈希嵌入
+    
+    每个词项按crc32映射到一个维度并带符号累加,再做L2归一化。
+    不依赖模型,相同文本总得到相同向量,词项重合越多向量越接近,用于测试和压测。
+    """
+    vectors = np.zeros((len(texts), dim), dtype='float32')
+    for row, text in enumerate(texts):
+        for term in tokenize(text):
+            h = zlib.crc32(term.encode('utf-8'))
+            vectors[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
 
 class RAGManager:
     """RAG(检索增强生成)管理器"""
     
+    INDEX_FILE = "index.faiss"
+    DOCUMENTS_FILE = "documents.jsonl"
+    
     def __init__(self, config: Config):
         self.config = config
         self.chunk_size: int = config.chunk_size
         self.chunk_overlap: int = config.chunk_overlap
+        self.chunker = TextChunker(self.chunk_size, self.chunk_overlap)
         self.vector_store: Optional[Any] = None  # type: ignore
         self.documents: List[Document] = []
+        self.bm25 = BM25Index()  # 与向量索引共用文档序号的倒排索引
+        self.metadata_index = MetadataIndex(config.rag_metadata_fields)
+        self.query_cache = QueryCache(
+            maxsize=config.rag_cache_size,
+            ttl=config.rag_cache_ttl,
+            semantic=config.rag_semantic_cache,
+            threshold=config.rag_semantic_threshold
+        )
+        self._persisted_count = 0  # 已写入持久化文件的文档数
+        self._persisted_path: Optional[str] = None  # _persisted_count 对应的持久化目录
+        # faiss检索在线程中执行,与添加向量、写入索引互斥
+        self._index_lock = threading.Lock()
         
     async def init(self) -> None:
         """初始化RAG系统"""
@@ -43,13 +105,95 @@ class RAGManager:
     async def cleanup(self) -> None:
         """清理RAG系统"""
         self.documents.clear()
+        self.bm25.clear()
+        self.metadata_index.clear()
+        self.query_cache.invalidate()
+        self._persisted_count = 0
+        self._persisted_path = None
         self.vector_store = None
         logger.info("RAG系统已清理")
         
     async def _load_documents(self) -> None:
         """加载文档"""
-        # TODO: 实现文档加载和分块
-        pass
+        # 从持久化目录恢复索引和文档
+        if os.path.exists(os.path.join(self.config.rag_index_path, self.INDEX_FILE)):
+            self.load(self.config.rag_index_path)
+            
+    def save(self, path: Optional[str] = None) -> None:
+        """持久化向量索引和文档
+        
+        保存到同一目录时文档以追加方式写入,只写入上次保存之后新增的部分;
+        首次保存或保存到其他目录时写入临时文件后原子替换,不会追加到已有的文件后。
+        索引写入临时文件后原子替换
+        
+        Args:
+            path: 持久化目录,默认使用配置中的rag_index_path
+        """
+        import faiss
+        path = path or self.config.rag_index_path
+        os.makedirs(path, exist_ok=True)
+        
+        docs_path = os.path.join(path, self.DOCUMENTS_FILE)
+        append = self._persisted_count > 0 and self._persisted_path == os.path.abspath(path)
+        target = docs_path if append else docs_path + ".tmp"
+        with open(target, 'a' if append else 'w', encoding='utf-8') as f:
+            for doc in self.documents[self._persisted_count if append else 0:]:
+                f.write(json.dumps({"content": doc.content, "metadata": doc.metadata}, ensure_ascii=False))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if not append:
+            os.replace(target, docs_path)
+        self._persisted_count = len(self.documents)
+        self._persisted_path = os.path.abspath(path)
+        
+        if self.vector_store is not None:
+            index_path = os.path.join(path, self.INDEX_FILE)
+            with self._index_lock:
+                faiss.write_index(self.vector_store, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+        logger.info(f"RAG索引已保存: {path}, 文档块数: {len(self.documents)}")
+        
+    def load(self, path: Optional[str] = None) -> None:
+        """从持久化目录加载向量索引和文档
+        
+        Args:
+            path: 持久化目录,默认使用配置中的rag_index_path
+        """
+        import faiss
+        path = path or self.config.rag_index_path
+        self.vector_store = faiss.read_index(os.path.join(path, self.INDEX_FILE))
+        
+        # 文档文件可能比索引多写入了一部分(保存中途退出),以索引为准截断
+        total = self.vector_store.ntotal
+        self.documents = []
+        docs_path = os.path.join(path, self.DOCUMENTS_FILE)
+        if os.path.exists(docs_path):
+            with open(docs_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if len(self.documents) >= total:
+                        break
+                    data = json.loads(line)
+                    self.documents.append(Document(content=data["content"], metadata=data["metadata"]))
+        if len(self.documents) != total:
+            raise RuntimeError(f"RAG索引与文档数量不一致: {total} != {len(self.documents)}")
+        
+        # 重写文档文件,去掉多余的行
+        with open(docs_path + ".tmp", 'w', encoding='utf-8') as f:
+            for doc in self.documents:
+                f.write(json.dumps({"content": doc.content, "metadata": doc.metadata}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(docs_path + ".tmp", docs_path)
+        self._persisted_count = len(self.documents)
+        self._persisted_path = os.path.abspath(path)
+        
+        # 倒排索引不持久化,由文档重建
+        self.bm25.clear()
+        self.bm25.add_many(doc.content for doc in self.documents)
+        self.metadata_index.clear()
+        self.metadata_index.add_many(doc.metadata for doc in self.documents)
+        self.query_cache.invalidate()
+        logger.info(f"RAG索引已加载: {path}, 文档块数: {total}")
         
     async def add_document(self, content: str, metadata: Optional[Dict] = None) -> None:
         """添加文档到知识库
@@ -62,73 +206,145 @@ class RAGManager:
         chunks = self._split_text(content)
         
         # 2. 获取嵌入向量
-        embeddings = await self._get_embeddings(chunks)
+        embeddings = await self.embed(chunks)
         
         # 3. 创建文档对象并存储
-        for chunk, embedding in zip(chunks, embeddings):
-            doc = Document(
-                content=chunk,
-                metadata=metadata or {},
-                embedding=embedding
-            )
-            self.documents.append(doc)
+        self.add_chunks(chunks, embeddings, [metadata or {}] * len(chunks))
+        
+    def add_chunks(self, chunks: Sequence[str], embeddings: np.ndarray,
+                   metadatas: Sequence[Dict[str, Any]]) -> None:
+        """批量添加已分块并嵌入的文本
+        
+        Args:
+            chunks: 文本块
+            embeddings: 嵌入矩阵,形状为(len(chunks), vector_dim)
+            metadatas: 每个文本块的元数据
+        """
+        if not chunks:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        # 向量只添加到索引,文档不再各自持有一份
+        for chunk, metadata in zip(chunks, metadatas):
+            self.documents.append(Document(content=chunk, metadata=metadata))
             
-            # 添加到向量索引
-            if self.vector_store is not None:
-                self.vector_store.add(embedding.reshape(1, -1))
+        # 一次性添加到向量索引
+        if self.vector_store is not None:
+            with self._index_lock:
+                self.vector_store.add(embeddings)
+        self.bm25.add_many(chunks)
+        self.metadata_index.add_many(metadatas)
+        self.query_cache.invalidate()
                 
-    async def get_knowledge(self, query: str, top_k: int = 3) -> List[Dict]:
+    @traced("rag.get_knowledge")
+    async def get_knowledge(self, query: str, top_k: int = 3,
+                            filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """检索相关知识
+        
+        先查询缓存;启用混合检索时,向量检索与BM25检索并行执行,结果按倒数排名融合,
+        score为融合得分(越大越相关);否则score为向量L2距离(越小越相关)。
 
         Args:
             query: 查询文本
             top_k: 返回的文档数量
+            filters: 元数据过滤条件,如 {"tenant": "t1", "tag": ["faq", "api"]},
+                同一字段多个取值为"或",不同字段为"且",只能使用rag.metadata_fields中的字段
+        """
+        if self.vector_store is None or not self.documents:
+            return []
+        check_cancelled()
+        
+        key = self.query_cache.make_key(query, top_k, freeze_filters(filters))
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        generation = self.query_cache.generation
+        
+        query_embedding = None
+        if self.query_cache.semantic:
+            query_embedding = (await self.embed([query]))[0]
+            cached = self.query_cache.get_similar(key, query_embedding)
+            if cached is not None:
+                return cached
+                
+        # 当前轮次被取消时不再等待检索结果
+        results = await cancellable(self._search(query, top_k, query_embedding, filters))
+        self.query_cache.put(key, results, generation, query_embedding)
+        return results
+        
+    async def _search(self, query: str, top_k: int,
+                      query_embedding: Optional[np.ndarray] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """执行检索,不经过缓存"""
+        allowed = self.metadata_index.allowed_ids(filters) if filters else None
+        if allowed is not None and allowed.size == 0:
+            return []
+            
+        if not self.config.rag_hybrid:
+            hits = (await self._vector_search(query, top_k, query_embedding, allowed))[:top_k]
+        else:
+            depth = max(top_k, self.config.rag_candidate_depth)
+            vector_hits, lexical_hits = await asyncio.gather(
+                self._vector_search(query, depth, query_embedding, allowed),
+                asyncio.to_thread(self.bm25.search, query, depth, allowed)
+            )
+            hits = reciprocal_rank_fusion(
+                [[idx for idx, _ in vector_hits], [idx for idx, _ in lexical_hits]],
+                k=self.config.rag_rrf_k
+            )[:top_k]
+            
+        results: list[dict[str, Any]] = []
+        for idx, score in hits:
+            doc = self.documents[idx]
+            results.append({
+                "content": doc.content,
+                "metadata": doc.metadata,
+                "score": float(score)
+            })
+        return results
+        
+    async def _vector_search(self, query: str, top_k: int,
+                             query_embedding: Optional[np.ndarray] = None,
+                             allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """向量检索,返回按距离升序排列的(文档序号, L2距离)
+        
+        Args:
+            allowed: 允许返回的文档序号,在索引内部过滤而不是检索后过滤
         """
         # 1. 获取查询向量
-        query_embedding = (await self._get_embeddings([query]))[0]
+        if query_embedding is None:
+            query_embedding = (await self.embed([query]))[0]
         
-        # 2. 向量检索
-        if self.vector_store is not None:
-            results: list[dict[str, Any]] = []
-            D, I = self.vector_store.search(query_embedding.reshape(1, -1), top_k)
-            for idx in I[0]:
-                if idx < len(self.documents) and self.documents:  # 检查列表是否为空
-                    doc = self.documents[idx]
-                    results.append({
-                        "content": doc.content,
-                        "metadata": doc.metadata,
-                        "score": float(D[0][len(results)])
-                    })
-            return results
-        
-        return []
+        # 2. 向量检索,faiss检索是CPU密集的同步调用,放到线程中执行以免阻塞事件循环
+        D, I = await asyncio.to_thread(self._faiss_search, query_embedding, top_k, allowed)
+        return [
+            (int(idx), float(dist))
+            for idx, dist in zip(I[0], D[0])
+            if 0 <= idx < len(self.documents)  # faiss 在结果不足时返回 -1
+        ]
         
+    def _faiss_search(self, query_embedding: np.ndarray, top_k: int,
+                      allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """同步执行faiss检索,返回(距离, 序号)"""
+        with self._index_lock:
+            if allowed is None:
+                return self.vector_store.search(query_embedding.reshape(1, -1), top_k)
+            return self.vector_store.search(
+                query_embedding.reshape(1, -1), top_k,
+                params=faiss_search_params(allowed, self.vector_store.ntotal)
+            )
+            
     def _split_text(self, text: str) -> List[str]:
         """文本分块"""
-        # 简单的固定窗口分块
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + self.chunk_size
-            if end < len(text):
-                # 尝试在分块重叠区域找到合适的分割点
-                overlap_start = max(end - self.chunk_overlap, start)
-                split_pos = text.rfind("。", overlap_start, end)
-                if split_pos != -1:
-                    end = split_pos + 1
-                    
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            start = end - self.chunk_overlap
-            
-        return chunks
+        return self.chunker.split(text)
         
-    async def _get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
-        """获取文本嵌入向量"""
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """获取文本嵌入向量
+        
+        Returns:
+            np.ndarray: 形状为(len(texts), vector_dim)的嵌入矩阵
+        """
+        if self.config.embedding_backend == "hash":
+            return hash_embeddings(texts, self.config.vector_dim)
         # TODO: 实现向量模型调用
         # 临时返回随机向量
-        return [
-            np.random.randn(self.config.vector_dim).astype('float32')
-            for _ in texts
-        ]
\ No newline at end of file
+        return np.random.randn(len(texts), self.config.vector_dim).astype('float32')
\ No newline at end of file
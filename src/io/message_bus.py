@@ -1,6 +1,8 @@
 """消息总线和消息基类模块，用于系统内部组件通信"""
 
 import asyncio
+import contextvars
+import itertools
 import json
 import uuid
 import time
@@ -8,6 +10,7 @@ from typing import Dict, List, Any, Callable, Coroutine, Optional, Union
 from datetime import datetime
 from collections import defaultdict
 from ..core.logger import LogConfig
+from ..core.tracing import tracer
 from enum import IntEnum
 
 # 获取配置好的logger
@@ -65,6 +68,8 @@ class MessageBus:
         self._running = True
         self._message_queue = asyncio.PriorityQueue()
         self._processing_tasks = set()
+        # 同优先级消息按发布顺序处理,保证同一用户的分片消息有序
+        self._sequence = itertools.count()
         
     async def publish(self, topic: str, message: Union[Dict[str, Any], Message, str], 
                      priority: MessagePriority = MessagePriority.NORMAL) -> None:
@@ -82,6 +87,7 @@ class MessageBus:
             msg = Message(
                 content=json.dumps(message),
                 type=topic,
+                user_id=message.get("user_id"),
                 priority=priority
             )
         elif isinstance(message, str):
@@ -92,14 +98,17 @@ class MessageBus:
             )
         else:
             msg = message
+        # 在消息元数据中传递trace上下文
+        tracer.inject(msg.metadata)
             
         logger.debug(f"发布消息到主题 {topic}: {msg.to_dict()}")
         
-        await self._message_queue.put((-msg.priority.value, msg, topic))
+        await self._message_queue.put((-msg.priority.value, next(self._sequence), msg, topic))
         
         # 确保消息处理任务正在运行
         if not self._processing_tasks:
-            task = asyncio.create_task(self._process_messages())
+            # 在空上下文中创建处理任务,避免首个发布者的trace泄漏到之后所有消息
+            task = contextvars.Context().run(asyncio.create_task, self._process_messages())
             self._processing_tasks.add(task)
             task.add_done_callback(self._processing_tasks.discard)
             
@@ -107,7 +116,7 @@ class MessageBus:
         """处理消息队列中的消息"""
         while self._running:
             try:
-                _, message, topic = await self._message_queue.get()
+                _, _, message, topic = await self._message_queue.get()
                 
                 if topic not in self._subscribers:
                     self._message_queue.task_done()
@@ -141,7 +150,13 @@ class MessageBus:
         """
         while message.retry_count < message.max_retries:
             try:
-                await callback(message.to_dict())
+                with tracer.start_trace(
+                    f"bus.{message.type}",
+                    message.metadata,
+                    handler=getattr(callback, "__qualname__", str(callback)),
+                    queue_ms=round((time.time() - message.timestamp) * 1000, 3)
+                ):
+                    await callback(message.to_dict())
                 return
             except Exception as e:
                 message.retry_count += 1
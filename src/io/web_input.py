@@ -4,6 +4,7 @@ import json
 from collections import defaultdict
 from .base_input import BaseInputHandler
 from .message_bus import MessageBus, Message, MessagePriority
+from ..core.tracing import tracer
 
 class WebInputHandler(BaseInputHandler):
     def __init__(self, message_bus: MessageBus):
@@ -54,7 +55,10 @@ class WebInputHandler(BaseInputHandler):
         user_id = data.get("user_id")
         if not user_id:
             return
+        with tracer.start_trace("web.input", data.get("metadata"), user_id=user_id):
+            await self._handle_input(user_id, data)
             
+    async def _handle_input(self, user_id: str, data: Dict[str, Any]) -> None:
         if user_id not in self._user_sessions:
             self._user_sessions[user_id] = {
                 "last_active": asyncio.get_event_loop().time(),
@@ -75,8 +79,23 @@ class WebInputHandler(BaseInputHandler):
         )
         await self.message_bus.publish("user_input", input_msg)
         
+    async def handle_typing(self, data: Dict[str, Any]) -> None:
+        """转发用户正在输入的草稿,供智能体预取上下文"""
+        user_id = data.get("user_id")
+        if not user_id:
+            return
+            
+        typing_msg = Message(
+            content=json.dumps(data),
+            type="typing",
+            user_id=user_id,
+            priority=MessagePriority.LOW
+        )
+        await self.message_bus.publish("user_typing", typing_msg)
+        
     async def setup(self) -> None:
         await self.message_bus.subscribe("web_input", self.handle_input)
+        await self.message_bus.subscribe("web_typing", self.handle_typing)
         asyncio.create_task(self._cleanup_sessions())
         
         ready_msg = Message(
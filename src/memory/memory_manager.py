@@ -13,6 +13,7 @@ import aiosqlite
 from src.core.config import Config
 from ..io.message_bus import Message
 from ..core.logger import LogConfig
+from ..core.tracing import traced
 
 # 获取配置好的logger
 logger = LogConfig.get_instance().get_logger("memory_manager", "memory.log")
@@ -314,6 +315,7 @@ class MemoryManager:
         )
         await self._conn.commit()
         
+    @traced("memory.get_context")
     async def get_context(self, query: str, limit: int = 5) -> List[Dict]:
         """获取相关上下文
         
@@ -345,6 +347,7 @@ class MemoryManager:
             
         return memories
         
+    @traced("memory.add_interaction")
     async def add_interaction(self, input_text: str, response: str, context: Optional[Dict] = None):
         """添加对话交互记录
         
@@ -0,0 +1,461 @@
+"""
+大语言模型客户端
+
+与服务商无关的异步模型客户端。每个服务商一个共享的连接池(HTTP keep-alive),
+合并相同的在途请求(流式请求共享一次上游读取),按服务商限制并发数和请求速率,
+失败时按带抖动的指数退避重试。当前轮次的取消令牌被取消时,等待中的请求立即中止,
+所有调用方都离开的流式响应关闭底层HTTP连接。
+"""
+
+import json
+import time
+import random
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from src.core.cancellation import OperationCancelled, cancellable
+from src.core.config import AIAPIConfig, Config
+from src.core.http import create_session
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("llm", "llm.log")
+
+ChatMessage = Dict[str, str]
+
+# 可重试的HTTP状态码
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """模型调用失败"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RateLimiter:
+    """令牌桶限流器"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒允许的请求数
+            burst: 桶容量,默认等于rate(至少为1)
+        """
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """获取一个令牌,不足时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _InflightRequest:
+    """被合并的在途请求"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """被合并的在途流式请求: 上游增量文本缓存在 chunks 中,各调用方按各自进度读取"""
+
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.chunks: List[str] = []
+        self.waiters = 0
+        self.changed = asyncio.Event()
+
+    def push(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self.notify()
+
+    def notify(self) -> None:
+        """唤醒等待新数据的调用方,之后的等待使用新的事件"""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class BaseLLMClient(ABC):
+    """模型客户端基类
+
+    子类只负责构造请求和解析响应,连接池、合并、限流和重试由基类处理。
+    """
+
+    provider = "base"
+
+    def __init__(self, settings: AIAPIConfig, model: str, temperature: float = 0.7,
+                 max_tokens: Optional[int] = None):
+        self.settings = settings
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = settings.max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(settings.max_concurrency)
+        self._rate_limiter = RateLimiter(settings.requests_per_second) \
+            if settings.requests_per_second > 0 else None
+        self._inflight: Dict[str, _InflightRequest] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "errors": 0}
+
+    @abstractmethod
+    def build_request(self, messages: List[ChatMessage], params: Dict[str, Any],
+                      stream: bool) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构造请求
+
+        Returns:
+            Tuple[str, Dict[str, str], Dict[str, Any]]: (URL, 请求头, 请求体)
+        """
+
+    @abstractmethod
+    def parse_response(self, data: Dict[str, Any]) -> str:
+        """从完整响应中提取文本"""
+
+    @abstractmethod
+    def parse_stream_event(self, data: Dict[str, Any]) -> Optional[str]:
+        """从流式事件中提取增量文本,无文本时返回None"""
+
+    async def complete(self, messages: List[ChatMessage], **params) -> str:
+        """获取完整响应
+
+        参数完全相同的在途请求会被合并为一次调用;
+        所有等待方都取消时才取消底层请求。
+        
+        Raises:
+            OperationCancelled: 当前轮次已取消
+        """
+        url, headers, payload = self.build_request(messages, params, stream=False)
+        key = _request_key(url, payload)
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = _InflightRequest(asyncio.create_task(self._post_json(url, headers, payload)))
+            self._inflight[key] = entry
+            entry.task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        entry.waiters += 1
+        try:
+            data = await cancellable(asyncio.shield(entry.task))
+        except (asyncio.CancelledError, OperationCancelled):
+            entry.waiters -= 1
+            if entry.waiters == 0:
+                entry.task.cancel()
+            raise
+        entry.waiters -= 1
+        return self.parse_response(data)
+
+    async def stream(self, messages: List[ChatMessage], **params) -> AsyncIterator[str]:
+        """流式获取响应
+
+        参数完全相同的在途流式请求共享一次上游调用: 后加入的调用方先收到已产出的分片,
+        之后与其他调用方同步接收;所有调用方都停止时才关闭上游连接。
+        只在收到第一个数据之前重试,之后的错误直接抛出,避免重复输出
+        
+        Raises:
+            LLMError: 请求或读取响应失败
+            OperationCancelled: 当前轮次已取消
+        """
+        url, headers, payload = self.build_request(messages, params, stream=True)
+        key = _request_key(url, payload)
+        entry = self._streams.get(key)
+        if entry is None:
+            entry = _SharedStream()
+            entry.task = asyncio.create_task(self._pump(entry, url, headers, payload))
+            self._streams[key] = entry
+            entry.task.add_done_callback(lambda _: self._end_stream(key, entry))
+        else:
+            self.stats["coalesced"] += 1
+        entry.waiters += 1
+        index = 0
+        try:
+            while True:
+                if index < len(entry.chunks):
+                    yield entry.chunks[index]
+                    index += 1
+                elif entry.task.done():
+                    break
+                else:
+                    await cancellable(entry.changed.wait())
+            if entry.task.cancelled():
+                raise LLMError(f"{self.provider} 流式请求已中止")
+            if entry.task.exception() is not None:
+                raise entry.task.exception()
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                # 最后一个调用方离开: 关闭上游连接,之后的相同请求重新发起
+                self._end_stream(key, entry)
+                entry.task.cancel()
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        for entry in list(self._inflight.values()):
+            entry.task.cancel()
+        for stream in list(self._streams.values()):
+            stream.task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # 超时按请求设置(见 _timeout),会话本身不设总超时
+        if self._session is None or self._session.closed:
+            self._session = create_session(limit=self.settings.max_connections)
+        return self._session
+
+    def _timeout(self, stream: bool) -> aiohttp.ClientTimeout:
+        """普通请求限制总时长;流式请求的总时长取决于响应长度,只限制建立连接和两次读取之间的间隔"""
+        timeout = self.settings.request_timeout or None
+        if stream:
+            return aiohttp.ClientTimeout(total=None, connect=timeout, sock_read=timeout)
+        return aiohttp.ClientTimeout(total=timeout)
+
+    def _proxy_for(self, url: str) -> Optional[str]:
+        proxy = self.settings.https_proxy if url.startswith("https") else self.settings.http_proxy
+        return proxy or None
+
+    async def _post_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._semaphore:
+            response = await self._send(url, headers, payload, self._timeout(stream=False))
+            try:
+                return await response.json()
+            finally:
+                response.release()
+
+    async def _pump(self, entry: _SharedStream, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> None:
+        """读取上游的流式响应,把增量文本写入共享的分块列表
+
+        任务被取消(所有调用方都已离开)时释放响应,未读完的连接随之关闭
+        """
+        async with self._semaphore:
+            response = await self._send(url, headers, payload, self._timeout(stream=True))
+            try:
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        logger.warning(f"{self.provider} 返回无法解析的流式事件,已跳过: {data[:200]!r}")
+                        continue
+                    text = self.parse_stream_event(event)
+                    if text:
+                        entry.push(text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.stats["errors"] += 1
+                raise LLMError(f"{self.provider} 读取流式响应失败: {e!r}") from e
+            finally:
+                response.release()
+
+    def _end_stream(self, key: str, entry: _SharedStream) -> None:
+        """流式请求结束: 移出合并表并唤醒等待的调用方"""
+        if self._streams.get(key) is entry:
+            del self._streams[key]
+        entry.notify()
+
+    async def _send(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                    timeout: aiohttp.ClientTimeout) -> aiohttp.ClientResponse:
+        """发送请求,按带抖动的指数退避重试,返回状态码为200的响应"""
+        session = self._get_session()
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+            self.stats["requests"] += 1
+            retry_after: Optional[float] = None
+            try:
+                response = await session.post(url, json=payload, headers=headers, proxy=self._proxy_for(url),
+                                              timeout=timeout)
+                if response.status == 200:
+                    return response
+                body = await response.text()
+                response.release()
+                error = LLMError(f"{self.provider} 返回 {response.status}: {body[:500]}", response.status)
+                if response.status not in RETRY_STATUS:
+                    self.stats["errors"] += 1
+                    raise error
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = LLMError(f"{self.provider} 请求失败: {e!r}")
+                # 保留原因,超时可被识别为过载信号
+                error.__cause__ = e
+
+            if attempt >= self.max_retries:
+                self.stats["errors"] += 1
+                raise error
+            # 完全抖动: 在[0, 退避上限]内随机等待,避免大量请求同时重试
+            delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            attempt += 1
+            self.stats["retries"] += 1
+            logger.warning(f"{error}, {delay:.2f}s 后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+
+    def _common_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        merged = {"temperature": self.temperature}
+        if self.max_tokens:
+            merged["max_tokens"] = self.max_tokens
+        merged.update(params)
+        return merged
+
+
+def _request_key(url: str, payload: Dict[str, Any]) -> str:
+    """请求的合并键: URL和请求体的摘要"""
+    return hashlib.sha256(json.dumps([url, payload], sort_keys=True, ensure_ascii=False)
+                          .encode('utf-8')).hexdigest()
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class OpenAIClient(BaseLLMClient):
+    """OpenAI Chat Completions 客户端"""
+
+    provider = "openai"
+
+    def __init__(self, settings: AIAPIConfig, model: str, api_base: Optional[str] = None,
+                 api_key: Optional[str] = None, **kwargs):
+        super().__init__(settings, model, **kwargs)
+        self.api_base = (api_base or settings.openai_api_base).rstrip("/")
+        self.api_key = api_key if api_key is not None else settings.openai_api_key
+
+    def build_request(self, messages, params, stream):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        if self.settings.openai_org_id:
+            headers["OpenAI-Organization"] = self.settings.openai_org_id
+        payload = {"model": self.model, "messages": messages, "stream": stream}
+        payload.update(self._common_params(params))
+        return f"{self.api_base}/chat/completions", headers, payload
+
+    def parse_response(self, data):
+        return data["choices"][0]["message"].get("content") or ""
+
+    def parse_stream_event(self, data):
+        choices = data.get("choices") or []
+        if not choices:
+            return None
+        return choices[0].get("delta", {}).get("content")
+
+
+class StubClient(OpenAIClient):
+    """本地桩服务客户端,协议与OpenAI相同"""
+
+    provider = "stub"
+
+    def __init__(self, settings: AIAPIConfig, model: str, **kwargs):
+        super().__init__(settings, model, api_base=f"{settings.stub_api_base.rstrip('/')}/v1",
+                         api_key="", **kwargs)
+
+
+class AzureOpenAIClient(OpenAIClient):
+    """Azure OpenAI 客户端"""
+
+    provider = "azure"
+
+    def build_request(self, messages, params, stream):
+        settings = self.settings
+        url = (f"{settings.azure_api_base.rstrip('/')}/openai/deployments/"
+               f"{settings.azure_deployment_name}/chat/completions?api-version={settings.azure_api_version}")
+        headers = {"Content-Type": "application/json", "api-key": settings.azure_api_key}
+        payload = {"messages": messages, "stream": stream}
+        payload.update(self._common_params(params))
+        return url, headers, payload
+
+
+class AnthropicClient(BaseLLMClient):
+    """Anthropic Messages 客户端"""
+
+    provider = "anthropic"
+    API_VERSION = "2023-06-01"
+
+    def build_request(self, messages, params, stream):
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.settings.anthropic_api_key,
+            "anthropic-version": self.API_VERSION,
+        }
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": [m for m in messages if m["role"] != "system"],
+            "stream": stream,
+            "max_tokens": self.max_tokens or 1024,
+        }
+        if system:
+            payload["system"] = system
+        payload.update(self._common_params(params))
+        return f"{self.settings.anthropic_api_base.rstrip('/')}/v1/messages", headers, payload
+
+    def parse_response(self, data):
+        return "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+
+    def parse_stream_event(self, data):
+        if data.get("type") == "content_block_delta":
+            return data.get("delta", {}).get("text")
+        return None
+
+
+_CLIENTS = {
+    "openai": OpenAIClient,
+    "azure": AzureOpenAIClient,
+    "anthropic": AnthropicClient,
+    "stub": StubClient,
+}
+
+
+def create_llm_client(config: Config) -> Optional[BaseLLMClient]:
+    """按配置创建模型客户端,未配置凭据时返回None
+
+    Args:
+        config: 全局配置,使用 model_type、model_name、temperature 和 ai_api
+
+    Returns:
+        Optional[BaseLLMClient]: 模型客户端
+    """
+    settings = config.ai_api
+    provider = config.model_type
+    if provider not in _CLIENTS:
+        raise ValueError(f"不支持的模型服务商: {provider}")
+    credentials = {
+        "openai": settings.openai_api_key or config.api_key,
+        "azure": settings.azure_api_key,
+        "anthropic": settings.anthropic_api_key,
+        "stub": "stub",
+    }
+    if not credentials[provider]:
+        return None
+    kwargs: Dict[str, Any] = {"temperature": config.temperature, "max_tokens": config.max_output_tokens}
+    if provider == "openai":
+        kwargs["api_key"] = credentials["openai"]
+    return _CLIENTS[provider](settings, config.model_name, **kwargs)
@@ -0,0 +1,183 @@
+"""
+本地模型桩服务
+
+模拟 OpenAI、Azure OpenAI 和 Anthropic 的对话接口(支持流式),用于测试和压测,
+可配置首包延迟、逐词延迟和失败率。回复内容为确定性的回显。
+
+用法:
+    python -m src.models.stub_server --port 8765 --latency 0.2 --token-delay 0.01
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+class StubServer:
+    """模型桩服务
+
+    可作为异步上下文管理器在测试中启动:
+
+        async with StubServer(port=0) as stub:
+            config.ai_api.stub_api_base = stub.url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, latency: float = 0.0,
+                 token_delay: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口,0表示随机端口
+            latency: 首包延迟(秒)
+            token_delay: 流式输出时每个词之间的延迟(秒)
+            failure_rate: 返回503的概率
+            seed: 随机种子
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.aborted = 0
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self._openai)
+        self.app.router.add_post("/openai/deployments/{deployment}/chat/completions", self._openai)
+        self.app.router.add_post("/v1/messages", self._anthropic)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "StubServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    @staticmethod
+    def reply_for(messages: List[Dict[str, Any]]) -> str:
+        """根据最后一条用户消息生成确定性回复"""
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        return f"收到输入: {last}"
+
+    async def _prepare(self, request: web.Request) -> Optional[web.Response]:
+        """统计请求、模拟延迟和失败"""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            return web.json_response({"error": {"message": "stub failure"}}, status=503,
+                                     headers={"Retry-After": "0"})
+        return None
+
+    async def _stream(self, request: web.Request, events: List[Dict[str, Any]], done: bool) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        try:
+            await response.prepare(request)
+            for event in events:
+                await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            if done:
+                await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # 客户端取消请求时会中途关闭连接
+            self.aborted += 1
+        return response
+
+    async def _openai(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        failure = await self._prepare(request)
+        if failure is not None:
+            return failure
+        text = self.reply_for(body.get("messages", []))
+        model = body.get("model", request.match_info.get("deployment", "stub"))
+        if not body.get("stream"):
+            return web.json_response({
+                "id": f"chatcmpl-stub-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+            })
+        events = [{"choices": [{"index": 0, "delta": {"content": token}}]} for token in _tokens(text)]
+        events.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        return await self._stream(request, events, done=True)
+
+    async def _anthropic(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        failure = await self._prepare(request)
+        if failure is not None:
+            return failure
+        text = self.reply_for(body.get("messages", []))
+        if not body.get("stream"):
+            return web.json_response({
+                "id": f"msg_stub_{self.requests}",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model", "stub"),
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+            })
+        events: List[Dict[str, Any]] = [{"type": "message_start"},
+                                        {"type": "content_block_start", "index": 0}]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}
+                   for token in _tokens(text)]
+        events += [{"type": "content_block_stop", "index": 0}, {"type": "message_stop"}]
+        return await self._stream(request, events, done=False)
+
+
+def _tokens(text: str) -> List[str]:
+    """按空格切分并保留空格,无空格时按字符切分"""
+    if " " not in text:
+        return list(text)
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + [words[-1]]
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    async with StubServer(args.host, args.port, args.latency, args.token_delay, args.failure_rate) as stub:
+        print(f"模型桩服务已启动: {stub.url}")
+        await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模型桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="首包延迟(秒)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="每个词的流式延迟(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回503的概率")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
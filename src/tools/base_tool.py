@@ -1,15 +1,95 @@
 import asyncio
+import inspect
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from contextlib import aclosing
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Union
+import aiohttp
 from pydantic import BaseModel, Field
+from src.core.config import Config
+from src.core.http import create_session
+from src.core.logger import LogConfig
+from .executor import ToolBudget, ToolCall, ToolExecutor, ToolResult
+from .process_pool import ToolProcessPool, tool_target
+from .streaming import OutputLimiter, ToolOutput
+
+logger = LogConfig.get_instance().get_logger("tools", "tools.log")
 
 class MCPTool(ABC):
-    """MCP工具基类"""
+    """MCP工具基类
+    
+    HTTP请求使用 ToolManager 提供的共享连接池会话,连接在调用之间复用;
+    未绑定管理器时使用工具自己的会话,需调用 close 关闭。
+    注册到 ToolManager 时由 MCPToolAdapter 包装,parameters/required/idempotent 用于生成工具描述
+    """
     
-    def __init__(self, name: str, description: str, mcp_config: Dict[str, Any]):
+    parameters: Dict[str, Any] = {}
+    required: List[str] = []
+    idempotent: bool = False
+    
+    def __init__(self, name: str, description: str, mcp_config: Dict[str, Any],
+                 manager: Optional["ToolManager"] = None):
         self.name = name
         self.description = description
         self.mcp_config = mcp_config
+        self.manager = manager
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+    def get_session(self) -> aiohttp.ClientSession:
+        """获取HTTP会话"""
+        if self.manager is not None:
+            return self.manager.get_session()
+        if self._session is None or self._session.closed:
+            self._session = create_session(timeout=self.mcp_config.get('timeout'))
+        return self._session
+        
+    async def post_json(self, path: str, params: Dict[str, Any]) -> Any:
+        """向MCP服务发送POST请求并返回JSON结果
+        
+        Args:
+            path: 相对于 base_url 的路径
+            params: 请求体
+            
+        Raises:
+            Exception: 服务返回非200状态
+        """
+        url = f"{self.mcp_config['base_url']}{path}"
+        kwargs = {}
+        if self.mcp_config.get('timeout'):
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=self.mcp_config['timeout'])
+        async with self.get_session().post(url, json=params, **kwargs) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(f"API call failed: {await response.text()}")
+                
+    async def post_stream(self, path: str, params: Dict[str, Any], chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        """向MCP服务发送POST请求,按块产出响应体
+        
+        响应体边接收边产出,不在内存中拼接;提前关闭迭代器时释放(断开)该连接。
+        
+        Raises:
+            Exception: 服务返回非200状态
+        """
+        url = f"{self.mcp_config['base_url']}{path}"
+        kwargs = {}
+        if self.mcp_config.get('timeout'):
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=self.mcp_config['timeout'])
+        async with self.get_session().post(url, json=params, **kwargs) as response:
+            if response.status != 200:
+                raise Exception(f"API call failed: {await response.text()}")
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+                
+    async def stream_mcp_api(self, params: Dict[str, Any]) -> AsyncIterator[Any]:
+        """流式调用MCP API,默认把 call_mcp_api 的结果作为一个分块产出"""
+        yield await self.call_mcp_api(params)
+                
+    async def close(self) -> None:
+        """关闭工具自己的会话,共享会话由 ToolManager 关闭"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     @abstractmethod
     async def validate_params(self, params: Dict[str, Any]) -> bool:
@@ -27,6 +107,10 @@ class ToolDescription(BaseModel):
     description: str = Field(..., description="工具功能描述")
     parameters: Dict[str, Any] = Field(default={}, description="工具参数描述")
     required: List[str] = Field(default=[], description="必需参数列表")
+    idempotent: bool = Field(default=False, description="相同参数总是返回相同结果且没有副作用,可以缓存和合并调用")
+    timeout: Optional[float] = Field(default=None, description="执行超时(秒),默认使用tools.timeout")
+    cache_ttl: Optional[float] = Field(default=None, description="结果缓存时间(秒),默认使用tools.cache_ttl")
+    execution: str = Field(default="inline", description="执行方式: inline(事件循环中), thread(线程中), process(工作进程中,用于CPU密集或阻塞的工具)")
 
 class BaseTool(ABC):
     """工具基类"""
@@ -44,6 +128,13 @@ class BaseTool(ABC):
         """执行工具功能"""
         pass
         
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        """流式执行工具,逐块产出输出(str、bytes 或可JSON序列化的对象)
+        
+        输出可能很大的工具应覆盖此方法,默认把 execute 的结果作为一个分块产出
+        """
+        yield await self.execute(**kwargs)
+        
     def validate_params(self, params: Dict[str, Any]) -> bool:
         """验证参数"""
         # 检查必需参数
@@ -54,35 +145,141 @@ class BaseTool(ABC):
         return True
         
 class ToolManager:
-    """工具管理器"""
+    """工具管理器
     
-    def __init__(self, config=None):
+    工具调用经 ToolExecutor 执行: 并发上限、超时、每轮调用预算、幂等工具的结果缓存和在途合并。
+    MCP工具共享管理器的HTTP连接池会话,会话在 cleanup 时关闭;
+    execution 为 thread 的工具在工作线程持久的事件循环中执行,使用该循环专用的会话,
+    同一线程上的调用复用该会话的连接池。
+    execution 为 process 的工具在 ToolProcessPool 的工作进程中执行。
+    输出可能很大的工具用 stream_tool/collect_tool 流式消费,读取时即按 tools.stream 的限制截断。
+    """
+    
+    def __init__(self, config: Optional[Config] = None):
         self.tools: Dict[str, BaseTool] = {}
-        self.config = config
+        self.config = config or Config()
+        self.executor = ToolExecutor(
+            self,
+            max_concurrency=self.config.tool_max_concurrency,
+            timeout=self.config.tool_timeout,
+            max_calls=self.config.max_tool_calls,
+            cache_size=self.config.tool_cache_size,
+            cache_ttl=self.config.tool_cache_ttl
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 共享会话所属的事件循环
+        self._loop_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._thread_state = threading.local()  # 工作线程各自的事件循环
+        self._thread_loops: Dict[asyncio.AbstractEventLoop, threading.Lock] = {}  # 事件循环 -> 运行锁
+        self.registry = None
+        self.process_pool = ToolProcessPool(
+            workers=self.config.tool_process_workers,
+            memory_limit_mb=self.config.tool_process_memory_mb,
+            shm_threshold=self.config.tool_shm_threshold
+        )
         
     async def init(self):
-        """初始化工具管理器"""
-        # TODO: 动态加载工具
-        pass
+        """初始化工具管理器: 从配置和入口点发现工具并注册为延迟加载的工具"""
+        self._loop = asyncio.get_running_loop()
+        from .registry import ToolRegistry
+        self.registry = ToolRegistry(
+            self,
+            definitions=self.config.tool_definitions,
+            use_entry_points=self.config.tool_entry_points,
+            cache_path=self.config.tool_schema_cache or None
+        )
+        await self.registry.load_all()
+        # 有进程模式的工具时预先启动工作进程并导入这些工具
+        process_tools = [tool_target(tool) for tool in self.tools.values()
+                         if tool.get_description().execution == "process"]
+        if process_tools:
+            await self.process_pool.start(preload=process_tools)
         
     async def cleanup(self):
         """清理工具管理器"""
         self.tools.clear()
+        self.executor.invalidate()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        # 工作线程的事件循环此时空闲,在其中关闭各自的会话后关闭循环
+        for loop, lock in list(self._thread_loops.items()):
+            await asyncio.to_thread(self._close_thread_loop, loop, lock)
+        self._thread_loops.clear()
+        self._thread_state = threading.local()
+        await self.process_pool.stop()
+            
+    def get_session(self) -> aiohttp.ClientSession:
+        """MCP工具共享的HTTP会话,首次使用时在当前事件循环中创建
+        
+        会话只能在创建它的事件循环中使用: 在其他事件循环(thread 方式执行的工具)中
+        返回该循环专用的会话,在 cleanup 时关闭
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        if loop is not self._loop:
+            session = self._loop_sessions.get(loop)
+            if session is None or session.closed:
+                session = self._loop_sessions[loop] = self._create_session()
+            return session
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+        
+    def run_in_thread_loop(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """在当前工作线程持久的事件循环中运行协程,在工作线程中调用
+        
+        每个线程首次调用时创建事件循环并在之后的调用中复用,该循环专用的HTTP会话
+        因此在调用之间保持连接,而不是每次调用新建循环和会话
+        """
+        loop = getattr(self._thread_state, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = self._thread_state.loop = asyncio.new_event_loop()
+            self._thread_loops[loop] = threading.Lock()
+        with self._thread_loops[loop]:
+            return loop.run_until_complete(factory())
+            
+    def _close_thread_loop(self, loop: asyncio.AbstractEventLoop, lock: threading.Lock) -> None:
+        """关闭工作线程的事件循环及其会话,循环正被仍在执行的调用占用时放弃"""
+        if not lock.acquire(timeout=self.config.tool_timeout or 5.0):
+            logger.warning("线程中的工具调用仍在执行,未关闭其事件循环")
+            return
+        try:
+            session = self._loop_sessions.pop(loop, None)
+            if session is not None:
+                loop.run_until_complete(session.close())
+            loop.close()
+        finally:
+            lock.release()
+            
+    def _create_session(self) -> aiohttp.ClientSession:
+        return create_session(
+            limit=self.config.tool_http_max_connections,
+            limit_per_host=self.config.tool_http_limit_per_host,
+            ttl_dns_cache=self.config.tool_http_dns_cache_ttl or None,
+            keepalive_timeout=self.config.tool_http_keepalive_timeout,
+            timeout=self.config.tool_timeout or None,
+            connect_timeout=self.config.tool_http_connect_timeout or None
+        )
         
     def register_tool(self, tool: BaseTool):
         """注册工具"""
         self.tools[tool.get_description().name] = tool
+        self.executor.invalidate()
         
     def unregister_tool(self, tool_name: str):
         """注销工具"""
         if tool_name in self.tools:
             del self.tools[tool_name]
+            self.executor.invalidate()
             
-    async def execute_tool(self, tool_name: str, **params) -> Any:
+    async def execute_tool(self, tool_name: str, budget: Optional[ToolBudget] = None, **params) -> Any:
         """执行工具
         
         Args:
             tool_name: 工具名称
+            budget: 本轮的调用预算,None表示不计入预算
             params: 工具参数
             
         Returns:
@@ -90,17 +287,77 @@ class ToolManager:
             
         Raises:
             ValueError: 工具不存在或参数无效
+            ToolBudgetExceeded: 本轮调用次数已用完
+            ToolTimeout: 执行超时
         """
-        if tool_name not in self.tools:
-            raise ValueError(f"工具不存在: {tool_name}")
+        return await self.executor.execute(tool_name, params, budget)
+        
+    async def execute_tools(self, calls: List[ToolCall], budget: Optional[ToolBudget] = None) -> List[ToolResult]:
+        """并发执行一轮中相互独立的多个工具调用
+        
+        Args:
+            calls: 工具调用列表
+            budget: 本轮的调用预算,默认按 tools.max_calls 新建;多步调用时传入同一个预算
             
-        tool = self.tools[tool_name]
+        Returns:
+            List[ToolResult]: 与调用一一对应的结果,失败的调用带有错误信息
+        """
+        return await self.executor.execute_many(calls, budget)
+        
+    def stream_tool(self, tool_name: str, budget: Optional[ToolBudget] = None, **params) -> AsyncIterator[Any]:
+        """流式执行工具,返回工具输出分块的异步迭代器(未截断)
+        
+        调用方应读完或关闭(aclose)迭代器;需要限制输出大小时使用 collect_tool
+        
+        Raises:
+            ValueError: 工具不存在或参数无效
+            ToolBudgetExceeded: 本轮调用次数已用完
+            ToolTimeout: 执行超时
+        """
+        return self.executor.stream(tool_name, params, budget)
+        
+    async def collect_tool(self, tool_name: str, budget: Optional[ToolBudget] = None,
+                           on_chunk: Optional[Callable[[str], Union[None, Awaitable[None]]]] = None,
+                           **params) -> ToolOutput:
+        """流式执行工具并在读取时截断输出
+        
+        只保留输出的开头和结尾(tools.stream.max_chars),读取量超过 tools.stream.max_read 时
+        停止读取并关闭工具的输出流。
         
-        # 验证参数
-        tool.validate_params(params)
+        Args:
+            tool_name: 工具名称
+            budget: 本轮的调用预算,None表示不计入预算
+            on_chunk: 部分输出回调(可为协程函数),收到保留在开头部分的文本时调用,用于向用户展示
+            params: 工具参数
+            
+        Returns:
+            ToolOutput: 截断后的输出
+            
+        Raises:
+            ValueError: 工具不存在或参数无效
+            ToolBudgetExceeded: 本轮调用次数已用完
+            ToolTimeout: 执行超时
+        """
+        limiter = OutputLimiter(
+            tool_name,
+            max_chars=self.config.tool_stream_max_chars,
+            tail_chars=self.config.tool_stream_tail_chars,
+            max_read=self.config.tool_stream_max_read
+        )
+        async with aclosing(self.executor.stream(tool_name, params, budget)) as chunks:
+            async for chunk in chunks:
+                text = limiter.feed(chunk)
+                if text and on_chunk is not None:
+                    result = on_chunk(text)
+                    if inspect.isawaitable(result):
+                        await result
+                if limiter.exhausted:
+                    break
+        return limiter.finish()
         
-        # 执行工具
-        return await tool.execute(**params)
+    def stats(self) -> Dict[str, Any]:
+        """工具执行统计"""
+        return self.executor.stats()
         
     def get_tool_description(self, tool_name: str) -> Optional[ToolDescription]:
         """获取工具描述"""
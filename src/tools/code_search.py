@@ -1,29 +1,33 @@
-from typing import Dict, Any
-import aiohttp
-from .base_tool import MCPTool
+from typing import Dict, Any, AsyncIterator, Optional
+from .base_tool import MCPTool, ToolManager
 
 class CodeSearchTool(MCPTool):
     """代码搜索工具"""
     
-    def __init__(self, config: Dict[str, Any]):
+    parameters = {
+        "query": {"type": "string", "description": "搜索内容"},
+        "languages": {"type": "array", "items": {"type": "string"}, "description": "限定的编程语言"}
+    }
+    required = ['query', 'languages']
+    idempotent = True
+    
+    def __init__(self, config: Dict[str, Any], manager: Optional[ToolManager] = None):
         super().__init__(
             name="code_search",
             description="搜索代码库中的相关代码",
-            mcp_config=config
+            mcp_config=config,
+            manager=manager
         )
         
     async def validate_params(self, params: Dict[str, Any]) -> bool:
         """验证参数"""
-        required = ['query', 'languages']
-        return all(key in params for key in required)
+        return all(key in params for key in self.required)
         
     async def call_mcp_api(self, params: Dict[str, Any]) -> Any:
         """调用代码搜索API"""
-        url = f"{self.mcp_config['base_url']}/search/code"
+        return await self.post_json("/search/code", params)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=params) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"API call failed: {await response.text()}")
\ No newline at end of file
+    async def stream_mcp_api(self, params: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """流式调用代码搜索API,按块产出原始响应体"""
+        async for chunk in self.post_stream("/search/code", params):
+            yield chunk
\ No newline at end of file
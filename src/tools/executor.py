@@ -0,0 +1,288 @@
+"""
+工具执行引擎
+
+同一轮次中相互独立的工具调用并发执行,所有轮次共享一个并发上限;每次调用有超时,
+每轮的调用次数有预算。标记为幂等的工具按(工具名, 规范化参数)缓存结果,
+参数相同的在途调用合并为一次执行。当前轮次的取消令牌被取消时中止等待中的调用。
+流式调用(stream)逐块产出工具输出,同样受并发上限、超时、预算和取消的约束,但不缓存。
+"""
+
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from src.core.cache import LRUCache
+from src.core.cancellation import OperationCancelled, cancellable, check_cancelled
+from src.core.logger import LogConfig
+from src.core.tracing import tracer
+
+logger = LogConfig.get_instance().get_logger("tools", "tools.log")
+
+_MISSING = object()
+
+
+class ToolBudgetExceeded(RuntimeError):
+    """本轮的工具调用次数已用完"""
+
+
+class ToolTimeout(TimeoutError):
+    """工具执行超时"""
+
+
+@dataclass
+class ToolCall:
+    """一次工具调用请求"""
+    name: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    id: Optional[str] = None
+
+
+@dataclass
+class ToolResult:
+    """工具调用结果,出错时 error 为错误信息"""
+    call: ToolCall
+    result: Any = None
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ToolBudget:
+    """一轮对话的工具调用预算"""
+
+    def __init__(self, max_calls: int):
+        """
+        Args:
+            max_calls: 最多调用次数,0表示不限制
+        """
+        self.max_calls = max_calls
+        self.used = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return max(0, self.max_calls - self.used) if self.max_calls else None
+
+    def consume(self) -> None:
+        """
+        Raises:
+            ToolBudgetExceeded: 预算已用完
+        """
+        if self.max_calls and self.used >= self.max_calls:
+            raise ToolBudgetExceeded(f"本轮工具调用次数已达上限 {self.max_calls}")
+        self.used += 1
+
+
+def canonical_params(params: Dict[str, Any]) -> str:
+    """参数的规范形式: 键排序、无多余空白,相同语义的参数得到相同字符串"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class _InflightCall:
+    """被合并的在途调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class ToolExecutor:
+    """工具执行器"""
+
+    def __init__(self, manager: Any, max_concurrency: int = 8, timeout: float = 30.0,
+                 max_calls: int = 5, cache_size: int = 256, cache_ttl: float = 300.0):
+        """
+        Args:
+            manager: 提供已注册工具的 ToolManager
+            max_concurrency: 同时执行的工具调用数(所有轮次共享)
+            timeout: 默认超时(秒),工具描述中的 timeout 优先,0表示不限制
+            max_calls: 每轮最多调用次数,0表示不限制
+            cache_size: 幂等工具结果缓存条目数,0表示不缓存
+            cache_ttl: 缓存过期时间(秒),工具描述中的 cache_ttl 优先
+        """
+        self.manager = manager
+        self.timeout = timeout
+        self.max_calls = max_calls
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._cache = LRUCache(cache_size, cache_ttl)
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._stats = {"calls": 0, "executed": 0, "streamed": 0, "cached": 0, "coalesced": 0,
+                       "timeouts": 0, "errors": 0}
+
+    def budget(self) -> ToolBudget:
+        """创建一轮对话的调用预算"""
+        return ToolBudget(self.max_calls)
+
+    async def execute(self, name: str, params: Dict[str, Any], budget: Optional[ToolBudget] = None) -> Any:
+        """执行一次工具调用
+
+        Raises:
+            ValueError: 工具不存在或参数无效
+            ToolBudgetExceeded: 本轮调用次数已用完
+            ToolTimeout: 执行超时
+            OperationCancelled: 当前轮次已取消
+        """
+        result, _ = await cancellable(self._execute(name, params, budget))
+        return result
+
+    async def execute_many(self, calls: Sequence[ToolCall], budget: Optional[ToolBudget] = None) -> List[ToolResult]:
+        """并发执行一轮中相互独立的多个调用,结果与调用一一对应
+
+        单个调用失败不影响其他调用,错误记录在对应结果中;超出预算的调用直接返回错误。
+        当前轮次被取消时中止所有调用并抛出 OperationCancelled
+        """
+        budget = budget if budget is not None else self.budget()
+        return list(await asyncio.gather(*(self._execute_one(call, budget) for call in calls)))
+
+    async def stream(self, name: str, params: Dict[str, Any],
+                     budget: Optional[ToolBudget] = None) -> AsyncIterator[Any]:
+        """流式执行一次工具调用,逐块产出工具输出
+
+        超时按整个调用计算;执行期间占用一个并发名额,调用方应读完或关闭(aclose)迭代器。
+        提前关闭时工具的迭代器随之关闭。thread/process 方式的工具整体执行后作为一个分块产出
+
+        Raises:
+            ValueError: 工具不存在或参数无效
+            ToolBudgetExceeded: 本轮调用次数已用完
+            ToolTimeout: 执行超时
+            OperationCancelled: 当前轮次已取消
+        """
+        check_cancelled()
+        tool = self.manager.tools.get(name)
+        if tool is None:
+            raise ValueError(f"工具不存在: {name}")
+        description = tool.get_description()
+        tool.validate_params(params)
+        if budget is not None:
+            budget.consume()
+        self._stats["calls"] += 1
+        if description.execution != "inline":
+            yield await cancellable(self._run(tool, name, params, description.timeout))
+            return
+
+        timeout = self.timeout if description.timeout is None else description.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        async with self._semaphore:
+            self._stats["executed"] += 1
+            self._stats["streamed"] += 1
+            with tracer.span("tool.stream", tool=name):
+                chunks = tool.stream(**params).__aiter__()
+                try:
+                    while True:
+                        remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                        try:
+                            chunk = await cancellable(asyncio.wait_for(chunks.__anext__(), remaining))
+                        except StopAsyncIteration:
+                            return
+                        except asyncio.TimeoutError:
+                            self._stats["timeouts"] += 1
+                            logger.warning(f"工具 {name} 执行超时({timeout}s)")
+                            raise ToolTimeout(f"工具 {name} 执行超时({timeout}s)") from None
+                        except OperationCancelled:
+                            raise
+                        except Exception:
+                            self._stats["errors"] += 1
+                            raise
+                        yield chunk
+                finally:
+                    aclose = getattr(chunks, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+
+    def invalidate(self) -> None:
+        """清空结果缓存(工具注册变化时调用)"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "inflight": len(self._inflight), "cache": self._cache.stats()}
+
+    async def _execute(self, name: str, params: Dict[str, Any],
+                       budget: Optional[ToolBudget]) -> Tuple[Any, bool]:
+        """执行一次调用,返回(结果, 是否来自缓存)"""
+        check_cancelled()
+        tool = self.manager.tools.get(name)
+        if tool is None:
+            raise ValueError(f"工具不存在: {name}")
+        description = tool.get_description()
+        tool.validate_params(params)
+        if budget is not None:
+            budget.consume()
+        self._stats["calls"] += 1
+
+        if not description.idempotent:
+            return await self._run(tool, name, params, description.timeout), False
+
+        key = f"{name}:{canonical_params(params)}"
+        cached = self._cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            self._stats["cached"] += 1
+            return cached, True
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.create_task(self._run(tool, name, params, description.timeout))
+            entry = _InflightCall(task)
+            self._inflight[key] = entry
+            task.add_done_callback(lambda t: self._finish(key, t, description.cache_ttl))
+        else:
+            self._stats["coalesced"] += 1
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task), False
+        except asyncio.CancelledError:
+            # 所有等待方都取消时才取消底层调用
+            if entry.waiters == 1:
+                entry.task.cancel()
+            raise
+        finally:
+            entry.waiters -= 1
+
+    async def _execute_one(self, call: ToolCall, budget: ToolBudget) -> ToolResult:
+        started = time.perf_counter()
+        try:
+            result, cached = await cancellable(self._execute(call.name, call.params, budget))
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            return ToolResult(call, error=f"{type(e).__name__}: {e}",
+                              elapsed_ms=(time.perf_counter() - started) * 1000)
+        return ToolResult(call, result=result, elapsed_ms=(time.perf_counter() - started) * 1000, cached=cached)
+
+    async def _run(self, tool: Any, name: str, params: Dict[str, Any], timeout: Optional[float]) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        execution = tool.get_description().execution
+        async with self._semaphore:
+            self._stats["executed"] += 1
+            with tracer.span("tool.execute", tool=name, execution=execution):
+                try:
+                    return await asyncio.wait_for(self._dispatch(tool, execution, params, timeout), timeout or None)
+                except asyncio.TimeoutError:
+                    self._stats["timeouts"] += 1
+                    logger.warning(f"工具 {name} 执行超时({timeout}s)")
+                    raise ToolTimeout(f"工具 {name} 执行超时({timeout}s)") from None
+                except Exception:
+                    self._stats["errors"] += 1
+                    raise
+
+    async def _dispatch(self, tool: Any, execution: str, params: Dict[str, Any], timeout: Optional[float]) -> Any:
+        """按工具声明的执行方式执行"""
+        if execution == "process":
+            # 进程池自行处理超时: 杀掉并替换执行超时的工作进程
+            return await self.manager.process_pool.run(tool, params, timeout)
+        if execution == "thread":
+            # 延迟加载的工具先在事件循环中完成加载,线程中只运行工具本身(超时后线程无法中止)
+            if hasattr(tool, "load"):
+                tool = await tool.load()
+            return await asyncio.to_thread(self.manager.run_in_thread_loop, lambda: tool.execute(**params))
+        return await tool.execute(**params)
+
+    def _finish(self, key: str, task: asyncio.Task, ttl: Optional[float]) -> None:
+        """在途调用完成: 移出合并表,成功时写入缓存"""
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._cache.set(key, task.result(), ttl)
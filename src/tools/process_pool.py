@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""工具进程池
+
+ToolDescription.execution 为 "process" 的工具(CPU密集或阻塞的工具)在常驻的工作进程中执行,
+事件循环只等待结果,消息总线和API不受工具行为影响:
+
+- 工作进程启动后常驻,并预先导入工具模块,调用时不再付出进程启动和导入的开销
+- 每个调用独占一个工作进程;超时或调用方取消时直接杀掉该进程并补充新进程
+- 工作进程设置地址空间上限(RLIMIT_AS),超限时工具得到 MemoryError 而不会拖垮主进程
+- 较大的 bytes 和 numpy 数组结果通过共享内存传回,只复制一次而不是经管道序列化
+
+工作进程以 spawn 方式创建,工具按 "模块路径:类名" 在进程内重新创建:
+延迟加载的工具使用其定义,其余工具需要可以无参数构造。
+"""
+
+import json
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .executor import ToolTimeout
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("tools", "tools.log")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class ToolWorkerCrashed(RuntimeError):
+    """工作进程在执行中退出(例如被系统杀掉)"""
+
+
+@dataclass
+class _SharedRef:
+    """放在共享内存中的结果"""
+    name: str
+    size: int
+    kind: str  # bytes 或 ndarray
+    dtype: str = ""
+    shape: Tuple[int, ...] = ()
+
+
+def tool_target(tool: Any) -> Tuple[str, Dict[str, Any]]:
+    """工具在工作进程中的创建方式: ("模块路径:类名", 构造参数)"""
+    spec = getattr(tool, "spec", None)
+    if spec is not None:
+        return spec.target, spec.options
+    cls = type(tool)
+    return f"{cls.__module__}:{cls.__qualname__}", {}
+
+
+class _Worker:
+    """一个工作进程及其管道,收发在池的线程中进行"""
+
+    def __init__(self, context: Any, memory_limit: int, shm_threshold: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, memory_limit, shm_threshold), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.calls = 0
+        self.cancelled = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def request(self, message: Tuple, timeout: Optional[float]) -> Any:
+        """发送请求并等待结果,超时时杀掉进程
+
+        Raises:
+            ToolTimeout: 超时
+            ToolWorkerCrashed: 进程退出
+            RuntimeError: 工具执行出错
+        """
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                self.kill()
+                raise ToolTimeout(f"工具执行超时({timeout}s),已终止工作进程")
+            status, payload = self.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            self.kill()
+            raise ToolWorkerCrashed(f"工作进程已退出,退出码 {self.process.exitcode}") from None
+        self.calls += 1
+        if status == "error":
+            raise RuntimeError(payload)
+        return _unpack(payload)
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class ToolProcessPool:
+    """常驻工作进程池"""
+
+    def __init__(self, workers: int = 2, memory_limit_mb: int = 1024, shm_threshold: int = 65536):
+        """
+        Args:
+            workers: 工作进程数,即同时执行的进程模式调用数
+            memory_limit_mb: 每个工作进程的地址空间上限(MB),0表示不限制(Windows上不生效)
+            shm_threshold: 结果中不小于该字节数的 bytes/数组通过共享内存传回
+        """
+        self.size = max(1, workers)
+        self.memory_limit = memory_limit_mb * 2 ** 20
+        self.shm_threshold = shm_threshold
+        self._context = multiprocessing.get_context("spawn")
+        self._threads = ThreadPoolExecutor(self.size, thread_name_prefix="tool-pool")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+        self._preload: List[Tuple[str, Dict[str, Any]]] = []
+        self._start_lock = asyncio.Lock()
+        # killed: 因超时或取消被杀掉的进程数; crashes: 自行退出的进程数
+        self._stats = {"calls": 0, "killed": 0, "crashes": 0, "replaced": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def start(self, preload: Sequence[Tuple[str, Dict[str, Any]]] = ()) -> None:
+        """启动工作进程并预先导入工具
+
+        Args:
+            preload: 需要预先创建的工具 ("模块路径:类名", 构造参数)
+        """
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            self._preload = list(preload)
+            loop = asyncio.get_running_loop()
+            workers = await asyncio.gather(*(
+                loop.run_in_executor(self._threads, self._spawn) for _ in range(self.size)
+            ))
+            self._workers = list(workers)
+            self._idle = asyncio.Queue()
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            logger.info(f"工具进程池已启动: {self.size} 个工作进程, 预加载 {len(self._preload)} 个工具")
+
+    async def stop(self) -> None:
+        if self._idle is None:
+            return
+        workers, self._workers, self._idle = self._workers, [], None
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._threads, w.stop) for w in workers))
+
+    async def run(self, tool: Any, params: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """在工作进程中执行工具
+
+        Raises:
+            ToolTimeout: 超时,执行该调用的进程已被替换
+            ToolWorkerCrashed: 工作进程在执行中退出
+            RuntimeError: 工具执行出错
+        """
+        await self.start()
+        target, options = tool_target(tool)
+        worker = await self._idle.get()
+        self._stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._threads, worker.request, ("call", target, options, params), timeout or None
+        )
+        future.add_done_callback(lambda f: self._recycle(worker, f))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 调用方取消: 杀掉进程以停止工具,线程随即返回并补充新进程
+            worker.cancelled = True
+            worker.process.kill()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+        }
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_limit, self.shm_threshold)
+        for target, options in self._preload:
+            try:
+                worker.request(("load", target, options, None), None)
+            except Exception as e:
+                logger.error(f"工作进程预加载工具 {target} 失败: {e}")
+        return worker
+
+    def _recycle(self, worker: _Worker, future: asyncio.Future) -> None:
+        """调用结束: 进程正常时放回空闲队列,否则替换"""
+        if self._idle is None or worker not in self._workers:
+            return
+        if worker.alive:
+            self._idle.put_nowait(worker)
+            return
+        error = None if future.cancelled() else future.exception()
+        if worker.cancelled or isinstance(error, ToolTimeout):
+            self._stats["killed"] += 1
+        else:
+            self._stats["crashes"] += 1
+            logger.warning(f"工具工作进程异常退出: {error}")
+        asyncio.get_running_loop().create_task(self._replace(worker))
+
+    async def _replace(self, worker: _Worker) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            replacement = await loop.run_in_executor(self._threads, self._spawn)
+        except Exception as e:
+            logger.error(f"创建工具工作进程失败: {e}")
+            return
+        if self._idle is None or worker not in self._workers:
+            replacement.stop()
+            return
+        self._workers[self._workers.index(worker)] = replacement
+        self._stats["replaced"] += 1
+        self._idle.put_nowait(replacement)
+
+
+def _worker_main(conn: Any, memory_limit: int, shm_threshold: int) -> None:
+    """工作进程主循环"""
+    from .registry import ToolRegistry, ToolSpec
+
+    if memory_limit and resource is not None:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass
+    registry = ToolRegistry(None, use_entry_points=False)
+    loop = asyncio.new_event_loop()
+    tools: Dict[str, Any] = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        kind, target, options, params = message
+        try:
+            key = f"{target}:{json.dumps(options, sort_keys=True, default=str)}"
+            tool = tools.get(key)
+            if tool is None:
+                tool = tools[key] = registry.instantiate(ToolSpec(target, target, options))
+            if kind == "load":
+                conn.send(("ok", None))
+                continue
+            result = loop.run_until_complete(tool.execute(**params))
+            conn.send(("ok", _pack(result, shm_threshold)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _pack(value: Any, threshold: int) -> Any:
+    """把较大的 bytes/数组放入共享内存,由主进程读取后释放"""
+    if isinstance(value, (bytes, bytearray, memoryview)) and len(value) >= threshold:
+        data = memoryview(value).cast("B")
+        shm = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+        shm.buf[:data.nbytes] = data
+        ref = _SharedRef(shm.name, data.nbytes, "bytes")
+        shm.close()
+        return ref
+    if isinstance(value, np.ndarray) and value.nbytes >= threshold and value.dtype != object:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, value.nbytes))
+        np.ndarray(value.shape, value.dtype, buffer=shm.buf)[...] = value
+        ref = _SharedRef(shm.name, value.nbytes, "ndarray", value.dtype.str, value.shape)
+        shm.close()
+        return ref
+    if isinstance(value, dict):
+        return {k: _pack(v, threshold) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_pack(v, threshold) for v in value)
+    return value
+
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, _SharedRef):
+        shm = shared_memory.SharedMemory(name=value.name)
+        try:
+            if value.kind == "bytes":
+                return bytes(shm.buf[:value.size])
+            return np.ndarray(value.shape, np.dtype(value.dtype), buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    if isinstance(value, dict):
+        return {k: _unpack(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unpack(v) for v in value)
+    return value
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""工具注册表: 发现、延迟加载和描述缓存
+
+工具来自两处,同名时配置优先:
+
+    # 配置 tools.definitions
+    tools:
+      definitions:
+        code_search:
+          type: src.tools.code_search:CodeSearchTool   # "模块路径:类名"
+          base_url: http://127.0.0.1:9000              # 其余字段作为工具配置
+        shell_execute:
+          type: src.tools.shell_execute:ShellExecuteTool
+          enabled: false
+
+    # 第三方包的入口点,名称为工具名
+    [project.entry-points."synapse.tools"]
+    weather = "my_pkg.weather:WeatherTool"
+
+启动时只注册占位的 LazyTool,它的描述来自磁盘上的描述缓存,不导入工具模块;
+第一次执行时才导入模块并创建实例。缓存按(类路径, 模块文件修改时间, 工具配置)校验,
+缓存缺失或失效时导入工具取得描述并写回缓存。
+
+BaseTool 子类以工具配置为关键字参数创建;MCPTool 子类以 (配置, manager) 创建,
+并用 MCPToolAdapter 包装为 BaseTool。
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import importlib
+import importlib.util
+from dataclasses import dataclass, field
+from importlib.metadata import entry_points
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .base_tool import BaseTool, MCPTool, ToolDescription
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("tools", "tools.log")
+
+ENTRY_POINT_GROUP = "synapse.tools"
+
+
+@dataclass
+class ToolSpec:
+    """一个待加载的工具"""
+    name: str
+    target: str  # "模块路径:类名"
+    options: Dict[str, Any] = field(default_factory=dict)
+    source: str = "config"  # config 或 entry_point
+
+
+class MCPToolAdapter(BaseTool):
+    """把 MCPTool 包装为可注册到 ToolManager 的 BaseTool"""
+
+    def __init__(self, tool: MCPTool):
+        self.tool = tool
+        super().__init__()
+
+    def get_description(self) -> ToolDescription:
+        return ToolDescription(
+            name=self.tool.name,
+            description=self.tool.description,
+            parameters=self.tool.parameters,
+            required=self.tool.required,
+            idempotent=self.tool.idempotent,
+            timeout=self.tool.mcp_config.get('timeout')
+        )
+
+    async def execute(self, **kwargs) -> Any:
+        if not await self.tool.validate_params(kwargs):
+            raise ValueError(f"工具 {self.tool.name} 的参数无效")
+        return await self.tool.call_mcp_api(kwargs)
+
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        if not await self.tool.validate_params(kwargs):
+            raise ValueError(f"工具 {self.tool.name} 的参数无效")
+        async for chunk in self.tool.stream_mcp_api(kwargs):
+            yield chunk
+
+
+class LazyTool(BaseTool):
+    """延迟加载的工具: 描述来自缓存,第一次执行时才导入并创建真正的工具"""
+
+    def __init__(self, spec: ToolSpec, description: ToolDescription, registry: "ToolRegistry"):
+        self.spec = spec
+        self._cached_description = description
+        self._registry = registry
+        self._tool: Optional[BaseTool] = None
+        self._lock = asyncio.Lock()
+        super().__init__()
+
+    @property
+    def loaded(self) -> bool:
+        return self._tool is not None
+
+    def get_description(self) -> ToolDescription:
+        return self._cached_description
+
+    async def load(self) -> BaseTool:
+        """导入并创建工具,只执行一次"""
+        if self._tool is None:
+            async with self._lock:
+                if self._tool is None:
+                    self._tool = await asyncio.to_thread(self._registry.instantiate, self.spec)
+                    logger.info(f"已加载工具 {self.spec.name} ({self.spec.target})")
+        return self._tool
+
+    async def execute(self, **kwargs) -> Any:
+        tool = await self.load()
+        tool.validate_params(kwargs)
+        return await tool.execute(**kwargs)
+
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        tool = await self.load()
+        tool.validate_params(kwargs)
+        async for chunk in tool.stream(**kwargs):
+            yield chunk
+
+
+class ToolRegistry:
+    """从配置和入口点发现工具,注册为 LazyTool"""
+
+    def __init__(self, manager: Any, definitions: Optional[Dict[str, Dict[str, Any]]] = None,
+                 use_entry_points: bool = True, cache_path: Optional[str] = None):
+        """
+        Args:
+            manager: 注册工具的 ToolManager,同时为MCP工具提供HTTP会话
+            definitions: 配置中的工具定义(名称 -> {type, enabled, 其余配置})
+            use_entry_points: 是否发现 synapse.tools 入口点
+            cache_path: 工具描述缓存文件,None表示不缓存
+        """
+        self.manager = manager
+        self.definitions = definitions or {}
+        self.use_entry_points = use_entry_points
+        self.cache_path = cache_path
+        self.stats = {"discovered": 0, "cache_hits": 0, "cache_misses": 0, "failed": 0}
+
+    def discover(self) -> List[ToolSpec]:
+        """列出所有启用的工具,不导入工具模块"""
+        specs: Dict[str, ToolSpec] = {}
+        if self.use_entry_points:
+            for ep in entry_points(group=ENTRY_POINT_GROUP):
+                specs[ep.name] = ToolSpec(ep.name, ep.value, source="entry_point")
+        for name, definition in self.definitions.items():
+            options = dict(definition or {})
+            target = options.pop('type', None)
+            enabled = options.pop('enabled', True)
+            if not enabled:
+                specs.pop(name, None)
+                continue
+            if not target:
+                logger.error(f"工具 {name} 缺少 type,已跳过")
+                continue
+            specs[name] = ToolSpec(name, target, options)
+        self.stats["discovered"] = len(specs)
+        return list(specs.values())
+
+    async def load_all(self) -> List[LazyTool]:
+        """发现工具并注册到管理器,单个工具失败不影响其他工具"""
+        tools = await asyncio.to_thread(self._prepare)
+        for tool in tools:
+            self.manager.register_tool(tool)
+        return tools
+
+    def instantiate(self, spec: ToolSpec) -> BaseTool:
+        """导入并创建工具实例
+
+        Raises:
+            ValueError: 类路径无效或不是工具类
+        """
+        module_name, _, class_name = spec.target.partition(":")
+        if not class_name:
+            raise ValueError(f"工具 {spec.name} 的类型应为 \"模块路径:类名\": {spec.target}")
+        try:
+            cls = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"无法导入工具 {spec.target}: {e}") from e
+        if isinstance(cls, type) and issubclass(cls, MCPTool):
+            return MCPToolAdapter(cls(spec.options, manager=self.manager))
+        if isinstance(cls, type) and issubclass(cls, BaseTool):
+            return cls(**spec.options)
+        raise ValueError(f"{spec.target} 不是 BaseTool 或 MCPTool 的子类")
+
+    def _prepare(self) -> List[LazyTool]:
+        """在线程中执行: 发现工具,读取描述缓存,缓存失效的工具导入一次取得描述"""
+        cache = self._read_cache()
+        updated: Dict[str, Any] = {}
+        tools: List[LazyTool] = []
+        for spec in self.discover():
+            try:
+                fingerprint = self._fingerprint(spec)
+                entry = cache.get(spec.name)
+                if entry is not None and entry.get("fingerprint") == fingerprint:
+                    description = ToolDescription(**entry["description"])
+                    self.stats["cache_hits"] += 1
+                else:
+                    description = self.instantiate(spec).get_description()
+                    self.stats["cache_misses"] += 1
+                if description.name != spec.name:
+                    description = ToolDescription(**{**vars(description), "name": spec.name})
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"加载工具 {spec.name} 失败: {e}")
+                continue
+            updated[spec.name] = {"fingerprint": fingerprint, "description": dict(vars(description))}
+            tools.append(LazyTool(spec, description, self))
+        if updated != cache:
+            self._write_cache(updated)
+        return tools
+
+    @staticmethod
+    def _fingerprint(spec: ToolSpec) -> str:
+        """类路径、模块文件修改时间和工具配置的摘要,任一变化都使缓存失效"""
+        module_name = spec.target.partition(":")[0]
+        try:
+            module_spec = importlib.util.find_spec(module_name)
+        except (ImportError, ValueError):
+            module_spec = None
+        origin = module_spec.origin if module_spec is not None else None
+        mtime = os.stat(origin).st_mtime_ns if origin and os.path.exists(origin) else 0
+        payload = json.dumps([spec.target, mtime, spec.options], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _read_cache(self) -> Dict[str, Any]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取工具描述缓存失败,将重新生成: {e}")
+            return {}
+
+    def _write_cache(self, data: Dict[str, Any]) -> None:
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except OSError as e:
+            logger.warning(f"写入工具描述缓存失败: {e}")
@@ -1,15 +1,20 @@
-from typing import Dict, Any
-import aiohttp
-from .base_tool import MCPTool
+from typing import Dict, Any, AsyncIterator, Optional
+from .base_tool import MCPTool, ToolManager
 
 class ShellExecuteTool(MCPTool):
     """Shell命令执行工具"""
     
-    def __init__(self, config: Dict[str, Any]):
+    parameters = {
+        "command": {"type": "string", "description": "要执行的命令"}
+    }
+    required = ['command']
+    
+    def __init__(self, config: Dict[str, Any], manager: Optional[ToolManager] = None):
         super().__init__(
             name="shell_execute",
             description="执行Shell命令并返回结果",
-            mcp_config=config
+            mcp_config=config,
+            manager=manager
         )
         
     async def validate_params(self, params: Dict[str, Any]) -> bool:
@@ -24,15 +29,9 @@ class ShellExecuteTool(MCPTool):
         
     async def call_mcp_api(self, params: Dict[str, Any]) -> Any:
         """调用Shell执行API"""
-        url = f"{self.mcp_config['base_url']}/execute/shell"
+        return await self.post_json("/execute/shell", params)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url, 
-                json=params,
-                timeout=self.mcp_config.get('timeout', 30)
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"API call failed: {await response.text()}")
\ No newline at end of file
+    async def stream_mcp_api(self, params: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """流式调用Shell执行API,按块产出原始响应体"""
+        async for chunk in self.post_stream("/execute/shell", params):
+            yield chunk
\ No newline at end of file
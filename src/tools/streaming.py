@@ -0,0 +1,128 @@
+"""
+工具输出的流式消费
+
+工具可以实现 BaseTool.stream,以异步迭代器逐块产出结果(例如 MCP 服务的响应体分块)。
+OutputLimiter 在读取过程中就应用长度限制: 只保留开头和结尾两段文本,中间部分丢弃并
+记录省略的字符数;读取总量超过上限时停止读取并关闭工具的迭代器。无论工具输出多大,
+内存中只保留 max_chars 左右的文本,进入上下文的也是截断后的结果。
+"""
+
+import json
+import codecs
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, List
+
+
+@dataclass
+class ToolOutput:
+    """流式工具调用的截断结果"""
+    name: str
+    text: str
+    total_chars: int = 0  # 读取的总字符数
+    omitted_chars: int = 0  # 从中间省略的字符数
+    chunks: int = 0
+    aborted: bool = False  # 超过读取上限而提前停止
+
+    @property
+    def truncated(self) -> bool:
+        return self.omitted_chars > 0 or self.aborted
+
+
+def chunk_text(chunk: Any) -> str:
+    """非 bytes 的分块转为文本: 字符串原样返回,其余按JSON序列化"""
+    if isinstance(chunk, str):
+        return chunk
+    return json.dumps(chunk, ensure_ascii=False, default=str)
+
+
+class OutputLimiter:
+    """边读取边截断工具输出: 保留开头和结尾,省略中间"""
+
+    def __init__(self, name: str, max_chars: int = 20000, tail_chars: int = 4000, max_read: int = 0):
+        """
+        Args:
+            name: 工具名称
+            max_chars: 保留的最大字符数,0表示不截断
+            tail_chars: 其中留给输出结尾的字符数(错误信息通常在结尾)
+            max_read: 读取的最大字符数,超过后停止读取,0表示不限制
+        """
+        self.name = name
+        self.max_chars = max_chars
+        self.tail_chars = min(tail_chars, max_chars) if max_chars else 0
+        self.head_chars = max_chars - self.tail_chars
+        self.max_read = max_read
+        self.total_chars = 0
+        self.chunks = 0
+        self.aborted = False
+        self._head: List[str] = []
+        self._head_len = 0
+        self._tail: Deque[str] = deque()
+        self._tail_len = 0
+        # bytes 分块可能在多字节字符中间切开,用增量解码器拼接
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    @property
+    def exhausted(self) -> bool:
+        """已达到读取上限,应停止读取"""
+        return bool(self.max_read) and self.total_chars >= self.max_read
+
+    def feed(self, chunk: Any) -> str:
+        """加入一个分块
+
+        Returns:
+            str: 该分块中保留在开头部分的文本,可作为部分输出展示;超出开头部分后返回空字符串
+        """
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            text = self._decoder.decode(bytes(chunk))
+        else:
+            text = chunk_text(chunk)
+        self.chunks += 1
+        return self._add(text)
+
+    def finish(self, aborted: bool = False) -> ToolOutput:
+        """结束读取,返回截断后的输出"""
+        self._add(self._decoder.decode(b"", final=True))
+        self.aborted = self.aborted or aborted
+        tail = "".join(self._tail)
+        if len(tail) > self.tail_chars:
+            tail = tail[len(tail) - self.tail_chars:]
+        omitted = self.total_chars - self._head_len - len(tail)
+        parts = ["".join(self._head)]
+        if omitted:
+            parts.append(f"\n...[已省略 {omitted} 个字符]...\n")
+        parts.append(tail)
+        if self.aborted:
+            parts.append(f"\n...[输出超过 {self.max_read} 个字符,已停止读取]")
+        return ToolOutput(
+            name=self.name,
+            text="".join(parts),
+            total_chars=self.total_chars,
+            omitted_chars=omitted,
+            chunks=self.chunks,
+            aborted=self.aborted
+        )
+
+    def _add(self, text: str) -> str:
+        if not text:
+            return ""
+        if self.max_read and self.total_chars + len(text) > self.max_read:
+            text = text[:self.max_read - self.total_chars]
+            self.aborted = True
+        self.total_chars += len(text)
+        if not self.max_chars:
+            self._head.append(text)
+            self._head_len += len(text)
+            return text
+        visible = text[:max(0, self.head_chars - self._head_len)]
+        if visible:
+            self._head.append(visible)
+            self._head_len += len(visible)
+        rest = text[len(visible):]
+        if rest and self.tail_chars:
+            self._tail.append(rest[-self.tail_chars:])
+            self._tail_len += len(self._tail[-1])
+            # 只保留覆盖结尾 tail_chars 个字符所需的分块
+            while self._tail and self._tail_len - len(self._tail[0]) >= self.tail_chars:
+                self._tail_len -= len(self._tail.popleft())
+        return visible
@@ -73,22 +73,19 @@ class KeywordTrigger(BaseTrigger):
         if not self.is_enabled():
             return False
         
-        if not self.case_sensitive:
-            input_text = input_text.lower()
-            keywords = [k.lower() for k in self.keywords]
-        else:
-            keywords = self.keywords
-        
-        for keyword in keywords:
-            if keyword in input_text:
-                return True
-        
-        return False
+        return bool(self._matched(input_text))
     
     async def execute(self, input_text: str, context: Optional[Dict] = None) -> Any:
         return {
-            'matched_keywords': [k for k in self.keywords if k in input_text]
+            'matched_keywords': self._matched(input_text)
         }
+        
+    def _matched(self, input_text: str) -> List[str]:
+        """输入中出现的关键词,不区分大小写时按小写比较"""
+        if self.case_sensitive:
+            return [k for k in self.keywords if k in input_text]
+        input_text = input_text.lower()
+        return [k for k in self.keywords if k.lower() in input_text]
 
 
 class RegexTrigger(BaseTrigger):
@@ -121,22 +118,37 @@ class RegexTrigger(BaseTrigger):
 
 
 class ScheduleTrigger(BaseTrigger):
-    """基于时间的定时触发器"""
+    """基于时间的定时触发器
+    
+    注册到 TriggerManager 后由调度器按时执行,不再随用户输入检查
+    """
     
-    def __init__(self, config: TriggerConfig, interval: int):
+    def __init__(self, config: TriggerConfig, interval: Optional[float] = None, cron: Optional[str] = None):
         """
         初始化定时触发器
         
         Args:
             config: 触发器配置
             interval: 触发间隔，以秒为单位
+            cron: cron表达式(分 时 日 月 星期),与interval二选一
         """
         super().__init__(config)
+        if (interval is None) == (cron is None):
+            raise ValueError("interval和cron必须且只能指定一个")
+        if interval is not None and interval <= 0:
+            raise ValueError("interval必须为正数")
+        if cron is not None:
+            # 创建时解析cron表达式,无效的定义在加载阶段就被拒绝,不会在切换时才失败
+            from .scheduler import CronExpression
+            CronExpression(cron)
         self.interval = interval
+        self.cron = cron
         self.last_check = time.time()
     
     async def check(self, input_text: str, context: Optional[Dict] = None) -> bool:
-        """检查是否到达触发时间"""
+        """检查是否到达触发时间(仅用于间隔触发器)"""
+        if self.interval is None:
+            return False
         current_time = time.time()
         
         if current_time - self.last_check >= self.interval:
@@ -148,5 +160,6 @@ class ScheduleTrigger(BaseTrigger):
     async def execute(self, input_text: str, context: Optional[Dict] = None) -> Any:
         return {
             'trigger_time': time.time(),
-            'interval': self.interval
+            'interval': self.interval,
+            'cron': self.cron
         }
\ No newline at end of file
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""从YAML加载触发器定义并热重载
+
+触发器定义放在独立的目录(默认 config/triggers)中,每个文件的 triggers 段按名称声明触发器,
+支持与主配置相同的 include 机制,同名定义后加载的覆盖先加载的:
+
+    include:
+      - common.yaml
+    triggers:
+      greeting:
+        type: keyword          # keyword, regex, schedule 或 "模块路径:类名"
+        description: 问候
+        priority: 5
+        keywords: [你好, hello]
+      daily_report:
+        type: schedule
+        cron: "0 9 * * 1-5"
+
+读取和编译在线程中完成,编译成功后由 TriggerManager 一次性切换,消息处理不会暂停;
+加载失败时保留当前生效的触发器。
+"""
+
+import os
+import asyncio
+import importlib
+from glob import glob
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .base_trigger import BaseTrigger, KeywordTrigger, RegexTrigger, ScheduleTrigger, TriggerConfig
+from src.core.config import _load_yaml_with_include
+from src.core.logger import LogConfig
+
+logger = LogConfig.get_instance().get_logger("trigger", "trigger.log")
+
+TRIGGER_TYPES = {
+    "keyword": KeywordTrigger,
+    "regex": RegexTrigger,
+    "schedule": ScheduleTrigger,
+}
+
+# TriggerConfig 的字段,其余字段作为参数传给触发器构造函数
+_CONFIG_FIELDS = ("description", "enabled", "priority", "conditions")
+
+
+def read_definitions(path: str) -> Tuple[Dict[str, Dict[str, Any]], Set[str]]:
+    """读取触发器定义
+
+    Args:
+        path: 定义文件或目录,目录中按文件名顺序加载所有yaml文件(跳过示例文件),不存在时视为没有定义
+
+    Returns:
+        Tuple[Dict[str, Dict[str, Any]], Set[str]]: (名称 -> 定义, 读取过的文件,包括include的文件)
+    """
+    if os.path.isdir(path):
+        files = [f for f in sorted(glob(os.path.join(path, "*.yaml"))) if "example" not in os.path.basename(f).lower()]
+    else:
+        files = [path] if os.path.exists(path) else []
+    definitions: Dict[str, Dict[str, Any]] = {}
+    loaded: Set[str] = set()
+    for file in files:
+        data = _load_yaml_with_include(file, loaded)
+        triggers = data.get("triggers") or {}
+        if not isinstance(triggers, dict):
+            raise ValueError(f"{file}: triggers 应为以名称为键的映射")
+        for name, spec in triggers.items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"{file}: 触发器 {name} 的定义应为映射")
+            definitions[str(name)] = {**definitions.get(str(name), {}), **spec}
+    return definitions, loaded
+
+
+def build_trigger(name: str, spec: Dict[str, Any]) -> BaseTrigger:
+    """根据定义创建触发器
+
+    Raises:
+        ValueError: 定义无效
+    """
+    params = dict(spec)
+    type_name = params.pop("type", None)
+    if not type_name:
+        raise ValueError(f"触发器 {name} 缺少 type")
+    cls = TRIGGER_TYPES.get(type_name) or _import_trigger(type_name)
+    config = TriggerConfig(
+        name=name,
+        description=params.pop("description", ""),
+        **{key: params.pop(key) for key in _CONFIG_FIELDS[1:] if key in params}
+    )
+    try:
+        return cls(config, **params)
+    except (TypeError, ValueError, OSError) as e:
+        raise ValueError(f"触发器 {name} 定义无效: {e}") from e
+    except Exception as e:
+        # 正则编译错误等
+        raise ValueError(f"触发器 {name} 定义无效: {type(e).__name__}: {e}") from e
+
+
+def _import_trigger(path: str) -> type:
+    """按 "模块路径:类名" 导入自定义触发器类"""
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError(f"未知的触发器类型: {path}")
+    try:
+        cls = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"无法导入触发器类型 {path}: {e}") from e
+    if not (isinstance(cls, type) and issubclass(cls, BaseTrigger)):
+        raise ValueError(f"{path} 不是 BaseTrigger 的子类")
+    return cls
+
+
+class TriggerLoader:
+    """触发器定义的加载和热重载
+
+    按间隔检查定义文件(包括include的文件)的修改时间,有变化时重新加载。
+    """
+
+    def __init__(self, manager: Any, path: str, interval: float = 2.0):
+        """
+        Args:
+            manager: 接收定义的 TriggerManager
+            path: 定义文件或目录
+            interval: 检查文件变化的间隔(秒),0表示不监视
+        """
+        self.manager = manager
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._fingerprint: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> bool:
+        """读取并应用定义,失败时保留当前触发器
+
+        Returns:
+            bool: 是否成功应用
+        """
+        # 读取前记录文件状态,读取期间的修改会在下次检查时发现
+        fingerprint = self._scan_all()
+        try:
+            definitions, files = await asyncio.to_thread(read_definitions, self.path)
+            prepared = await asyncio.to_thread(self.manager.prepare_definitions, definitions)
+        except Exception as e:
+            self.last_error = str(e)
+            # 记录本次文件状态,文件再次修改后才重试
+            self._fingerprint = fingerprint
+            logger.error(f"加载触发器定义失败,保留当前触发器: {e}")
+            return False
+        try:
+            changes = self.manager.apply_definitions(prepared)
+        except Exception as e:
+            self.last_error = str(e)
+            self._fingerprint = fingerprint
+            logger.error(f"应用触发器定义失败: {e}")
+            return False
+        # 监视本次读取的文件和目录中的文件,已不再include的文件不再监视
+        watched = files | set(self._scan())
+        self._fingerprint = {**self._stat(files), **{p: m for p, m in fingerprint.items() if p in watched}}
+        self.reloads += 1
+        self.last_error = None
+        logger.info(f"已加载触发器定义 {self.path}: {changes}")
+        return True
+
+    async def start(self) -> None:
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "files": sorted(self._fingerprint),
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                changed = self._scan_all() != self._fingerprint
+            except Exception as e:
+                logger.error(f"检查触发器定义文件失败: {e}")
+                continue
+            if changed:
+                try:
+                    await self.load()
+                except Exception as e:
+                    # 监视任务不能因一次加载失败而退出,否则之后的修改都不会生效
+                    self.last_error = str(e)
+                    logger.error(f"重新加载触发器定义失败: {e}")
+
+    def _scan(self) -> Dict[str, int]:
+        """定义目录中的yaml文件的修改时间"""
+        if os.path.isdir(self.path):
+            files: List[str] = sorted(glob(os.path.join(self.path, "*.yaml")))
+        else:
+            files = [self.path]
+        return self._stat(files)
+
+    def _scan_all(self) -> Dict[str, int]:
+        """上次加载涉及的文件(包括include的文件)和目录中当前文件的修改时间"""
+        return {**self._stat(self._fingerprint), **self._scan()}
+
+    @staticmethod
+    def _stat(files: Any) -> Dict[str, int]:
+        result = {}
+        for file in files:
+            path = os.path.abspath(file)
+            try:
+                result[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                result[path] = -1
+        return result
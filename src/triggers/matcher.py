@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""编译后的多模式触发器匹配
+
+把所有关键词触发器的关键词合并为Aho-Corasick自动机(区分大小写和不区分大小写各一个),
+一次扫描输入即可得到全部命中的关键词触发器,耗时与触发器数量基本无关。
+
+所有正则触发器的表达式合并为一个带命名分组的交替表达式: 没有任何匹配时跳过全部正则触发器,
+有匹配时由命名分组直接确认命中的触发器。交替表达式在同一位置只报告第一个匹配的分支,
+被遮盖的匹配无法从中得到,因此其余未确认的正则触发器仍需逐个扫描: 输入命中某个正则时,
+耗时与正则触发器的数量成正比。
+"""
+
+import re
+from collections import deque
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from .base_trigger import BaseTrigger, KeywordTrigger, RegexTrigger
+
+T = TypeVar("T", bound=Hashable)
+
+# 交替表达式中不能合并的正则: 反向引用(合并后组号会偏移)和全局内联标志(只能出现在开头)
+_UNSAFE_TO_COMBINE = re.compile(r"\\[1-9]|\(\?P=|^\(\?[aiLmsux]+\)")
+
+
+class AhoCorasick(Generic[T]):
+    """Aho-Corasick多模式匹配自动机
+
+    一次扫描文本找出所有出现的模式,复杂度为O(文本长度 + 命中数),与模式数量无关。
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]] = ()):
+        """
+        Args:
+            patterns: (模式, 值) 序列,同一模式可以对应多个值
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[T]] = [set()]
+        self._size = 0
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def search(self, text: str) -> Set[T]:
+        """返回文本中出现的所有模式对应的值"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Set[T] = set(output[0])  # 空模式总是命中
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+    def _add(self, pattern: str, value: T) -> None:
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(value)
+        self._size += 1
+
+    def _build(self) -> None:
+        """按广度优先计算失败指针,并把失败链上的输出合并到每个状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+
+class TriggerMatcher:
+    """触发器集合的编译结果
+
+    只编译未重写 check 的 KeywordTrigger 和 RegexTrigger,其余触发器(定时触发器、
+    自定义触发器)仍需逐个调用 check。编译时读取触发器的关键词和表达式,
+    之后修改触发器内容需要重新编译。
+    """
+
+    def __init__(self, triggers: Iterable[BaseTrigger]):
+        """
+        Args:
+            triggers: 按检查顺序(优先级从高到低)排列的触发器
+        """
+        self.triggers: List[BaseTrigger] = list(triggers)
+        sensitive: List[Tuple[str, int]] = []
+        insensitive: List[Tuple[str, int]] = []
+        combinable: List[str] = []
+        self._regex: List[Tuple[int, List[re.Pattern]]] = []
+        self._groups: Dict[str, int] = {}  # 交替表达式中的分组名 -> 触发器位置
+        self._dynamic: List[int] = []
+        for position, trigger in enumerate(self.triggers):
+            if not self.compiles(trigger):
+                self._dynamic.append(position)
+            elif isinstance(trigger, KeywordTrigger):
+                target = sensitive if trigger.case_sensitive else insensitive
+                for keyword in trigger.keywords:
+                    target.append((keyword if trigger.case_sensitive else keyword.lower(), position))
+            else:
+                self._regex.append((position, trigger.patterns))
+                for pattern in trigger.patterns:
+                    name = f"_p{len(combinable)}"
+                    self._groups[name] = position
+                    combinable.append((name, pattern))
+        self._sensitive = AhoCorasick(sensitive) if sensitive else None
+        self._insensitive = AhoCorasick(insensitive) if insensitive else None
+        self._prefilter = self._combine(combinable) if self._regex else None
+
+    @staticmethod
+    def compiles(trigger: BaseTrigger) -> bool:
+        """该触发器是否由匹配器判断,否则需要调用其 check"""
+        return type(trigger).check in (KeywordTrigger.check, RegexTrigger.check)
+
+    def search(self, text: str) -> Set[int]:
+        """一次扫描返回所有命中的已编译触发器(以位置表示)"""
+        hits: Set[int] = set()
+        if self._sensitive is not None:
+            hits |= self._sensitive.search(text)
+        if self._insensitive is not None:
+            hits |= self._insensitive.search(text.lower())
+        if not self._regex:
+            return hits
+        if self._prefilter is not None:
+            confirmed = {self._groups[m.lastgroup] for m in self._prefilter.finditer(text)}
+            if not confirmed:
+                return hits
+            hits |= confirmed
+        # 交替表达式中被其他分支遮盖的匹配只能逐个扫描确认
+        for position, patterns in self._regex:
+            if position not in hits and any(p.search(text) for p in patterns):
+                hits.add(position)
+        return hits
+
+    def candidates(self, text: str) -> List[Tuple[BaseTrigger, bool]]:
+        """按检查顺序返回可能被触发的触发器
+
+        Returns:
+            List[Tuple[BaseTrigger, bool]]: (触发器, 是否已确定命中),
+                未确定的是需要调用 check 的未编译触发器
+        """
+        hits = self.search(text)
+        if not self._dynamic:
+            return [(self.triggers[p], True) for p in sorted(hits)]
+        positions = sorted(hits.union(self._dynamic))
+        return [(self.triggers[p], p in hits) for p in positions]
+
+    @staticmethod
+    def _combine(patterns: List[Tuple[str, re.Pattern]]) -> Optional[re.Pattern]:
+        """把所有正则合并为一个交替表达式,每个分支为一个命名分组,匹配的 lastgroup 即命中的分支
+
+        存在无法安全合并的表达式(反向引用、内联标志或编译时带标志)时返回None,此时总是逐个扫描
+        """
+        default = re.compile("").flags
+        if any(_UNSAFE_TO_COMBINE.search(p.pattern) or p.flags != default for _, p in patterns):
+            return None
+        try:
+            return re.compile("|".join(f"(?P<{name}>{p.pattern})" for name, p in patterns))
+        except re.error:
+            return None
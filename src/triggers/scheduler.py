@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""定时触发器调度
+
+调度器作为独立的asyncio任务运行,不依赖用户输入: 所有定时任务按下一次触发时间放在
+最小堆中,调度协程只等待堆顶到期,增删任务为O(log n)。到期的触发器在单独的任务中执行,
+结果发布到消息总线的 trigger 主题。支持固定间隔和5字段cron表达式。
+"""
+
+import json
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..io.message_bus import MessageBus
+from .base_trigger import BaseTrigger
+from src.core.logger import LogConfig
+from src.core.tracing import tracer
+
+logger = LogConfig.get_instance().get_logger("trigger", "trigger.log")
+
+_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+_NAMES = {
+    3: {name: i for i, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)},
+    4: {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])},
+}
+
+# 各字段的取值范围: 分、时、日、月、星期(0和7都表示周日)
+_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class CronExpression:
+    """5字段cron表达式: 分 时 日 月 星期
+
+    支持 *、数字、范围 a-b、步长 */n 和 a-b/n、逗号列表、月份和星期的英文缩写,
+    以及 @hourly、@daily 等别名。与标准cron一致,日和星期都有限制时满足其一即可。
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"cron表达式需要5个字段: {expression!r}")
+        parsed = [self._parse(field, index) for index, field in enumerate(fields)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        # 与vixie cron一致,以*开头的日/星期字段视为不限制
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+
+    def next_after(self, moment: datetime) -> datetime:
+        """严格晚于给定时间的下一次触发时间(本地时间,精确到分钟)"""
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = current + timedelta(days=366 * 5)
+        while current < limit:
+            if current.month not in self.months:
+                year, month = (current.year + 1, 1) if current.month == 12 else (current.year, current.month + 1)
+                current = current.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(current):
+                current = (current + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if current.hour not in self.hours:
+                current = (current + timedelta(hours=1)).replace(minute=0)
+                continue
+            if current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+                continue
+            return current
+        raise ValueError(f"cron表达式没有可触发的时间: {self.expression!r}")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # datetime的星期一为0,cron的星期日为0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday
+        if self._any_weekday:
+            return day
+        return day or weekday
+
+    def _parse(self, field: str, index: int) -> Set[int]:
+        low, high = _RANGES[index]
+        names = _NAMES.get(index, {})
+        values: Set[int] = set()
+        for part in field.lower().split(","):
+            body, _, step_text = part.partition("/")
+            step = int(step_text) if step_text else 1
+            if step < 1:
+                raise ValueError(f"cron步长必须为正数: {part!r}")
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                first, last = body.split("-", 1)
+                start, end = self._value(first, names), self._value(last, names)
+            else:
+                start = self._value(body, names)
+                end = high if step_text else start
+            if not (low <= start <= high and low <= end <= high and start <= end):
+                raise ValueError(f"cron字段超出范围 [{low}, {high}]: {part!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    @staticmethod
+    def _value(text: str, names: Dict[str, int]) -> int:
+        if text in names:
+            return names[text]
+        try:
+            return int(text)
+        except ValueError:
+            raise ValueError(f"无效的cron取值: {text!r}") from None
+
+
+class _Job:
+    """一个定时任务"""
+
+    __slots__ = ("trigger", "interval", "cron", "due", "target", "cancelled", "running", "runs", "skipped",
+                 "last_run")
+
+    def __init__(self, trigger: BaseTrigger, interval: Optional[float], cron: Optional[CronExpression]):
+        self.trigger = trigger
+        self.interval = interval
+        self.cron = cron
+        self.due = 0.0
+        self.target = 0.0  # cron任务下一次触发的本地时间戳
+        self.cancelled = False
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.last_run: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return self.trigger.config.name
+
+
+class TriggerScheduler:
+    """定时触发器调度器
+
+    间隔任务按上一次的计划时间推算下一次,不会因执行耗时而漂移;落后超过一个周期时
+    跳过错过的次数而不是连续补触发。上一次执行尚未结束时跳过本次触发。
+    """
+
+    def __init__(self, message_bus: Optional[MessageBus] = None, topic: str = "trigger"):
+        """
+        Args:
+            message_bus: 发布触发结果的消息总线,为None时只记录日志
+            topic: 发布结果的主题
+        """
+        self.message_bus = message_bus
+        self.topic = topic
+        self._heap: List[Tuple[float, int, _Job]] = []
+        self._jobs: Dict[str, _Job] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running_tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def add(self, trigger: BaseTrigger, interval: Optional[float] = None, cron: Optional[str] = None) -> None:
+        """添加定时任务,同名任务会被替换
+
+        Args:
+            trigger: 到期时调用其 execute 的触发器
+            interval: 触发间隔(秒)
+            cron: cron表达式,与interval二选一
+        """
+        if (interval is None) == (cron is None):
+            raise ValueError("interval和cron必须且只能指定一个")
+        if interval is not None and interval <= 0:
+            raise ValueError("interval必须为正数")
+        self.remove(trigger.config.name)
+        job = _Job(trigger, interval, CronExpression(cron) if cron is not None else None)
+        self._jobs[job.name] = job
+        self._push(job, self._first_due(job))
+
+    def remove(self, name: str) -> bool:
+        """移除定时任务,堆中的条目在到期时丢弃"""
+        job = self._jobs.pop(name, None)
+        if job is None:
+            return False
+        job.cancelled = True
+        # 已移除的条目过多时重建堆
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+        return True
+
+    def next_run(self, name: str) -> Optional[float]:
+        """任务下一次触发的时间戳"""
+        job = self._jobs.get(name)
+        return time.time() + job.due - self._now() if job is not None else None
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._running_tasks:
+            await asyncio.gather(*self._running_tasks, return_exceptions=True)
+
+    def clear(self) -> None:
+        for job in self._jobs.values():
+            job.cancelled = True
+        self._jobs.clear()
+        self._heap.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "runs": job.runs,
+                "skipped": job.skipped,
+                "last_run": job.last_run,
+                "next_run": self.next_run(name),
+                "running": job.running,
+            }
+            for name, job in self._jobs.items()
+        }
+
+    @staticmethod
+    def _now() -> float:
+        return time.monotonic()
+
+    def _first_due(self, job: _Job) -> float:
+        if job.interval is not None:
+            return self._now() + job.interval
+        return self._cron_due(job)
+
+    def _next_due(self, job: _Job, due: float, now: float) -> float:
+        if job.interval is not None:
+            missed = int((now - due) // job.interval)
+            return due + (missed + 1) * job.interval
+        return self._cron_due(job, after=job.target)
+
+    def _cron_due(self, job: _Job, after: float = 0.0) -> float:
+        """把cron的下一次本地时间换算为单调时钟
+
+        Args:
+            after: 刚触发的本地时间;单调时钟到期时墙上时钟可能还略早于它,
+                从两者中较晚的时间推算,避免同一分钟触发两次
+        """
+        wall = time.time()
+        job.target = job.cron.next_after(datetime.fromtimestamp(max(wall, after))).timestamp()
+        return self._now() + (job.target - wall)
+
+    def _push(self, job: _Job, due: float) -> None:
+        earliest = self._heap[0][0] if self._heap else None
+        job.due = due
+        heapq.heappush(self._heap, (due, next(self._sequence), job))
+        # 新任务比当前等待的更早到期时唤醒调度协程
+        if earliest is None or due < earliest:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = self._now()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                self._dispatch(job, due)
+                job.due = self._next_due(job, due, now)
+                heapq.heappush(self._heap, (job.due, next(self._sequence), job))
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, job: _Job, due: float) -> None:
+        if not job.trigger.is_enabled():
+            return
+        if job.running:
+            job.skipped += 1
+            logger.warning(f"定时触发器 {job.name} 上一次执行尚未结束,跳过本次触发")
+            return
+        job.running = True
+        task = asyncio.create_task(self._fire(job, due))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    async def _fire(self, job: _Job, due: float) -> None:
+        fired_at = time.time()
+        try:
+            with tracer.start_trace("trigger.schedule", trigger=job.name):
+                result = await job.trigger.execute("", {"scheduled": True, "delay": self._now() - due})
+                job.runs += 1
+                job.last_run = fired_at
+                logger.info(f"定时触发器 {job.name} 已执行")
+                if self.message_bus is not None:
+                    await self.message_bus.publish(self.topic, {
+                        "trigger": job.name,
+                        "fired_at": fired_at,
+                        "result": _serializable(result),
+                    })
+        except Exception as e:
+            logger.error(f"定时触发器 {job.name} 执行失败: {str(e)}")
+        finally:
+            job.running = False
+
+
+def _serializable(value: Any) -> Any:
+    """触发结果无法序列化为JSON时转为字符串"""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
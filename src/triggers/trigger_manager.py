@@ -1,47 +1,228 @@
 # -*- coding: utf-8 -*-
 """触发器管理系统"""
 
-from typing import Dict, List, Any, Optional
+from typing import Awaitable, Dict, Iterable, List, Any, Optional, Tuple
+from dataclasses import dataclass
+from itertools import groupby
 import asyncio
 import logging
+import time
 
 from ..io.message_bus import Message, MessageBus
-from .base_trigger import BaseTrigger, TriggerConfig
+from .base_trigger import BaseTrigger, ScheduleTrigger, TriggerConfig
+from .loader import TriggerLoader, build_trigger
+from .matcher import TriggerMatcher
+from .scheduler import TriggerScheduler
+from src.core.breaker import CircuitBreaker
+from src.core.config import Config
 from src.core.logger import LogConfig
 
 logger = LogConfig.get_instance().get_logger("trigger", "trigger.log")
 
 
+@dataclass
+class PreparedDefinitions:
+    """编译好、等待切换的触发器定义"""
+    generation: int
+    definitions: Dict[str, Dict[str, Any]]
+    triggers: Dict[str, BaseTrigger]
+    matcher: TriggerMatcher
+
+
+@dataclass
+class TriggerStats:
+    """单个触发器的检查统计"""
+    checks: int = 0
+    hits: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    rejected: int = 0  # 熔断期间跳过的次数
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    
+    def record(self, elapsed_ms: float, hit: bool) -> None:
+        self.checks += 1
+        self.hits += int(hit)
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "checks": self.checks,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.checks if self.checks else 0.0,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_ms": self.total_ms / self.checks if self.checks else 0.0,
+            "max_ms": self.max_ms,
+        }
+
+
 class TriggerManager:
-    """触发器管理器"""
+    """触发器管理器
     
-    def __init__(self):
+    按优先级排序并编译后的匹配器在注册/注销时失效,下次检查时重建;
+    直接修改已注册触发器的优先级或关键词后需要调用 invalidate。
+    定时触发器交给调度器按时执行,结果发布到消息总线的 trigger 主题。
+    
+    需要调用 check 的触发器(自定义触发器)在同一优先级内并发检查,每次检查和执行都有超时;
+    连续失败或超时的触发器被熔断一段时间,期间视为未触发,不会拖慢用户轮次。
+    
+    配置文件中定义的触发器在初始化时加载,文件变化时在后台重新编译并整体切换,
+    正在进行的检查继续使用切换前的触发器。
+    """
+    
+    def __init__(self, message_bus: Optional[MessageBus] = None, config: Optional[Config] = None):
+        config = config or Config()
         self.triggers: Dict[str, BaseTrigger] = {}
         self._enabled = True
+        self.scheduler = TriggerScheduler(message_bus)
+        self._matcher: Optional[TriggerMatcher] = None
+        self.timeout = config.trigger_timeout
+        self.failure_threshold = config.trigger_failure_threshold
+        self.recovery_time = config.trigger_recovery_time
+        self._semaphore = asyncio.Semaphore(max(1, config.trigger_max_concurrency))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, TriggerStats] = {}
+        self._checks = 0
+        self._specs: Dict[str, Dict[str, Any]] = {}  # 来自配置文件的触发器定义
+        self._generation = 0
+        self.loader = TriggerLoader(self, config.trigger_path, config.trigger_reload_interval) \
+            if config.trigger_path else None
         
     async def init(self):
         """初始化触发器管理器"""
-        # TODO: 从配置加载触发器
+        if self.loader is not None:
+            await self.loader.load()
+            await self.loader.start()
+        await self.scheduler.start()
         logger.info("触发器管理器已初始化")
         
     async def cleanup(self):
         """清理触发器管理器"""
+        if self.loader is not None:
+            await self.loader.stop()
+        await self.scheduler.stop()
+        self.scheduler.clear()
         self.triggers.clear()
+        self._specs.clear()
+        self.invalidate()
         logger.info("触发器管理器已清理")
         
     def register_trigger(self, trigger: BaseTrigger):
-        """注册触发器"""
+        """注册触发器,与配置文件中的触发器同名时替换之,直到下次重新加载配置"""
         self.triggers[trigger.config.name] = trigger
+        self._specs.pop(trigger.config.name, None)
+        self._breakers[trigger.config.name] = CircuitBreaker(self.failure_threshold, self.recovery_time)
+        self._stats[trigger.config.name] = TriggerStats()
+        self.scheduler.remove(trigger.config.name)
+        if isinstance(trigger, ScheduleTrigger):
+            self.scheduler.add(trigger, interval=trigger.interval, cron=trigger.cron)
+        self.invalidate()
         logger.info(f"注册触发器: {trigger.config.name}")
         
     def unregister_trigger(self, trigger_name: str):
         """注销触发器"""
         if trigger_name in self.triggers:
             del self.triggers[trigger_name]
+            self._specs.pop(trigger_name, None)
+            self._breakers.pop(trigger_name, None)
+            self._stats.pop(trigger_name, None)
+            self.scheduler.remove(trigger_name)
+            self.invalidate()
             logger.info(f"注销触发器: {trigger_name}")
             
+    def invalidate(self):
+        """使编译后的匹配器失效,下次检查时重新排序和编译"""
+        self._matcher = None
+        self._generation += 1
+        
+    def prepare_definitions(self, definitions: Dict[str, Dict[str, Any]]) -> PreparedDefinitions:
+        """按配置文件中的定义编译新的触发器集合,可在线程中调用
+        
+        代码注册的触发器保留;定义未变化的触发器沿用现有实例(保留其内部状态)
+        
+        Raises:
+            ValueError: 定义无效
+        """
+        generation = self._generation
+        current = dict(self.triggers)
+        specs = dict(self._specs)
+        triggers = {name: t for name, t in current.items() if name not in specs}
+        for name, spec in definitions.items():
+            if specs.get(name) == spec and name in current:
+                triggers[name] = current[name]
+            else:
+                triggers[name] = build_trigger(name, spec)
+        return PreparedDefinitions(generation, dict(definitions), triggers, self._build_matcher(triggers.values()))
+        
+    def apply_definitions(self, prepared: PreparedDefinitions) -> Dict[str, int]:
+        """切换到编译好的触发器集合,整个切换过程中没有await,检查不会看到中间状态
+        
+        Returns:
+            Dict[str, int]: 新增、更新、删除的触发器数
+        """
+        if prepared.generation != self._generation:
+            # 编译期间有触发器注册或注销,基于当前状态重新编译
+            prepared = self.prepare_definitions(prepared.definitions)
+        old, new = self.triggers, prepared.triggers
+        changes = {
+            "added": sum(1 for name in new if name not in old),
+            "updated": sum(1 for name, t in new.items() if name in old and old[name] is not t),
+            "removed": sum(1 for name in old if name not in new),
+        }
+        for name, trigger in old.items():
+            if new.get(name) is not trigger:
+                self.scheduler.remove(name)
+        for name, trigger in new.items():
+            if old.get(name) is not trigger and isinstance(trigger, ScheduleTrigger):
+                self.scheduler.add(trigger, interval=trigger.interval, cron=trigger.cron)
+        self._breakers = {
+            name: self._breakers[name] if old.get(name) is t
+            else CircuitBreaker(self.failure_threshold, self.recovery_time)
+            for name, t in new.items()
+        }
+        self._stats = {name: self._stats[name] if old.get(name) is t else TriggerStats() for name, t in new.items()}
+        self.triggers = new
+        self._specs = prepared.definitions
+        self._matcher = prepared.matcher
+        self._generation += 1
+        return changes
+        
+    def _compiled(self) -> TriggerMatcher:
+        if self._matcher is None:
+            self._matcher = self._build_matcher(self.triggers.values())
+        return self._matcher
+        
+    @staticmethod
+    def _build_matcher(triggers: Iterable[BaseTrigger]) -> TriggerMatcher:
+        """按优先级从高到低编译匹配器,优先级相同时保持注册顺序
+        
+        定时触发器由调度器执行,不参与输入检查
+        """
+        return TriggerMatcher(sorted(
+            (t for t in triggers if not isinstance(t, ScheduleTrigger)),
+            key=lambda t: t.get_priority(),
+            reverse=True
+        ))
+        
+    async def match(self, input_text: str, context: Optional[Dict] = None) -> List[BaseTrigger]:
+        """返回所有被触发的触发器,按优先级从高到低排列
+        
+        关键词和正则触发器由匹配器一次扫描得出,其余触发器并发调用 check
+        """
+        if not self._enabled:
+            return []
+        candidates = self._candidates(input_text)
+        results = await asyncio.gather(*(
+            self._evaluate(trigger, input_text, context) for trigger, hit in candidates if not hit
+        ))
+        evaluated = iter(results)
+        return [trigger for trigger, hit in candidates if hit or next(evaluated)]
+        
     async def check(self, input_text: str, context: Optional[Dict] = None) -> bool:
-        """检查是否有触发器被触发
+        """检查是否有触发器被触发,执行优先级最高的一个
         
         Args:
             input_text: 输入文本
@@ -53,29 +234,112 @@ class TriggerManager:
         if not self._enabled:
             return False
             
-        # 按优先级排序触发器
-        sorted_triggers = sorted(
-            self.triggers.values(),
-            key=lambda t: t.get_priority(),
-            reverse=True
-        )
+        # 一次扫描得到所有命中的关键词/正则触发器,加上需要调用 check 的其他触发器
+        candidates = self._candidates(input_text)
         
-        # 检查每个触发器
-        for trigger in sorted_triggers:
-            if not trigger.is_enabled():
+        # 按优先级从高到低逐档检查,同一档内的触发器并发检查
+        for _, band in groupby(candidates, key=lambda c: c[0].get_priority()):
+            trigger = await self._first_match(list(band), input_text, context)
+            if trigger is None:
                 continue
-                
-            try:
-                if await trigger.check(input_text, context):
-                    logger.info(f"触发器 {trigger.config.name} 被触发")
-                    # 执行触发器动作
-                    await trigger.execute(input_text, context)
-                    return True
-            except Exception as e:
-                logger.error(f"触发器 {trigger.config.name} 检查失败: {str(e)}")
-                
+            logger.info(f"触发器 {trigger.config.name} 被触发")
+            # 执行触发器动作
+            await self._guarded(trigger, trigger.execute(input_text, context), "执行")
+            return True
+            
         return False
         
+    def stats(self) -> Dict[str, Any]:
+        """各触发器的检查耗时、命中率和熔断状态
+        
+        关键词和正则触发器由匹配器统一判断,检查次数即消息数
+        """
+        triggers = {}
+        for name, trigger in self.triggers.items():
+            data = self._stats[name].as_dict()
+            if TriggerMatcher.compiles(trigger):
+                data["checks"] = self._checks
+                data["hit_rate"] = data["hits"] / self._checks if self._checks else 0.0
+            data["breaker"] = self._breakers[name].stats()
+            triggers[name] = data
+        return {"checks": self._checks, "triggers": triggers}
+        
+    def _candidates(self, input_text: str) -> List[Tuple[BaseTrigger, bool]]:
+        """可能被触发的已启用触发器,并记录已编译触发器的命中"""
+        self._checks += 1
+        candidates = []
+        for trigger, hit in self._compiled().candidates(input_text):
+            if not trigger.is_enabled():
+                continue
+            if hit:
+                self._stats[trigger.config.name].hits += 1
+            candidates.append((trigger, hit))
+        return candidates
+        
+    async def _first_match(self, band: List[Tuple[BaseTrigger, bool]], input_text: str,
+                           context: Optional[Dict]) -> Optional[BaseTrigger]:
+        """同一优先级中按注册顺序第一个被触发的触发器
+        
+        排在第一个已命中触发器之前的未编译触发器并发检查,之后的不需要检查
+        """
+        pending = []
+        first_hit = None
+        for trigger, hit in band:
+            if hit:
+                first_hit = trigger
+                break
+            pending.append(trigger)
+        if pending:
+            results = await asyncio.gather(*(self._evaluate(t, input_text, context) for t in pending))
+            for trigger, matched in zip(pending, results):
+                if matched:
+                    return trigger
+        return first_hit
+        
+    async def _evaluate(self, trigger: BaseTrigger, input_text: str, context: Optional[Dict]) -> bool:
+        """带超时和熔断地调用触发器的 check,失败视为未触发"""
+        matched = await self._guarded(trigger, trigger.check(input_text, context), "检查", record=True)
+        return bool(matched)
+        
+    async def _guarded(self, trigger: BaseTrigger, call: Awaitable[Any], action: str, record: bool = False) -> Any:
+        """在并发限制、超时和熔断保护下执行触发器调用
+        
+        熔断、超时或出错时返回None
+        """
+        name = trigger.config.name
+        breaker = self._breakers[name]
+        stats = self._stats[name]
+        if not breaker.allow():
+            stats.rejected += 1
+            call.close()
+            return None
+        result = None
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(call, self.timeout or None)
+                    breaker.record_success()
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                    breaker.record_failure()
+                    logger.warning(f"触发器 {name} {action}超时({self.timeout}s),熔断状态: {breaker.state}")
+                except Exception as e:
+                    stats.errors += 1
+                    breaker.record_failure()
+                    logger.error(f"触发器 {name} {action}失败: {str(e)},熔断状态: {breaker.state}")
+                finally:
+                    if record:
+                        stats.record((time.perf_counter() - started) * 1000, bool(result))
+        except asyncio.CancelledError:
+            # 在等待并发名额时被取消,调用尚未开始
+            call.close()
+            raise
+        finally:
+            # 被取消的试探调用不计成败,但必须释放试探名额,否则熔断器将一直拒绝
+            breaker.release_probe()
+        return result
+        
     def enable(self):
         """启用触发器管理器"""
         self._enabled = True
@@ -0,0 +1,357 @@
+"""
+智能体流水线端到端压测
+
+在进程内启动 Application(模型使用本地桩服务,向量使用确定性的特征哈希),
+模拟多个并发用户按给定的消息组合对话,统计吞吐、端到端与首包延迟分位数、
+各阶段(trace span)延迟分位数和内存增长,结果保存为JSON,可与基准结果对比。
+
+驱动方式:
+    inproc  直接调用 AgentCore.respond
+    bus     经 web_input -> 消息总线 -> agent_output
+    http    经 uvicorn 启动的 /api/v1/agent/stream (SSE)
+
+用法:
+    python -m tests.benchmarks.bench_e2e --mode inproc --users 20 --turns 10 --corpus 2000
+    python -m tests.benchmarks.bench_e2e --mode http --compare tests/benchmarks/results/e2e-http-abc123.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from tests.benchmarks.common import compare, load_results, metadata, percentiles, rss_mb, write_results
+from src.app import Application
+from src.core.config import Config, load_config
+from src.core.tracing import tracer
+from src.models.stub_server import StubServer
+
+TOPICS = ["账户", "密码", "退款", "发票", "物流", "会员", "优惠券", "订单", "配送", "售后",
+          "api", "token", "webhook", "timeout", "error", "deploy", "cache", "index", "quota", "region"]
+
+FAQ = ["如何重置密码", "退款多久到账", "怎么开发票", "订单可以修改地址吗", "会员有哪些权益",
+       "api token 过期怎么办", "webhook timeout 如何处理"]
+
+
+def make_corpus(size: int, rng: random.Random) -> List[Tuple[str, Dict[str, Any]]]:
+    """生成合成语料,每篇文档围绕两三个主题词"""
+    docs = []
+    for i in range(size):
+        topics = rng.sample(TOPICS, 3)
+        body = " ".join(f"{t}相关说明第{rng.randint(1, 50)}条,{rng.choice(TOPICS)}需要注意" for t in topics)
+        docs.append((f"文档{i}: {body} ERR-{i % 97}", {"source": f"doc{i % 10}", "tag": topics[0]}))
+    return docs
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def make_message(kind: str, rng: random.Random, user: int, turn: int) -> str:
+    """按类型生成消息: faq 高频重复问题, unique 一次性问题, long 长问题"""
+    if kind == "faq":
+        return rng.choice(FAQ)
+    if kind == "long":
+        return "，".join(f"关于{rng.choice(TOPICS)}的第{rng.randint(1, 999)}个问题" for _ in range(20))
+    return f"用户{user}第{turn}轮: {rng.choice(TOPICS)} 和 {rng.choice(TOPICS)} 有什么区别"
+
+
+class Driver:
+    """把一轮对话发送给应用并等待完整响应"""
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def turn(self, user_id: str, text: str) -> float:
+        """执行一轮,返回首包延迟(秒)"""
+        raise NotImplementedError
+
+
+class InprocDriver(Driver):
+    def __init__(self, app: Application):
+        self.app = app
+
+    async def turn(self, user_id: str, text: str) -> float:
+        started = time.perf_counter()
+        first = None
+        async for _ in self.app.agent.respond(text, user_id):
+            if first is None:
+                first = time.perf_counter() - started
+        return first if first is not None else time.perf_counter() - started
+
+
+class BusDriver(Driver):
+    def __init__(self, app: Application):
+        self.app = app
+        self._waiters: Dict[str, Tuple[asyncio.Future, asyncio.Future]] = {}
+
+    async def start(self) -> None:
+        await self.app.message_bus.subscribe("agent_output", self._on_output)
+
+    async def _on_output(self, message: Dict[str, Any]) -> None:
+        data = json.loads(message["content"]) if isinstance(message.get("content"), str) else message
+        waiter = self._waiters.get(data.get("user_id"))
+        if waiter is None:
+            return
+        first, done = waiter
+        if not first.done():
+            first.set_result(time.perf_counter())
+        if data.get("done") or data.get("type") == "error":
+            if not done.done():
+                done.set_result(data)
+
+    async def turn(self, user_id: str, text: str) -> float:
+        loop = asyncio.get_running_loop()
+        first, done = loop.create_future(), loop.create_future()
+        self._waiters[user_id] = (first, done)
+        started = time.perf_counter()
+        try:
+            await self.app.message_bus.publish("web_input", {"content": text, "user_id": user_id})
+            result = await asyncio.wait_for(done, timeout=60)
+            if result.get("type") == "error":
+                raise RuntimeError(result.get("content"))
+            return first.result() - started
+        finally:
+            self._waiters.pop(user_id, None)
+
+
+class HttpDriver(Driver):
+    def __init__(self, app: Application):
+        self.app = app
+        self.server = None
+        self.session = None
+        self.url = ""
+        self.api_key = ""
+
+    async def start(self) -> None:
+        import uvicorn
+        from src.api import endpoints
+        from src.core.http import create_session
+        endpoints.app.state.agent = self.app.agent
+        # 压测时关闭按IP的速率限制
+        endpoints.limiter.enabled = False
+        self.api_key = endpoints.API_KEY
+        self.server = uvicorn.Server(uvicorn.Config(endpoints.app, host="127.0.0.1", port=0,
+                                                    log_level="error", access_log=False, lifespan="off"))
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/api/v1/agent/stream"
+        self.session = create_session(limit=0)
+
+    async def stop(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+        if self.server is not None:
+            self.server.should_exit = True
+            await self._task
+
+    async def turn(self, user_id: str, text: str) -> float:
+        started = time.perf_counter()
+        first = None
+        async with self.session.post(self.url, json={"message": text, "user_id": user_id},
+                                     headers={"X-API-Key": self.api_key}) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}: {await response.text()}")
+            async for line in response.content:
+                if first is None and line.startswith(b"data:"):
+                    first = time.perf_counter() - started
+                if line.startswith(b"event: error"):
+                    raise RuntimeError("SSE error")
+        return first if first is not None else time.perf_counter() - started
+
+
+DRIVERS = {"inproc": InprocDriver, "bus": BusDriver, "http": HttpDriver}
+
+
+def build_config(args: argparse.Namespace, workdir: str, stub_url: str) -> Config:
+    config = load_config(args.config_dir) if args.config_dir else Config()
+    config.model_type = "stub"
+    config.ai_api.stub_api_base = stub_url
+    config.memory_path = os.path.join(workdir, "memory.db")
+    config.rag_index_path = os.path.join(workdir, "rag_index")
+    config.embedding_backend = "hash"
+    config.vector_dim = args.vector_dim
+    # 所有轮次都采样,用于统计各阶段延迟
+    config.tracing_enabled = True
+    config.tracing_sample_rate = 1.0
+    config.tracing_buffer_size = args.users * (args.turns + 1) * 2 + 100
+    config.tracing_slow_ms = 0
+    return config
+
+
+async def ingest(app: Application, docs: List[Tuple[str, Dict[str, Any]]], batch_size: int = 256) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i:i + batch_size]
+        texts = [text for text, _ in batch]
+        embeddings = await app.agent.rag.embed(texts)
+        app.agent.rag.add_chunks(texts, embeddings, [meta for _, meta in batch])
+    return time.perf_counter() - started
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        async with StubServer(port=0, latency=args.model_latency, token_delay=args.token_delay) as stub:
+            app = Application(build_config(args, workdir, stub.url))
+            await app.initialize()
+            await app.start_components()
+            driver = DRIVERS[args.mode](app)
+            await driver.start()
+            rss_start = rss_mb()
+            ingest_seconds = await ingest(app, make_corpus(args.corpus, rng))
+            rss_loaded = rss_mb()
+
+            # 预热
+            for i in range(min(3, args.turns)):
+                await driver.turn("warmup", rng.choice(FAQ))
+            tracer.clear()
+
+            e2e: List[float] = []
+            ttfb: List[float] = []
+            errors: Dict[str, int] = defaultdict(int)
+
+            async def user_loop(user: int) -> None:
+                user_rng = random.Random(args.seed * 1000 + user)
+                for turn in range(args.turns):
+                    kind = user_rng.choices(kinds, weights)[0]
+                    text = make_message(kind, user_rng, user, turn)
+                    started = time.perf_counter()
+                    try:
+                        first = await driver.turn(f"user{user}", text)
+                    except Exception as e:
+                        errors[type(e).__name__] += 1
+                        continue
+                    e2e.append((time.perf_counter() - started) * 1000)
+                    ttfb.append(first * 1000)
+                    if args.think:
+                        await asyncio.sleep(user_rng.expovariate(1 / args.think))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user_loop(u) for u in range(args.users)))
+            elapsed = time.perf_counter() - started
+            # 等待后台写入完成,计入内存统计
+            await asyncio.sleep(0.1)
+            rss_end = rss_mb()
+
+            stages: Dict[str, List[float]] = defaultdict(list)
+            for trace in tracer.export_json():
+                for span in trace["spans"]:
+                    stages[span["name"]].append(span["duration_ms"])
+
+            heap = None
+            if args.tracemalloc:
+                current, peak = tracemalloc.get_traced_memory()
+                heap = {"current_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20}
+                tracemalloc.stop()
+
+            agent_stats = {
+                "admission": app.agent.admission.stats(),
+                "sessions": app.agent.sessions.stats(),
+                "rag_cache": app.agent.rag.query_cache.stats(),
+                "model_requests": stub.requests,
+            }
+            if app.agent.response_cache is not None:
+                agent_stats["response_cache"] = app.agent.response_cache.stats()
+
+            await driver.stop()
+            await app.stop_components()
+
+    return {
+        "name": f"e2e-{args.mode}",
+        "meta": metadata(vars(args)),
+        "metrics": {
+            "throughput_turns_per_sec": len(e2e) / elapsed if elapsed else 0.0,
+            "turns": len(e2e),
+            "errors": sum(errors.values()),
+            "latency_ms": {"e2e": percentiles(e2e), "ttfb": percentiles(ttfb)},
+            "stages_ms": {name: percentiles(values) for name, values in sorted(stages.items())},
+            "memory_mb": {
+                "rss_start": rss_start,
+                "rss_after_ingest": rss_loaded,
+                "rss_end": rss_end,
+                "growth_during_run": rss_end - rss_loaded,
+                **({"heap": heap} if heap else {}),
+            },
+            "ingest_seconds": ingest_seconds,
+        },
+        "errors_by_type": dict(errors),
+        "agent": agent_stats,
+    }
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    metrics = results["metrics"]
+    print(f"\n== {results['name']} @ {results['meta']['commit']} ==")
+    print(f"轮次 {metrics['turns']}  错误 {metrics['errors']}  吞吐 {metrics['throughput_turns_per_sec']:.1f} 轮/秒  "
+          f"导入 {metrics['ingest_seconds']:.2f}s")
+    print(f"{'阶段':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("e2e", metrics["latency_ms"]["e2e"]), ("ttfb", metrics["latency_ms"]["ttfb"])]
+    rows += list(metrics["stages_ms"].items())
+    for name, stats in rows:
+        if stats.get("count"):
+            print(f"{name:<28}{stats['count']:>7}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+    memory = metrics["memory_mb"]
+    print(f"内存(MB): 启动 {memory['rss_start']:.1f}  导入后 {memory['rss_after_ingest']:.1f}  "
+          f"结束 {memory['rss_end']:.1f}  运行期增长 {memory['growth_during_run']:+.1f}")
+    if results["errors_by_type"]:
+        print(f"错误: {results['errors_by_type']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="智能体流水线端到端压测")
+    parser.add_argument("--mode", choices=sorted(DRIVERS), default="inproc")
+    parser.add_argument("--users", type=int, default=10, help="并发用户数")
+    parser.add_argument("--turns", type=int, default=10, help="每个用户的轮次")
+    parser.add_argument("--think", type=float, default=0.0, help="平均思考时间(秒),0表示连续发送")
+    parser.add_argument("--mix", default="faq=0.5,unique=0.4,long=0.1", help="消息组合及权重")
+    parser.add_argument("--corpus", type=int, default=1000, help="知识库文档数")
+    parser.add_argument("--vector-dim", type=int, default=128)
+    parser.add_argument("--model-latency", type=float, default=0.05, help="桩模型首包延迟(秒)")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="桩模型逐词延迟(秒)")
+    parser.add_argument("--config-dir", help="使用该目录的配置,模型与存储路径仍替换为压测设置")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tracemalloc", action="store_true", help="统计Python堆内存(有额外开销)")
+    parser.add_argument("--output", help="结果JSON路径,默认写入 tests/benchmarks/results/")
+    parser.add_argument("--compare", help="与该基准结果对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_summary(results)
+    path = write_results(results, args.output, f"{results['name']}")
+    print(f"\n结果已保存: {path}")
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold,
+                              keys=("throughput", "latency_ms", "stages_ms", "memory_mb.growth"))
+        if regressions:
+            print(f"\n{len(regressions)} 项指标退化超过 {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
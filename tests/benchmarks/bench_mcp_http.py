@@ -0,0 +1,139 @@
+"""
+MCP工具HTTP连接复用压测
+
+在本机启动一个 aiohttp 桩服务代替MCP服务,对比两种调用方式:
+    per_call  每次调用新建 ClientSession(旧实现)
+    pooled    使用 ToolManager 共享的连接池会话
+分别在串行和并发下统计单次调用延迟分布和吞吐量,以及桩服务实际建立的连接数。
+
+用法:
+    python -m tests.benchmarks.bench_mcp_http
+    python -m tests.benchmarks.bench_mcp_http --requests 2000 --concurrency 32
+    python -m tests.benchmarks.bench_mcp_http --compare tests/benchmarks/results/mcp_http-abc123.json
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+import aiohttp
+from aiohttp import web
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from tests.benchmarks.common import compare, load_results, metadata, percentiles, write_results
+from src.core.config import Config
+from src.tools.base_tool import ToolManager
+from src.tools.code_search import CodeSearchTool
+
+
+class StubServer:
+    """返回固定结果的MCP桩服务,按客户端地址记录使用过的TCP连接"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.peers: Set[Any] = set()
+        self.url = ""
+        self._runner: Any = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/search/code", self._search)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        params = await request.json()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return web.json_response({"query": params.get("query"), "results": [{"path": "src/app.py", "line": 1}]})
+
+
+async def per_call(url: str, params: Dict[str, Any]) -> Any:
+    """旧实现: 每次调用新建会话"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{url}/search/code", json=params) as response:
+            return await response.json()
+
+
+async def drive(call: Callable[[], Awaitable[Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"latency_ms": percentiles(latencies), "throughput_per_sec": requests / elapsed}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = StubServer(args.delay / 1000)
+    await server.start()
+    params = {"query": "create_session", "languages": ["python"]}
+    manager = ToolManager(Config())
+    tool = CodeSearchTool({"base_url": server.url}, manager=manager)
+    modes = {
+        "per_call": lambda: per_call(server.url, params),
+        "pooled": lambda: tool.call_mcp_api(params),
+    }
+    metrics: Dict[str, Any] = {}
+    try:
+        print(f"{'模式':<10}{'并发':>6}{'p50(ms)':>10}{'p99(ms)':>10}{'吞吐(/s)':>12}{'连接数':>8}")
+        for concurrency in (1, args.concurrency):
+            for name, call in modes.items():
+                # 预热,排除首次建立会话的开销
+                await call()
+                server.peers.clear()
+                result = await drive(call, args.requests, concurrency)
+                result["connections"] = len(server.peers)
+                metrics[f"{name}_c{concurrency}"] = result
+                latency = result["latency_ms"]
+                print(f"{name:<10}{concurrency:>6}{latency['p50']:>10.3f}{latency['p99']:>10.3f}"
+                      f"{result['throughput_per_sec']:>12.0f}{result['connections']:>8}")
+    finally:
+        await manager.cleanup()
+        await server.stop()
+    return {"name": "mcp_http", "meta": metadata(vars(args)), "metrics": metrics}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MCP工具HTTP连接复用压测")
+    parser.add_argument("--requests", type=int, default=1000, help="每种模式的请求数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发场景的并发数")
+    parser.add_argument("--delay", type=float, default=0.0, help="桩服务处理延迟(毫秒)")
+    parser.add_argument("--output", help="结果JSON路径,默认写入 tests/benchmarks/results/")
+    parser.add_argument("--compare", help="与该基准结果对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    path = write_results(results, args.output, results["name"])
+    print(f"\n结果已保存: {path}")
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项指标退化超过 {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+热点函数微基准
+
+对每个函数在递增的规模n下测量单次耗时,输出时间-规模曲线和双对数拟合斜率:
+斜率约0为常数复杂度,约1为线性,约2为平方。算法退化会表现为斜率变化,
+规模翻倍时耗时的变化比单点耗时更能说明问题。结果保存为JSON,可与基准结果对比。
+
+用法:
+    python -m tests.benchmarks.bench_micro
+    python -m tests.benchmarks.bench_micro --only triggers,bus --scale 2
+    python -m tests.benchmarks.bench_micro --compare tests/benchmarks/results/micro-abc123.json
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from tests.benchmarks.common import compare, load_results, metadata, write_results
+from src.core.config import Config
+from src.data.rag_manager import RAGManager, split_text
+from src.io.message_bus import Message, MessageBus
+from src.memory.memory_manager import MemoryManager, MemorySystem
+from src.triggers.base_trigger import KeywordTrigger, TriggerConfig
+from src.triggers.trigger_manager import TriggerManager
+
+WORDS = ["用户", "订单", "退款", "密码", "账户", "发票", "物流", "会员", "api", "token",
+         "cache", "index", "deploy", "error", "timeout", "region", "quota", "webhook"]
+
+MIN_TIME = 0.05
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 99)) for _ in range(words))
+
+
+def measure(fn: Callable[[], Any], min_time: float = MIN_TIME, repeat: int = 3) -> float:
+    """单次调用耗时(秒),取多轮中最快的一轮以减少噪声"""
+    best = float("inf")
+    for _ in range(repeat):
+        count = 0
+        started = time.perf_counter()
+        while True:
+            fn()
+            count += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / count)
+    return best
+
+
+async def ameasure(fn: Callable[[], Awaitable[Any]], min_time: float = MIN_TIME, repeat: int = 3) -> float:
+    """异步版本的 measure"""
+    best = float("inf")
+    for _ in range(repeat):
+        count = 0
+        started = time.perf_counter()
+        while True:
+            await fn()
+            count += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / count)
+    return best
+
+
+def slope(points: Sequence[Dict[str, float]]) -> float:
+    """双对数坐标下 耗时~规模 的拟合斜率"""
+    if len(points) < 2:
+        return 0.0
+    x = np.log([p["n"] for p in points])
+    y = np.log([max(p["seconds"], 1e-12) for p in points])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+# 各基准: 给定规模n,返回一次操作的耗时(秒)
+
+async def bench_similarity(n: int, rng: random.Random) -> float:
+    """MemorySystem._calculate_similarity, n为每段文本的词数"""
+    memory = MemorySystem.__new__(MemorySystem)
+    a, b = random_text(rng, n), random_text(rng, n)
+    return measure(lambda: memory._calculate_similarity(a, b))
+
+
+async def bench_store_context(n: int, rng: random.Random) -> float:
+    """MemorySystem._store_context, n为上下文图中已有的消息数"""
+    import networkx as nx
+    memory = MemorySystem.__new__(MemorySystem)
+    memory.context_graph = nx.Graph()
+    for _ in range(n):
+        message = Message(content=random_text(rng, 10))
+        message.data["content"] = message.content
+        MemorySystem._store_context(memory, message)
+    message = Message(content=random_text(rng, 10))
+    message.data["content"] = message.content
+
+    def insert() -> None:
+        MemorySystem._store_context(memory, message)
+        memory.context_graph.remove_node(message.id)
+
+    return measure(insert)
+
+
+async def bench_split_text(n: int, rng: random.Random) -> float:
+    """split_text / RAGManager._split_text, n为文本字符数"""
+    sentences = []
+    length = 0
+    while length < n:
+        sentence = random_text(rng, rng.randint(5, 30)) + "。"
+        sentences.append(sentence)
+        length += len(sentence)
+    text = "".join(sentences)[:n]
+    return measure(lambda: split_text(text, 500, 50))
+
+
+async def bench_get_knowledge(n: int, rng: random.Random) -> float:
+    """RAGManager.get_knowledge(不命中缓存), n为知识库文档数"""
+    with tempfile.TemporaryDirectory() as workdir:
+        config = Config()
+        config.rag_index_path = workdir
+        config.embedding_backend = "hash"
+        config.vector_dim = 128
+        rag = RAGManager(config)
+        await rag.init()
+        texts = [random_text(rng, 30) for _ in range(n)]
+        for i in range(0, n, 1000):
+            batch = texts[i:i + 1000]
+            rag.add_chunks(batch, await rag.embed(batch), [{"source": "bench"}] * len(batch))
+        queries = iter(range(10 ** 9))
+        # 每次使用不同的查询,测量检索本身而不是缓存
+        elapsed = await ameasure(lambda: rag.get_knowledge(f"{random_text(rng, 4)} {next(queries)}"))
+        await rag.cleanup()
+        return elapsed
+
+
+async def bench_bus(n: int, rng: random.Random) -> float:
+    """MessageBus 发布到分发完成, n为一批发布的消息数"""
+    bus = MessageBus()
+    await bus.start()
+    received = 0
+    done = asyncio.Event()
+
+    async def handler(message: Dict[str, Any]) -> None:
+        nonlocal received
+        received += 1
+        if received >= n:
+            done.set()
+
+    await bus.subscribe("bench", handler)
+
+    async def batch() -> None:
+        nonlocal received
+        received = 0
+        done.clear()
+        for i in range(n):
+            await bus.publish("bench", {"content": str(i), "user_id": "bench"})
+        await done.wait()
+
+    elapsed = await ameasure(batch, repeat=2)
+    await bus.stop()
+    return elapsed
+
+
+async def bench_triggers(n: int, rng: random.Random) -> float:
+    """TriggerManager.check(没有触发器命中), n为关键词触发器数"""
+    manager = TriggerManager()
+    for i in range(n):
+        config = TriggerConfig(name=f"kw{i}", description="bench", priority=i % 10)
+        manager.register_trigger(KeywordTrigger(config, [f"关键词{i}-{j}" for j in range(5)]))
+    text = random_text(rng, 50)
+    return await ameasure(lambda: manager.check(text))
+
+
+async def bench_memory_insert(n: int, rng: random.Random) -> float:
+    """MemoryManager.add_interaction, n为表中已有的记录数"""
+    with tempfile.TemporaryDirectory() as workdir:
+        manager = await _filled_memory(workdir, n, rng)
+        elapsed = await ameasure(lambda: manager.add_interaction(random_text(rng, 10), random_text(rng, 20)))
+        await manager.cleanup()
+        return elapsed
+
+
+async def bench_memory_query(n: int, rng: random.Random) -> float:
+    """MemoryManager.get_context, n为表中已有的记忆数"""
+    with tempfile.TemporaryDirectory() as workdir:
+        manager = await _filled_memory(workdir, n, rng)
+        elapsed = await ameasure(lambda: manager.get_context(random_text(rng, 4)))
+        await manager.cleanup()
+        return elapsed
+
+
+async def _filled_memory(workdir: str, n: int, rng: random.Random) -> MemoryManager:
+    config = Config()
+    config.memory_path = os.path.join(workdir, "memory.db")
+    manager = MemoryManager(config)
+    await manager.init()
+    now = time.time()
+    # 直接批量写入,避免准备数据的时间随n变长
+    await manager._conn.executemany(
+        "INSERT INTO memories (id, type, content, timestamp, metadata) VALUES (?, ?, ?, ?, ?)",
+        [(f"bench_{i}", "bench", random_text(rng, 20), now - i, None) for i in range(n)]
+    )
+    await manager._conn.executemany(
+        "INSERT INTO interactions (input, response, timestamp, context) VALUES (?, ?, ?, ?)",
+        [(random_text(rng, 10), random_text(rng, 20), now - i, None) for i in range(n)]
+    )
+    await manager._conn.commit()
+    return manager
+
+
+BENCHMARKS: Dict[str, Any] = {
+    "similarity": (bench_similarity, [10, 40, 160, 640]),
+    "store_context": (bench_store_context, [50, 100, 200, 400]),
+    "split_text": (bench_split_text, [10_000, 40_000, 160_000, 640_000]),
+    "get_knowledge": (bench_get_knowledge, [1_000, 4_000, 16_000, 64_000]),
+    "bus": (bench_bus, [100, 400, 1_600]),
+    "triggers": (bench_triggers, [10, 100, 1_000, 4_000]),
+    "memory_insert": (bench_memory_insert, [1_000, 10_000, 100_000]),
+    "memory_query": (bench_memory_query, [1_000, 10_000, 100_000]),
+}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    metrics: Dict[str, Any] = {}
+    for name in names:
+        func, sizes = BENCHMARKS[name]
+        points: List[Dict[str, float]] = []
+        print(f"\n{name}: {func.__doc__}")
+        print(f"{'n':>10}{'耗时(ms)':>14}{'每单位(us)':>14}")
+        for size in sizes:
+            n = max(1, int(size * args.scale))
+            seconds = await func(n, random.Random(args.seed))
+            points.append({"n": n, "seconds": seconds})
+            print(f"{n:>10}{seconds * 1e3:>14.4f}{seconds / n * 1e6:>14.4f}")
+        fitted = slope(points)
+        print(f"{'斜率':>10}{fitted:>14.2f}")
+        metrics[name] = {
+            "slope": fitted,
+            "seconds": {str(p["n"]): p["seconds"] for p in points},
+        }
+    return {"name": "micro", "meta": metadata(vars(args)), "metrics": metrics}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--only", help=f"只运行这些基准(逗号分隔): {','.join(BENCHMARKS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="所有规模乘以该系数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果JSON路径,默认写入 tests/benchmarks/results/")
+    parser.add_argument("--compare", help="与该基准结果对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    path = write_results(results, args.output, results["name"])
+    print(f"\n结果已保存: {path}")
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项指标退化超过 {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
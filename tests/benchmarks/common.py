@@ -0,0 +1,138 @@
+"""
+压测公共工具: 分位数统计、内存占用、结果保存与回归对比
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULTS_DIR = os.path.join(ROOT_DIR, "tests", "benchmarks", "results")
+
+# 压测产生大量日志,写入临时目录而不是仓库中的 logs/;须在导入 src 之前设置
+os.environ.setdefault("SYNAPSE_LOG_DIR", os.path.join(tempfile.gettempdir(), "synapse-bench-logs"))
+
+# 指标名包含这些词时越大越好,其余指标(延迟、内存)越小越好
+HIGHER_IS_BETTER = ("throughput", "per_sec")
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """计算延迟分布(单位与输入相同)"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def pick(q: float) -> float:
+        return ordered[min(n - 1, int(q * n))]
+
+    return {
+        "count": n,
+        "mean": sum(ordered) / n,
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存(MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS单位为字节,Linux为KB
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def metadata(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+    }
+
+
+def write_results(results: Dict[str, Any], path: Optional[str], name: str) -> str:
+    """保存结果,未指定路径时写入 tests/benchmarks/results/<name>-<commit>.json"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{results['meta']['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """把嵌套结果展开为 a.b.c -> 数值"""
+    flat: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix[:-1]] = float(data)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1,
+            keys: Optional[Iterable[str]] = None) -> List[str]:
+    """对比两次结果的 metrics 部分,打印变化并返回退化超过阈值的指标
+
+    Args:
+        current: 本次结果
+        baseline: 基准结果
+        threshold: 相对变化超过该比例视为退化
+        keys: 只对比这些指标(前缀匹配),默认全部
+
+    Returns:
+        List[str]: 退化的指标名
+    """
+    now = flatten(current.get("metrics", {}))
+    base = flatten(baseline.get("metrics", {}))
+    prefixes = tuple(keys) if keys else None
+    regressions = []
+    print(f"\n对比基准 {baseline.get('meta', {}).get('commit')} -> {current.get('meta', {}).get('commit')}")
+    print(f"{'指标':<48}{'基准':>14}{'本次':>14}{'变化':>10}")
+    for key in sorted(now.keys() & base.keys()):
+        if prefixes and not key.startswith(prefixes):
+            continue
+        if key.endswith(".count"):
+            continue
+        old, new = base[key], now[key]
+        if old == 0:
+            continue
+        change = (new - old) / abs(old)
+        worse = -change if any(word in key for word in HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > threshold:
+            flag = "  退化"
+            regressions.append(key)
+        elif worse < -threshold:
+            flag = "  改善"
+        print(f"{key:<48}{old:>14.3f}{new:>14.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
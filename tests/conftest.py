@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置: 从仓库根目录导入 src,日志写入临时目录"""
+
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# 须在导入 src 之前设置
+os.environ.setdefault("SYNAPSE_LOG_DIR", os.path.join(tempfile.gettempdir(), "synapse-test-logs"))
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""自适应并发限制器: AIMD调整、按优先级排队和挤出"""
+
+import asyncio
+
+import pytest
+
+from src.core.admission import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, AdaptiveLimiter, Overloaded
+
+
+class UpstreamError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+async def queue(limiter, priority, order, name):
+    """排队获取名额,获得后记录名称"""
+    await limiter.acquire(priority)
+    order.append(name)
+
+
+@pytest.mark.asyncio
+async def test_waiters_served_by_priority_then_arrival():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5)
+    await limiter.acquire()
+    order = []
+    tasks = []
+    for name, priority in [("b1", PRIORITY_BACKGROUND), ("i1", PRIORITY_INTERACTIVE),
+                           ("b2", PRIORITY_BACKGROUND), ("i2", PRIORITY_INTERACTIVE)]:
+        tasks.append(asyncio.create_task(queue(limiter, priority, order, name)))
+        await asyncio.sleep(0)
+    assert limiter.stats()["queued"] == 4
+
+    for _ in range(4):
+        limiter.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert order == ["i1", "i2", "b1", "b2"]
+    assert limiter.inflight == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_evicts_lowest_priority_latest_arrival():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5, max_queue=2)
+    await limiter.acquire()
+    order = []
+    first = asyncio.create_task(queue(limiter, PRIORITY_BACKGROUND, order, "b1"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(queue(limiter, PRIORITY_BACKGROUND, order, "b2"))
+    await asyncio.sleep(0)
+
+    # 同等优先级的新请求不能挤出排队中的请求
+    with pytest.raises(Overloaded):
+        await limiter.acquire(PRIORITY_BACKGROUND)
+
+    # 更高优先级的请求挤出最晚到达的低优先级请求
+    third = asyncio.create_task(queue(limiter, PRIORITY_INTERACTIVE, order, "i1"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded):
+        await second
+    assert limiter.stats()["shed"] == 2
+
+    limiter.release()
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(first, third)
+    assert order == ["i1", "b1"]
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_and_no_queue_reject():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=0.01)
+    await limiter.acquire()
+    with pytest.raises(Overloaded) as info:
+        await limiter.acquire()
+    assert info.value.retry_after >= 1
+    assert limiter.stats()["queued"] == 0
+
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=0)
+    await limiter.acquire()
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    assert limiter.inflight == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.stats()["queued"] == 0
+    assert limiter.inflight == 1
+
+    # 名额已分配给等待者,但等待者在恢复执行前被取消: 要么取消生效并归还名额,要么得到名额
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    limiter.release()
+    waiter.cancel()
+    try:
+        await waiter
+        held = 1
+    except asyncio.CancelledError:
+        held = 0
+    assert limiter.inflight == held
+
+
+@pytest.mark.asyncio
+async def test_additive_increase_only_when_limit_is_used():
+    limiter = AdaptiveLimiter(initial_limit=4, target_latency=1.0)
+    async with limiter.admit() as admission:
+        admission.observe(0.1)
+    assert limiter.limit == 4
+
+    for _ in range(2):
+        await limiter.acquire()
+    async with limiter.admit() as admission:
+        admission.observe(0.1)
+    assert limiter.limit == pytest.approx(4.25)
+
+
+@pytest.mark.asyncio
+async def test_multiplicative_decrease_once_per_window():
+    limiter = AdaptiveLimiter(initial_limit=10, target_latency=60, backoff=0.5)
+    for _ in range(3):
+        async with limiter.admit() as admission:
+            admission.observe(120)
+    assert limiter.limit == 5
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_latency_applied_at_observe_not_release():
+    limiter = AdaptiveLimiter(initial_limit=10, target_latency=60, backoff=0.5)
+    async with limiter.admit() as admission:
+        admission.observe(120)
+        assert limiter.limit == 5
+        # 只取第一个样本
+        admission.observe(0.1)
+        admission.observe(120)
+    assert limiter.limit == 5
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error, overload", [
+    (UpstreamError(429), True),
+    (UpstreamError(503), True),
+    (asyncio.TimeoutError(), True),
+    (UpstreamError(500), False),
+    (ValueError("bad"), False),
+])
+async def test_only_overload_signals_decrease(error, overload):
+    limiter = AdaptiveLimiter(initial_limit=10, backoff=0.5)
+    with pytest.raises(type(error)):
+        async with limiter.admit():
+            raise error
+    assert limiter.limit == (5 if overload else 10)
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter(initial_limit=2, min_limit=2, max_limit=2, target_latency=0)
+    async with limiter.admit() as admission:
+        admission.overloaded = True
+    assert limiter.limit == 2
+    limiter.target_latency = 10
+    for _ in range(5):
+        await limiter.acquire()
+        limiter.release(0.1)
+    assert limiter.limit == 2
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""熔断器: 连续失败熔断、半开状态的单次试探"""
+
+import pytest
+
+from src.core import breaker as breaker_module
+from src.core.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_time=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.trips == 1
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=10)
+    trip(breaker)
+    clock[0] += 9.9
+    assert not breaker.allow()
+
+    clock[0] += 0.1
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # 试探进行中,其他调用仍被拒绝
+    assert not breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=10)
+    trip(breaker)
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+    assert not breaker.allow()
+
+    # 重新计时
+    clock[0] += 9
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_released_probe_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=10)
+    trip(breaker)
+    clock[0] += 10
+    assert breaker.allow()
+    # 试探调用被取消,既未成功也未失败
+    breaker.release_probe()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_zero_threshold_never_opens(clock):
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(100):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
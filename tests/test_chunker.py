@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""文本分块: 长度上限、覆盖全部内容和推进保证"""
+
+import pytest
+
+from src.data.chunker import TextChunker, count_tokens
+
+
+def locate(text, chunks):
+    """按顺序定位每个文本块,返回 (起点, 终点) 列表"""
+    spans = []
+    start = 0
+    for chunk in chunks:
+        position = text.find(chunk, start)
+        assert position >= 0, chunk
+        spans.append((position, position + len(chunk)))
+        start = position + 1
+    return spans
+
+
+def assert_progress(text, chunker, chunks):
+    """每个文本块都不超长,且包含前一个文本块之后的新内容,合起来覆盖全文"""
+    assert chunks or not text.strip()
+    for chunk in chunks:
+        assert chunker.token_counter(chunk) <= chunker.chunk_size or len(chunk) == 1
+    spans = locate(text, chunks)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert next_end > end
+        assert not text[end:next_start].strip()
+    if spans:
+        assert not text[:spans[0][0]].strip()
+        assert not text[spans[-1][1]:].strip()
+
+
+# 文本内容不重复,便于按顺序定位文本块
+TEXTS = [
+    "".join(f"第{i}句。第{i}问？" for i in range(40)),
+    " ".join(f"Sentence {i}. Question {i}?" for i in range(60)),
+    "".join(chr(0x4e00 + i) for i in range(500)),  # 没有句子边界的长句
+    "".join(f"w{i:03d}" for i in range(200)) + ". end.",  # 超长的单词
+    "".join(f"混合 mixed{i} 文本, with 标点; and 换行\n\n新段落{i}。" for i in range(15)),
+    " ".join(f"a{i}." for i in range(200)),
+]
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(1, 0), (5, 4), (16, 8), (64, 100)])
+def test_progress_with_default_counter(text, chunk_size, chunk_overlap):
+    chunker = TextChunker(chunk_size, chunk_overlap)
+    assert_progress(text, chunker, chunker.split(text))
+
+
+def strip_space(text):
+    return "".join(text.split())
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("counter", [
+    len,
+    lambda s: 2 * len(s),  # 单个字符也超过chunk_size=1
+    lambda s: len(s.encode("utf-8")),
+    lambda s: count_tokens(s) * 3,
+])
+def test_progress_with_custom_counter(text, counter):
+    chunker = TextChunker(4, 0, token_counter=counter)
+    chunks = chunker.split(text)
+    for chunk in chunks:
+        assert counter(chunk) <= 4 or len(chunk) == 1
+    # 没有重叠时文本块依次拼接即为原文(不计空白)
+    assert "".join(strip_space(chunk) for chunk in chunks) == strip_space(text)
+
+    chunker = TextChunker(4, 2, token_counter=counter)
+    assert len(chunker.split(text)) >= len(chunks)
+
+
+def test_overlap_repeats_whole_sentences():
+    chunker = TextChunker(6, 3)
+    chunks = chunker.split("一二。三四。五六。七八。")
+    assert chunks == ["一二。三四。", "三四。五六。", "五六。七八。"]
+
+
+def test_empty_and_whitespace():
+    chunker = TextChunker(8)
+    assert chunker.split("") == []
+    assert chunker.split(" \n\n ") == []
+
+
+def test_invalid_chunk_size():
+    with pytest.raises(ValueError):
+        TextChunker(0)
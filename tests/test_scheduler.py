@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""cron表达式解析和定时任务的到期时间计算"""
+
+from datetime import datetime
+
+import pytest
+
+from src.triggers import scheduler as scheduler_module
+from src.triggers.base_trigger import ScheduleTrigger, TriggerConfig
+from src.triggers.scheduler import CronExpression, TriggerScheduler
+
+
+def test_parse_fields():
+    cron = CronExpression("*/15 9-17 1,15 jan-mar mon-fri")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == set(range(9, 18))
+    assert cron.days == {1, 15}
+    assert cron.months == {1, 2, 3}
+    assert cron.weekdays == {1, 2, 3, 4, 5}
+
+
+def test_parse_aliases_and_sunday():
+    assert CronExpression("@hourly").minutes == {0}
+    assert CronExpression("@daily").hours == {0}
+    assert CronExpression("0 0 * * 7").weekdays == {0}
+    assert CronExpression("0 0 * * 5/1").weekdays == {5, 6, 0}
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "*/0 * * * *",
+    "5-1 * * * *",
+    "x * * * *",
+])
+def test_parse_rejects_invalid(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+@pytest.mark.parametrize("expression, moment, expected", [
+    # 严格晚于给定时间
+    ("30 9 * * *", datetime(2026, 3, 2, 9, 30), datetime(2026, 3, 3, 9, 30)),
+    ("30 9 * * *", datetime(2026, 3, 2, 9, 29, 59), datetime(2026, 3, 2, 9, 30)),
+    # 跨月和跨年
+    ("0 0 1 * *", datetime(2026, 12, 15, 12, 0), datetime(2027, 1, 1, 0, 0)),
+    # 2026-03-06 是周五,下一个工作日是周一
+    ("0 9 * * 1-5", datetime(2026, 3, 6, 10, 0), datetime(2026, 3, 9, 9, 0)),
+    # 日和星期都有限制时满足其一即可: 13号或周五
+    ("0 0 13 * 5", datetime(2026, 3, 1, 0, 0), datetime(2026, 3, 6, 0, 0)),
+    ("0 0 13 * 5", datetime(2026, 3, 10, 0, 0), datetime(2026, 3, 13, 0, 0)),
+    # 只有闰年才有的日期
+    ("0 0 29 2 *", datetime(2026, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)),
+])
+def test_next_after(expression, moment, expected):
+    assert CronExpression(expression).next_after(moment) == expected
+
+
+def test_next_after_without_match():
+    with pytest.raises(ValueError):
+        CronExpression("0 0 31 2 *").next_after(datetime(2026, 1, 1))
+
+
+class FakeClock:
+    """同时替换墙上时钟和单调时钟"""
+
+    def __init__(self, wall: float, monotonic: float = 1000.0):
+        self.wall = wall
+        self.monotonic = monotonic
+
+    def advance(self, seconds: float, drift: float = 0.0) -> None:
+        """单调时钟前进seconds,墙上时钟前进seconds+drift"""
+        self.monotonic += seconds
+        self.wall += seconds + drift
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(datetime(2026, 3, 2, 8, 59, 30).timestamp())
+    monkeypatch.setattr(scheduler_module.time, "time", lambda: clock.wall)
+    monkeypatch.setattr(TriggerScheduler, "_now", staticmethod(lambda: clock.monotonic))
+    return clock
+
+
+def add_job(scheduler, name, **kwargs):
+    scheduler.add(ScheduleTrigger(TriggerConfig(name=name, description=""), **kwargs), **kwargs)
+    return scheduler._jobs[name]
+
+
+def test_cron_due_does_not_fire_twice_when_wall_clock_lags(clock):
+    scheduler = TriggerScheduler()
+    job = add_job(scheduler, "job", cron="* * * * *")
+    assert job.due == pytest.approx(clock.monotonic + 30)
+    fired = job.target
+    assert fired == datetime(2026, 3, 2, 9, 0).timestamp()
+
+    # 单调时钟到期时墙上时钟还差10毫秒才到9:00
+    clock.advance(30, drift=-0.01)
+    due = scheduler._next_due(job, job.due, clock.monotonic)
+    assert job.target == fired + 60
+    assert due == pytest.approx(clock.monotonic + 60.01)
+
+
+def test_cron_due_after_wall_clock_passed_target(clock):
+    scheduler = TriggerScheduler()
+    job = add_job(scheduler, "job", cron="*/5 * * * *")
+
+    # 调度延迟了6分钟,从当前时间推算,不补触发错过的时间
+    clock.advance(30 + 360)
+    due = scheduler._next_due(job, job.due, clock.monotonic)
+    assert job.target == datetime(2026, 3, 2, 9, 10).timestamp()
+    assert due == pytest.approx(clock.monotonic + 240)
+
+
+def test_interval_due_skips_missed_runs(clock):
+    scheduler = TriggerScheduler()
+    job = add_job(scheduler, "job", interval=10)
+    first = job.due
+    assert scheduler._next_due(job, first, first + 0.5) == first + 10
+    # 落后超过一个周期时跳过错过的次数,仍对齐到原来的节拍
+    assert scheduler._next_due(job, first, first + 35) == first + 40
+
+
+def test_add_rejects_invalid_schedule():
+    scheduler = TriggerScheduler()
+    trigger = ScheduleTrigger(TriggerConfig(name="job", description=""), interval=10)
+    with pytest.raises(ValueError):
+        scheduler.add(trigger, interval=0)
+    with pytest.raises(ValueError):
+        scheduler.add(trigger, interval=10, cron="* * * * *")
+    assert len(scheduler) == 0
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""触发器定义加载: 无效定义的拒绝和加载失败后的恢复"""
+
+import asyncio
+import os
+
+import pytest
+
+from src.triggers.loader import TriggerLoader, build_trigger
+from src.triggers.trigger_manager import TriggerManager
+
+VALID = """
+triggers:
+  greeting:
+    type: keyword
+    keywords: [hello]
+  report:
+    type: schedule
+    cron: "0 9 * * 1-5"
+"""
+
+INVALID_CRON = """
+triggers:
+  greeting:
+    type: keyword
+    keywords: [hi]
+  report:
+    type: schedule
+    cron: "0 25 * * *"
+"""
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # 保证修改时间变化,监视任务能发现修改
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.mark.parametrize("spec", [
+    {"type": "schedule", "interval": 0},
+    {"type": "schedule", "interval": -5},
+    {"type": "schedule", "cron": "0 9 * *"},
+    {"type": "schedule", "cron": "61 * * * *"},
+    {"type": "schedule", "cron": "*/0 * * * *"},
+    {"type": "regex", "pattern": "("},
+])
+def test_build_trigger_rejects_invalid_definitions(spec):
+    with pytest.raises(ValueError):
+        build_trigger("bad", spec)
+
+
+@pytest.mark.asyncio
+async def test_invalid_reload_keeps_current_triggers(tmp_path):
+    path = str(tmp_path / "triggers.yaml")
+    write(path, VALID)
+    manager = TriggerManager()
+    loader = TriggerLoader(manager, path, interval=0)
+    try:
+        assert await loader.load()
+        greeting = manager.triggers["greeting"]
+
+        write(path, INVALID_CRON)
+        assert not await loader.load()
+        assert loader.last_error
+        assert manager.triggers["greeting"] is greeting
+        assert manager.scheduler.next_run("report") is not None
+
+        write(path, VALID)
+        assert await loader.load()
+        assert loader.last_error is None
+        assert loader.reloads == 2
+    finally:
+        await manager.scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_watch_survives_apply_failure(tmp_path, monkeypatch):
+    path = str(tmp_path / "triggers.yaml")
+    write(path, VALID)
+    manager = TriggerManager()
+    loader = TriggerLoader(manager, path, interval=0.02)
+    assert await loader.load()
+
+    def broken(prepared):
+        raise RuntimeError("apply failed")
+
+    apply = manager.apply_definitions
+    monkeypatch.setattr(manager, "apply_definitions", broken)
+    await loader.start()
+    try:
+        write(path, INVALID_CRON.replace("0 25 * * *", "0 10 * * *"))
+        for _ in range(100):
+            if loader.last_error:
+                break
+            await asyncio.sleep(0.02)
+        assert loader.last_error == "apply failed"
+        assert not loader._task.done()
+
+        # 恢复后再次修改文件,监视任务继续重新加载
+        monkeypatch.setattr(manager, "apply_definitions", apply)
+        write(path, VALID)
+        for _ in range(100):
+            if loader.reloads == 2:
+                break
+            await asyncio.sleep(0.02)
+        assert loader.reloads == 2
+        assert loader.last_error is None
+    finally:
+        await loader.stop()
+        await manager.scheduler.stop()
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 import uvicorn
 import os
 import yaml
@@ -243,6 +243,64 @@ async def handle_chat(request: Request):
                 "details": str(e)
             }
         )
+
+@app.post("/api/agent/stream")
+async def handle_chat_stream(request: Request):
+    """流式转发聊天消息,逐块透传主程序的Server-Sent Events,不做缓冲"""
+    data = await request.json()
+    user_id = data.get('user_id', '')
+    if not data.get('message'):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Message is required", "user_id": user_id}
+        )
+        
+    agent_url = get_agent_url()
+    if not agent_url:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Agent service URL not configured", "user_id": user_id}
+        )
+    stream_url = agent_url.rstrip('/') + '/stream'
+    headers = {'Content-Type': 'application/json'}
+    if request.headers.get('X-API-Key'):
+        headers['X-API-Key'] = request.headers['X-API-Key']
+        
+    # 流式响应没有总超时,只限制连接建立和两次数据之间的间隔
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=30))
+    try:
+        response = await session.post(stream_url, json=data, headers=headers)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        await session.close()
+        logging.error(f"Could not connect to agent service: {e}")
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Could not connect to agent service", "user_id": user_id}
+        )
+        
+    if response.status != 200:
+        details = await response.text()
+        response.release()
+        await session.close()
+        logging.error(f"Agent service returned {response.status}: {details}")
+        return JSONResponse(
+            status_code=response.status,
+            content={"status": "error", "message": "Agent service error", "user_id": user_id, "details": details}
+        )
+        
+    async def relay():
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+        finally:
+            response.release()
+            await session.close()
+            
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=get_port())
\ No newline at end of file